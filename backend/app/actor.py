@@ -0,0 +1,60 @@
+"""
+Per-room actor.
+
+Everything that touches a room's GameState (client commands, timer expiry)
+is queued on the room's actor and run by a single consumer task, one
+command at a time, so nothing interleaves with a half-applied command.
+Commands are plain synchronous callables returning whether the table state
+changed; after draining whatever is queued the actor flushes once, so a
+burst (e.g. three players passing on a discard) costs one broadcast.
+"""
+from __future__ import annotations
+
+import asyncio
+import traceback
+from collections import deque
+from typing import Callable, Deque, Optional
+
+Command = Callable[[], bool]
+
+
+class RoomActor:
+    def __init__(self, room_id: str, flush: Callable[[], None]) -> None:
+        self.room_id = room_id
+        self.flush = flush
+        self.processed = 0
+        self.batches = 0
+        self._queue: Deque[Command] = deque()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._queue)
+
+    def submit(self, command: Command) -> None:
+        self._queue.append(command)
+        if self._task is None or self._task.done():
+            # the consumer starts on the next loop iteration, so commands
+            # submitted in the meantime land in the same batch
+            self._task = asyncio.ensure_future(self._run())
+
+    def run_batch(self) -> None:
+        """Apply every queued command, then flush once if any of them changed state."""
+        dirty = False
+        while self._queue:
+            command = self._queue.popleft()
+            self.processed += 1
+            try:
+                dirty = bool(command()) or dirty
+            except Exception:
+                traceback.print_exc()
+                dirty = True
+        if dirty:
+            self.batches += 1
+            self.flush()
+
+    async def _run(self) -> None:
+        # the task exits when the queue is empty; submit() starts a new one
+        while self._queue:
+            self.run_batch()
+            await asyncio.sleep(0)
@@ -0,0 +1,102 @@
+"""
+Bot policies.
+
+A policy only reads GameState and answers three questions for a seat (a
+WebSocket, or a plain seat id in the simulator): what to discard, whether
+to declare Ting first, and which offered reaction to take.  Applying the
+answer is up to the caller, so the same policies drive the headless
+simulator and server-side bot seats.
+"""
+from __future__ import annotations
+
+import random
+from typing import Any, Dict, List, Optional
+
+from . import shanten
+from .tiles import TILE_GROUP, TILE_WEIGHT, WIND_START, rank_of
+
+
+class Policy:
+    name = "base"
+
+    def __init__(self, rng: Optional[random.Random] = None) -> None:
+        self.rng = rng or random.Random()
+
+    def declare_ting(self, game: Any, seat: Any, options: Dict[int, List[int]]) -> Optional[int]:
+        """Given ting_discards() (non-empty), return the discard to declare Ting with, or None."""
+        return max(options, key=lambda t: (len(options[t]), -t))
+
+    def discard(self, game: Any, seat: Any) -> int:
+        raise NotImplementedError
+
+    def react(self, game: Any, seat: Any, actions: List[dict]) -> dict:
+        """Pick one of ``actions`` (compute_actions_for); wins are always taken."""
+        for a in actions:
+            if a['type'] in ('self-win', 'win'):
+                return a
+        return self.choose_claim(game, seat, actions)
+
+    def choose_claim(self, game: Any, seat: Any, actions: List[dict]) -> dict:
+        return next((a for a in actions if a['type'] == 'pass'), actions[0])
+
+
+class RandomPolicy(Policy):
+    """Uniformly random discards and claims; cheap, for load and fuzzing."""
+
+    name = "random"
+
+    def discard(self, game: Any, seat: Any) -> int:
+        return self.rng.choice(list(game.hands[seat]))
+
+    def choose_claim(self, game: Any, seat: Any, actions: List[dict]) -> dict:
+        return self.rng.choice(actions)
+
+
+def _tile_value(tile: int) -> int:
+    """Tie-break between equal-shanten discards: keep middle tiles, drop honors and terminals first."""
+    if tile >= WIND_START:
+        return 0
+    r = rank_of(tile)
+    return 1 if r in (1, 9) else 2 if r in (2, 8) else 3
+
+
+class ShantenPolicy(Policy):
+    """Greedy: discard to the lowest shanten, claim only when it lowers shanten."""
+
+    name = "shanten"
+
+    def discard(self, game: Any, seat: Any) -> int:
+        hand = game.hands[seat]
+        options = shanten.discard_shanten(hand, game.exposed_melds.get(seat, []))
+        if not options:
+            return hand[-1]
+        return min(options, key=lambda t: (options[t], _tile_value(t), self.rng.random()))
+
+    def choose_claim(self, game: Any, seat: Any, actions: List[dict]) -> dict:
+        hand = game.hands[seat]
+        fixed = len(game.exposed_melds.get(seat, []))
+        before = shanten.standard_shanten(hand.keys, fixed)
+        best = next((a for a in actions if a['type'] == 'pass'), actions[0])
+        best_value = before
+        for a in actions:
+            if a['type'] not in ('pong', 'chi', 'kong'):
+                continue
+            keys = list(hand.keys)
+            for t in a['tiles']:
+                keys[TILE_GROUP[t]] -= TILE_WEIGHT[t]
+            # shanten of the remaining 3n+2 (pong/chi) hand already assumes its best
+            # discard; for a kong the replacement draw is unknown
+            after = shanten.standard_shanten(keys, fixed + 1)
+            if after < best_value:
+                best, best_value = a, after
+        return best
+
+
+POLICIES = {cls.name: cls for cls in (RandomPolicy, ShantenPolicy)}
+
+
+def make_policy(name: str, rng: Optional[random.Random] = None) -> Policy:
+    try:
+        return POLICIES[name](rng)
+    except KeyError:
+        raise ValueError(f"unknown policy {name!r}; choose from {', '.join(POLICIES)}") from None
@@ -0,0 +1,232 @@
+"""
+Server-side bot seats.
+
+A bot seat is a Vacant (see ws.py) with ``bot`` set to a policy name from
+bots.py: either an empty seat filled at ``start`` (``fillBots``), or a
+disconnected player's seat taken over after MAHJONG_BOT_TAKEOVER seconds.
+A taken-over seat keeps its player id, so the player gets it back by
+resuming or rejoining like any other held seat.
+
+After every state change of a room (RoomManager.broadcast_state) the driver
+looks for a bot that has to act: discard on its turn, answer an offered
+reaction, roll the dice.  Policy decisions run in an executor on copies of
+the seat's hand and melds, never on the event loop, and each one gets
+MAHJONG_BOT_BUDGET seconds; past that the bot falls back to the cheapest
+legal move (discard the drawn tile, pass).  The decision is then applied as
+a command on the room's actor, re-checked against the state at that point.
+
+Configuration (environment):
+
+    MAHJONG_BOT_POLICY     policy for bot seats (default shanten)
+    MAHJONG_BOT_BUDGET     seconds per decision (default 0.5)
+    MAHJONG_BOT_EXECUTOR   thread | process (default thread)
+    MAHJONG_BOT_WORKERS    executor size (default 2)
+    MAHJONG_BOT_TAKEOVER   seconds before a bot plays a disconnected seat (default 20, <0: never)
+"""
+from __future__ import annotations
+
+import asyncio
+import copy
+import os
+import random
+import secrets
+import time
+import traceback
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Set, Tuple
+
+from . import metrics, shanten
+from .bots import make_policy
+from .tiles import Hand
+from .ws import GameState, RoomManager, Vacant, hand_waits
+
+BOT_POLICY = os.environ.get("MAHJONG_BOT_POLICY", "shanten")
+BOT_BUDGET = float(os.environ.get("MAHJONG_BOT_BUDGET", "0.5"))
+BOT_EXECUTOR = os.environ.get("MAHJONG_BOT_EXECUTOR", "thread")
+BOT_WORKERS = int(os.environ.get("MAHJONG_BOT_WORKERS", "2"))
+BOT_TAKEOVER = float(os.environ.get("MAHJONG_BOT_TAKEOVER", "20"))
+
+DECISIONS = metrics.Counter("mahjong_bot_decisions_total", "Bot policy decisions, by outcome", ["result"])
+
+
+class _SeatView:
+    """The part of GameState a policy reads, for one seat (key 0) and detached from the live table."""
+
+    def __init__(self, hand: Hand, melds: List[dict]) -> None:
+        self.hands = {0: hand}
+        self.exposed_melds = {0: melds}
+
+
+def decide_turn(policy: str, seed: int, hand: Hand, melds: List[dict]) -> Tuple[int, bool]:
+    """(tile to discard, declare Ting first) for a drawn hand; runs in the executor."""
+    bot = make_policy(policy, random.Random(seed))
+    view = _SeatView(hand, melds)
+    # trying every discard is only worth it once some discard can reach tenpai
+    if shanten.shanten(hand, melds) <= 0:
+        options = {}
+        for t in dict.fromkeys(hand):
+            waits = hand_waits(hand, melds, discard=t)
+            if waits:
+                options[t] = waits
+        if options:
+            tile = bot.declare_ting(view, 0, options)
+            if tile is not None:
+                return tile, True
+    return bot.discard(view, 0), False
+
+
+def decide_claim(policy: str, seed: int, hand: Hand, melds: List[dict], actions: List[dict]) -> str:
+    """Id of the reaction to take out of ``actions``; runs in the executor."""
+    return make_policy(policy, random.Random(seed)).react(_SeatView(hand, melds), 0, actions)["id"]
+
+
+def is_bot(seat: Any) -> bool:
+    return isinstance(seat, Vacant) and bool(seat.bot)
+
+
+class BotSeats:
+    def __init__(self, manager: RoomManager, policy: str = BOT_POLICY, budget: float = BOT_BUDGET,
+                 takeover: float = BOT_TAKEOVER, executor: str = BOT_EXECUTOR, workers: int = BOT_WORKERS) -> None:
+        make_policy(policy)  # fail fast on a typo
+        self.manager = manager
+        self.policy = policy
+        self.budget = budget
+        self.takeover = takeover
+        self.executor = executor
+        self.workers = workers
+        self.rng = random.Random()
+        self._pool: Optional[Executor] = None
+        self._inflight: Set[Tuple[str, Any]] = set()
+
+    def start(self) -> None:
+        if self.executor == "process":
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="mahjong-bot")
+
+    async def stop(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    # --- seats ---
+
+    def fill(self, seats: List[Any], size: int = 4) -> List[Any]:
+        """``seats`` plus bot seats up to ``size``."""
+        seats = list(seats[:size])
+        for n in range(1, size - len(seats) + 1):
+            seats.append(Vacant(f"bot-{secrets.token_hex(6)}", f"Bot {n}", bot=self.policy))
+        return seats
+
+    def vacated(self, room_id: str, seat: Vacant) -> None:
+        """A player left ``seat`` mid-game; a bot plays it if they are not back in time."""
+        if self.takeover < 0:
+            return
+        self.manager.scheduler.schedule(
+            ("takeover", seat), time.time() + self.takeover,
+            lambda: self.manager.submit(room_id, lambda: self._take_over(room_id, seat)))
+
+    def _take_over(self, room_id: str, seat: Vacant) -> bool:
+        game = self.manager.games.get(room_id)
+        # gone from the order when the player came back (the seat is rebound to their socket)
+        if game is None or seat not in game.player_order or seat.bot:
+            return False
+        seat.bot = self.policy
+        return True
+
+    # --- driving ---
+
+    def drive(self, room_id: str) -> None:
+        """Start a decision for every bot that has to act in the room's current state."""
+        game = self.manager.games.get(room_id)
+        if game is None or not game.started or self._pool is None:
+            return
+        if game.waiting_for_dice:
+            if is_bot(game.dice_roller):
+                self._launch(room_id, game.dice_roller, "dice")
+        elif game.reaction_active:
+            for seat in game.player_order:
+                if is_bot(seat) and seat not in game.reaction_claims and game.compute_actions_for(seat):
+                    self._launch(room_id, seat, "claim")
+        elif game.expects_discard and game.player_order:
+            seat = game.player_order[game.turn_index]
+            if is_bot(seat):
+                self._launch(room_id, seat, "turn")
+
+    def _launch(self, room_id: str, seat: Vacant, kind: str) -> None:
+        key = (room_id, seat)
+        if key in self._inflight:
+            return
+        self._inflight.add(key)
+        asyncio.ensure_future(self._play(room_id, seat, kind))
+
+    async def _play(self, room_id: str, seat: Vacant, kind: str) -> None:
+        decision: Any = None
+        try:
+            game = self.manager.games.get(room_id)
+            if game is not None and kind != "dice":
+                decision = await self._decide(game, seat, kind)
+        finally:
+            self.manager.submit(room_id, lambda: self._apply(room_id, seat, kind, decision))
+
+    async def _decide(self, game: GameState, seat: Vacant, kind: str) -> Any:
+        hand = game.hands.get(seat) or Hand()
+        melds = copy.deepcopy(game.exposed_melds.get(seat, []))
+        if kind == "turn":
+            drawn = game.last_drawn.get(seat)
+            # None after a chi/pong/kong claim: the seat discards without having drawn
+            fallback = (drawn if drawn is not None and drawn in hand else (hand[-1] if len(hand) else None), False)
+            if game.ting_flags.get(seat):
+                return fallback  # in Ting the drawn tile is the only legal discard
+            return await self._run(fallback, decide_turn, self.policy_of(seat), self.rng.getrandbits(32),
+                                   Hand(hand), melds)
+        actions = game.compute_actions_for(seat)
+        win = next((a for a in actions if a["type"] in ("win", "self-win")), None)
+        if win is not None:
+            return win["id"]
+        fallback = next((a["id"] for a in actions if a["type"] == "pass"), actions[0]["id"] if actions else None)
+        return await self._run(fallback, decide_claim, self.policy_of(seat), self.rng.getrandbits(32),
+                               Hand(hand), melds, copy.deepcopy(actions))
+
+    def policy_of(self, seat: Vacant) -> str:
+        return seat.bot or self.policy
+
+    async def _run(self, fallback: Any, fn: Callable[..., Any], *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        try:
+            result = await asyncio.wait_for(loop.run_in_executor(self._pool, fn, *args), self.budget)
+        except asyncio.TimeoutError:
+            DECISIONS.labels("timeout").inc()
+            return fallback
+        except Exception:
+            traceback.print_exc()
+            DECISIONS.labels("error").inc()
+            return fallback
+        DECISIONS.labels("ok").inc()
+        return result
+
+    def _apply(self, room_id: str, seat: Vacant, kind: str, decision: Any) -> bool:
+        """Runs on the room's actor: apply the decision if the bot still has that move."""
+        self._inflight.discard((room_id, seat))
+        game = self.manager.games.get(room_id)
+        if game is None or not is_bot(seat) or seat not in game.player_order:
+            return False
+        if kind == "dice":
+            if game.waiting_for_dice and game.dice_roller is seat:
+                game.begin_hand()
+        elif kind == "claim":
+            if decision is not None and game.reaction_active:
+                game.submit_claim(seat, decision)
+        elif game.expects_discard and not game.reaction_active and game.player_order[game.turn_index] is seat:
+            tile, ting = decision if decision else (None, False)
+            if ting and game.declare_ting(seat):
+                if game.discard(seat, tile):
+                    return True
+                game.cancel_ting(seat)
+            if tile is None or not game.discard(seat, tile):
+                hand = game.hands.get(seat)
+                drawn = game.last_drawn.get(seat)
+                if hand:
+                    game.discard(seat, drawn if drawn is not None and drawn in hand else hand[-1])
+        # always re-broadcast: states that came in while deciding were skipped by drive()
+        return True
@@ -0,0 +1,536 @@
+"""
+Room sharding across worker processes.
+
+Every room is owned by exactly one worker, picked by a consistent-hash ring
+over the worker ids, and only the owner keeps its RoomManager entry and
+GameState.  A client may be accepted by any worker: commands for a room
+owned elsewhere are forwarded over the bus to the owner, which runs them
+against a RemoteSocket standing in for the connection; whatever the owner
+sends to that stand-in (already encoded, diffed and coalesced) is relayed
+back and written to the real socket.
+
+Configuration (environment):
+
+    MAHJONG_WORKERS   number of workers sharing rooms (default 1)
+    MAHJONG_BUS       local | unix:///path/to/dir | redis://host:port/db
+                      (default: local for one worker, a Unix-socket bus in
+                      the temp dir otherwise)
+
+Run e.g. ``MAHJONG_WORKERS=4 uvicorn app.main:app --workers 4``; each worker
+claims a free slot (0..N-1) when it starts.
+"""
+from __future__ import annotations
+
+import abc
+import asyncio
+import base64
+import bisect
+import fcntl
+import hashlib
+import itertools
+import json
+import logging
+import os
+import secrets
+import struct
+import tempfile
+import traceback
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from fastapi import WebSocket
+
+from . import metrics
+from .wire import CODECS, JSON
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # optional, only needed for MAHJONG_BUS=redis://...
+    aioredis = None
+
+WORKERS = int(os.environ.get("MAHJONG_WORKERS", "1"))
+BUS_URL = os.environ.get("MAHJONG_BUS", "")
+
+log = logging.getLogger(__name__)
+RPC_TIMEOUT = 1.0
+
+Handler = Callable[[dict], Awaitable[None]]
+Dispatch = Callable[[Any, dict], Awaitable[None]]
+
+# message types that act on a room (payload roomId, defaulting to "lobby" like handle_ws)
+ROOM_COMMANDS = {"join", "resume", "start", "draw", "discard", "ting", "ting_cancel", "roll_dice", "claim", "hint"}
+
+
+def room_id_of(payload: dict) -> str:
+    return str(payload.get("roomId", "lobby")).strip() or "lobby"
+
+
+def _hash(key: str) -> int:
+    # stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent hashing with virtual nodes, so resizing only moves ~1/N of the rooms."""
+
+    def __init__(self, nodes: List[int], replicas: int = 64) -> None:
+        points = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas))
+        self._keys = [p for p, _ in points]
+        self._nodes = [n for _, n in points]
+
+    def lookup(self, key: str) -> int:
+        i = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._nodes[i]
+
+
+# --- buses ---
+
+class Bus(abc.ABC):
+    """Point-to-point messages between workers; messages are JSON-able dicts."""
+
+    worker_id: int = 0
+    workers: int = 1
+
+    @abc.abstractmethod
+    async def start(self, handler: Handler) -> None:
+        """Start delivering messages addressed to this worker to ``handler``."""
+
+    @abc.abstractmethod
+    async def send(self, worker: int, message: dict) -> None:
+        """Deliver ``message`` to ``worker``; dropped if it is not running."""
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalBus(Bus):
+    """In-process bus: a single worker, or several Cluster instances sharing ``hub``."""
+
+    def __init__(self, worker_id: int = 0, workers: int = 1, hub: Optional[Dict[int, asyncio.Queue]] = None) -> None:
+        self.worker_id = worker_id
+        self.workers = workers
+        self.hub = hub if hub is not None else {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, handler: Handler) -> None:
+        queue: asyncio.Queue = asyncio.Queue()
+        self.hub[self.worker_id] = queue
+
+        async def consume() -> None:
+            while True:
+                message = await queue.get()
+                try:
+                    await handler(message)
+                except Exception:
+                    traceback.print_exc()
+
+        self._task = asyncio.ensure_future(consume())
+
+    async def send(self, worker: int, message: dict) -> None:
+        queue = self.hub.get(worker)
+        if queue is not None:
+            # round-trip through JSON so local runs catch what a real bus would reject
+            queue.put_nowait(json.loads(json.dumps(message)))
+
+    async def close(self) -> None:
+        self.hub.pop(self.worker_id, None)
+        if self._task is not None:
+            self._task.cancel()
+
+
+class UnixSocketBus(Bus):
+    """Workers on one box: each listens on ``<dir>/worker-<i>.sock``.
+
+    Slots are claimed with an flock on ``worker-<i>.lock``, released by the
+    OS if the worker dies.  Frames are a 4-byte length plus JSON.
+    """
+
+    def __init__(self, directory: str, workers: int) -> None:
+        self.directory = directory
+        self.workers = workers
+        self._lock_file: Optional[Any] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._writers: Dict[int, asyncio.StreamWriter] = {}
+        self._connecting: Dict[int, asyncio.Lock] = {}
+
+    def _path(self, worker: int) -> str:
+        return os.path.join(self.directory, f"worker-{worker}.sock")
+
+    def _claim_slot(self) -> int:
+        os.makedirs(self.directory, exist_ok=True)
+        for i in range(self.workers):
+            f = open(os.path.join(self.directory, f"worker-{i}.lock"), "w")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                continue
+            self._lock_file = f
+            return i
+        raise RuntimeError(f"all {self.workers} worker slots in {self.directory} are taken")
+
+    async def start(self, handler: Handler) -> None:
+        self.worker_id = self._claim_slot()
+        path = self._path(self.worker_id)
+        if os.path.exists(path):
+            os.unlink(path)  # left over from a dead worker that held this slot
+
+        async def serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            try:
+                while True:
+                    header = await reader.readexactly(4)
+                    body = await reader.readexactly(struct.unpack('>I', header)[0])
+                    try:
+                        await handler(json.loads(body))
+                    except Exception:
+                        traceback.print_exc()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+
+        self._server = await asyncio.start_unix_server(serve, path=path)
+
+    async def _writer(self, worker: int) -> asyncio.StreamWriter:
+        writer = self._writers.get(worker)
+        if writer is not None and not writer.is_closing():
+            return writer
+        lock = self._connecting.setdefault(worker, asyncio.Lock())
+        async with lock:
+            writer = self._writers.get(worker)
+            if writer is None or writer.is_closing():
+                _, writer = await asyncio.open_unix_connection(self._path(worker))
+                self._writers[worker] = writer
+        return writer
+
+    async def send(self, worker: int, message: dict) -> None:
+        body = json.dumps(message, separators=(",", ":")).encode('utf-8')
+        frame = struct.pack('>I', len(body)) + body
+        for attempt in range(2):
+            try:
+                writer = await self._writer(worker)
+                writer.write(frame)
+                await writer.drain()
+                return
+            except (ConnectionError, FileNotFoundError, OSError):
+                self._writers.pop(worker, None)
+                if attempt:
+                    log.warning("worker %s unreachable, dropped %s", worker, message.get('op'))
+
+    async def close(self) -> None:
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+        if self._server is not None:
+            self._server.close()
+            try:
+                os.unlink(self._path(self.worker_id))
+            except OSError:
+                pass
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+class RedisBus(Bus):
+    """Workers on several boxes: one pub/sub channel per worker slot.
+
+    Slots are claimed with ``SET NX`` on a key that the owner keeps refreshing.
+    """
+
+    SLOT_TTL = 15
+
+    def __init__(self, url: str, workers: int, prefix: str = "mahjong") -> None:
+        if aioredis is None:
+            raise RuntimeError("MAHJONG_BUS=redis://... needs the redis package (pip install redis)")
+        self.url = url
+        self.workers = workers
+        self.prefix = prefix
+        self._token = secrets.token_hex(8)
+        self._redis: Any = None
+        self._tasks: List[asyncio.Task] = []
+
+    def _channel(self, worker: int) -> str:
+        return f"{self.prefix}:bus:{worker}"
+
+    def _slot_key(self, worker: int) -> str:
+        return f"{self.prefix}:slot:{worker}"
+
+    async def start(self, handler: Handler) -> None:
+        self._redis = aioredis.from_url(self.url)
+        for i in range(self.workers):
+            if await self._redis.set(self._slot_key(i), self._token, nx=True, ex=self.SLOT_TTL):
+                self.worker_id = i
+                break
+        else:
+            raise RuntimeError(f"all {self.workers} worker slots on {self.url} are taken")
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(self._channel(self.worker_id))
+
+        async def listen() -> None:
+            async for item in pubsub.listen():
+                if item.get("type") != "message":
+                    continue
+                try:
+                    await handler(json.loads(item["data"]))
+                except Exception:
+                    traceback.print_exc()
+
+        async def keep_slot() -> None:
+            while True:
+                await asyncio.sleep(self.SLOT_TTL / 3)
+                await self._redis.set(self._slot_key(self.worker_id), self._token, ex=self.SLOT_TTL)
+
+        self._tasks = [asyncio.ensure_future(listen()), asyncio.ensure_future(keep_slot())]
+
+    async def send(self, worker: int, message: dict) -> None:
+        await self._redis.publish(self._channel(worker), json.dumps(message, separators=(",", ":")))
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        if self._redis is not None:
+            if await self._redis.get(self._slot_key(self.worker_id)) == self._token.encode():
+                await self._redis.delete(self._slot_key(self.worker_id))
+            await self._redis.aclose()
+
+
+def bus_from_env() -> Bus:
+    url = BUS_URL
+    if WORKERS <= 1 and not url:
+        return LocalBus()
+    if not url:
+        url = "unix://" + os.path.join(tempfile.gettempdir(), "shanghai-mahjong-bus")
+    if url == "local":
+        if WORKERS > 1:
+            raise ValueError("MAHJONG_BUS=local only supports a single worker")
+        return LocalBus()
+    if url.startswith("unix://"):
+        return UnixSocketBus(url[len("unix://"):], WORKERS)
+    if url.startswith(("redis://", "rediss://")):
+        return RedisBus(url, WORKERS)
+    raise ValueError(f"unsupported MAHJONG_BUS: {url}")
+
+
+# --- routing ---
+
+class RemoteSocket:
+    """Stands in for a WebSocket held by another worker; what is sent to it is relayed back there."""
+
+    def __init__(self, cluster: 'Cluster', worker: int, conn: int) -> None:
+        self.cluster = cluster
+        self.worker = worker
+        self.conn = conn
+
+    def __repr__(self) -> str:
+        return f"RemoteSocket(worker={self.worker}, conn={self.conn})"
+
+    async def send_text(self, data: str) -> None:
+        await self.cluster.bus.send(self.worker, {
+            "op": "out", "origin": self.cluster.worker_id, "conn": self.conn, "text": data,
+        })
+
+    async def send_bytes(self, data: bytes) -> None:
+        await self.cluster.bus.send(self.worker, {
+            "op": "out", "origin": self.cluster.worker_id, "conn": self.conn,
+            "bytes": base64.b64encode(data).decode('ascii'),
+        })
+
+    async def close(self, code: int = 1000) -> None:
+        await self.cluster.bus.send(self.worker, {
+            "op": "close", "origin": self.cluster.worker_id, "conn": self.conn, "code": code,
+        })
+
+
+class Cluster:
+    """Routes client messages to the worker owning their room (see module docstring)."""
+
+    def __init__(self, manager: Any, bus: Bus, dispatch: Dispatch) -> None:
+        self.manager = manager
+        self.bus = bus
+        self.dispatch = dispatch
+        self.ring: Optional[HashRing] = None
+        self._conn_seq = itertools.count(1)
+        # local sockets that talk to other workers
+        self._conn_ids: Dict[WebSocket, int] = {}
+        self._sockets: Dict[int, WebSocket] = {}
+        self._remote_room: Dict[WebSocket, Tuple[int, str]] = {}
+        self._touched: Dict[WebSocket, Set[int]] = {}
+        # workers a socket moved away from: frames they still had in flight are dropped
+        self._left: Dict[WebSocket, Set[int]] = {}
+        # stand-ins for sockets held by other workers
+        self._proxies: Dict[Tuple[int, int], RemoteSocket] = {}
+        self._rpc_seq = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+
+    @property
+    def worker_id(self) -> int:
+        return self.bus.worker_id
+
+    async def start(self) -> None:
+        await self.bus.start(self._on_bus)
+        self.ring = HashRing(list(range(self.bus.workers)))
+
+    async def stop(self) -> None:
+        await self.bus.close()
+
+    def owner(self, room_id: str) -> int:
+        if self.ring is None or self.bus.workers <= 1:
+            return self.worker_id
+        return self.ring.lookup(room_id)
+
+    def room_of(self, websocket: WebSocket) -> Optional[str]:
+        """Room the socket is in, wherever that room lives."""
+        remote = self._remote_room.get(websocket)
+        if remote is not None:
+            return remote[1]
+        client = self.manager.clients.get(websocket)
+        return client.room_id if client else None
+
+    # --- client side ---
+
+    async def route(self, websocket: WebSocket, data: dict) -> None:
+        """Handle one client message here or forward it to the room's owner."""
+        msg_type = data.get("type")
+        payload = data.get("payload") or {}
+        room_id: Optional[str] = None
+        if msg_type in ROOM_COMMANDS:
+            room_id = room_id_of(payload)
+        elif msg_type == "resync":
+            room_id = self.room_of(websocket)
+        owner = self.owner(room_id) if room_id is not None else self.worker_id
+
+        if msg_type in ("join", "resume"):
+            remote = self._remote_room.get(websocket)
+            if remote is not None and (remote[0] != owner or owner == self.worker_id):
+                # leaving a room on another worker: it frees the seat now, and whatever it
+                # still sends for the old room is not for us any more
+                await self.bus.send(remote[0], {"op": "detach", "origin": self.worker_id,
+                                                "conn": self._conn_ids[websocket], "leave": True})
+                self._touched.get(websocket, set()).discard(remote[0])
+                self._left.setdefault(websocket, set()).add(remote[0])
+                del self._remote_room[websocket]
+            self._left.get(websocket, set()).discard(owner)
+            if owner != self.worker_id:
+                self.manager.leave_room(websocket)
+                self._remote_room[websocket] = (owner, room_id)
+
+        if owner == self.worker_id:
+            await self.dispatch(websocket, data)
+            return
+        conn = self._conn_ids.get(websocket)
+        if conn is None:
+            conn = self._conn_ids[websocket] = next(self._conn_seq)
+            self._sockets[conn] = websocket
+        self._touched.setdefault(websocket, set()).add(owner)
+        client = self.manager.clients.get(websocket)
+        codec = client.outbox.codec.name if client and client.outbox else JSON.name
+        await self.bus.send(owner, {"op": "cmd", "origin": self.worker_id, "conn": conn, "codec": codec, "msg": data})
+
+    async def disconnect(self, websocket: WebSocket) -> None:
+        """Local socket closed: release its stand-ins on other workers."""
+        conn = self._conn_ids.pop(websocket, None)
+        self._remote_room.pop(websocket, None)
+        self._left.pop(websocket, None)
+        touched = self._touched.pop(websocket, set())
+        if conn is None:
+            return
+        self._sockets.pop(conn, None)
+        for worker in touched:
+            await self.bus.send(worker, {"op": "detach", "origin": self.worker_id, "conn": conn})
+
+    # --- cluster-wide queries ---
+
+    async def _gather(self, request: dict, workers: List[int]) -> List[Any]:
+        futures = []
+        for worker in workers:
+            req = next(self._rpc_seq)
+            fut = asyncio.get_running_loop().create_future()
+            self._pending[req] = fut
+            futures.append((req, fut))
+            await self.bus.send(worker, {**request, "origin": self.worker_id, "req": req})
+        results = []
+        for req, fut in futures:
+            try:
+                results.append(await asyncio.wait_for(fut, RPC_TIMEOUT))
+            except asyncio.TimeoutError:
+                pass  # a worker that is down just does not contribute
+            finally:
+                self._pending.pop(req, None)
+        return results
+
+    async def list_rooms(self) -> List[dict]:
+        rooms = list(self.manager.room_summaries())
+        others = [w for w in range(self.bus.workers) if w != self.worker_id]
+        for part in await self._gather({"op": "rooms"}, others):
+            rooms.extend(part)
+        return rooms
+
+    async def room_detail(self, room_id: str) -> Optional[dict]:
+        owner = self.owner(room_id)
+        if owner == self.worker_id:
+            return self.manager.room_detail(room_id)
+        results = await self._gather({"op": "room", "roomId": room_id}, [owner])
+        return results[0] if results else None
+
+    async def metrics(self) -> List[Tuple[Optional[int], List[dict]]]:
+        """Metric families of every worker that answers, for metrics.render()."""
+        if self.bus.workers <= 1:
+            return [(None, metrics.REGISTRY.collect())]
+        others = [w for w in range(self.bus.workers) if w != self.worker_id]
+        parts = [(self.worker_id, metrics.REGISTRY.collect())]
+        for part in await self._gather({"op": "metrics"}, others):
+            parts.append((part["worker"], part["families"]))
+        return parts
+
+    # --- bus side ---
+
+    def _current(self, message: dict) -> Optional[WebSocket]:
+        """Local socket an ``out``/``close`` is for, unless it came from a worker the socket has left."""
+        websocket = self._sockets.get(message["conn"])
+        if websocket is None or message.get("origin") in self._left.get(websocket, ()):
+            return None
+        return websocket
+
+    async def _on_bus(self, message: dict) -> None:
+        op = message.get("op")
+        if op == "cmd":
+            key = (message["origin"], message["conn"])
+            proxy = self._proxies.get(key)
+            if proxy is None:
+                proxy = self._proxies[key] = RemoteSocket(self, *key)
+            codec = CODECS.get(message.get("codec"), JSON)
+            if proxy not in self.manager.clients:
+                self.manager.attach(proxy, codec)
+            else:
+                self.manager.set_format(proxy, codec)
+            await self.dispatch(proxy, message["msg"])
+        elif op == "detach":
+            proxy = self._proxies.pop((message["origin"], message["conn"]), None)
+            if proxy is not None:
+                if message.get("leave"):
+                    self.manager.leave(proxy)  # went to another room
+                else:
+                    self.manager.disconnect(proxy)  # connection closed: hold the seat for a resume
+        elif op == "out":
+            websocket = self._current(message)
+            if websocket is not None:
+                frame = message["text"] if "text" in message else base64.b64decode(message["bytes"])
+                self.manager.send(websocket, frame)
+        elif op == "close":
+            websocket = self._current(message)
+            if websocket is not None:
+                try:
+                    await websocket.close(code=message.get("code", 1000))
+                except Exception:
+                    pass
+        elif op == "rooms":
+            await self.bus.send(message["origin"], {"op": "reply", "req": message["req"], "data": self.manager.room_summaries()})
+        elif op == "room":
+            await self.bus.send(message["origin"], {"op": "reply", "req": message["req"], "data": self.manager.room_detail(message["roomId"])})
+        elif op == "metrics":
+            data = {"worker": self.worker_id, "families": metrics.REGISTRY.collect()}
+            await self.bus.send(message["origin"], {"op": "reply", "req": message["req"], "data": data})
+        elif op == "reply":
+            fut = self._pending.get(message["req"])
+            if fut is not None and not fut.done():
+                fut.set_result(message["data"])
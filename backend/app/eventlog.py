@@ -0,0 +1,259 @@
+"""
+Audit / replay event log.
+
+Game events (the HandLog events of every room, see handlog.py) are handed to
+EventLog.append(), which only appends to an in-memory deque: nothing on the
+turn path waits for the disk.  A background task drains the deque in batches
+and writes them, from a worker thread, as JSON lines into gzip segments:
+
+    <dir>/events-<utc start>-<pid>-<seq>.jsonl.gz.part   segment being written
+    <dir>/events-<utc start>-<pid>-<seq>.jsonl.gz        closed segment
+
+Each batch ends with a zlib sync flush, and the file is fsynced at most every
+``fsync_interval`` seconds, so a crash loses at most that window; readers
+still get everything up to the last flush of a ``.part`` file.  Segments
+rotate after ``segment_bytes`` of compressed output.  The pid in the name
+keeps uvicorn workers sharing a directory apart.
+
+The buffer is bounded: when the disk falls behind, new events are dropped
+and counted rather than growing memory without limit (see stats()).
+
+Records look like
+
+    {"ts": 1700000000.123, "room": "r1", "hand": 3, "seq": 0, "ev": ["r", 4, 2],
+     "header": {...}}          # header only on a hand's first event
+
+so a room's hands can be rebuilt with read_hands() and GameState.replay().
+
+Configuration (environment): MAHJONG_EVENT_LOG=<dir> turns logging on.
+"""
+from __future__ import annotations
+
+import asyncio
+import glob
+import gzip
+import json
+import os
+import time
+import traceback
+import zlib
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from .handlog import HandLog
+
+EVENT_LOG_DIR = os.environ.get("MAHJONG_EVENT_LOG", "")
+
+SUFFIX = ".jsonl.gz"
+PART = ".part"
+
+
+class EventLog:
+    def __init__(self, directory: str, segment_bytes: int = 16 << 20, max_buffer: int = 100_000,
+                 batch_size: int = 2000, flush_interval: float = 0.25, fsync_interval: float = 1.0) -> None:
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self._buffer: Deque[dict] = deque()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        # segment state, only touched by the writer thread
+        self._raw: Any = None
+        self._gz: Optional[gzip.GzipFile] = None
+        self._path = ""
+        self._seq = 0
+        self._last_fsync = 0.0
+        self._unsynced = False
+        # metrics
+        self.appended = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.bytes_written = 0
+        self.fsyncs = 0
+        self.segments = 0
+        self.write_errors = 0
+        self.max_buffered = 0
+        self.last_batch_seconds = 0.0
+
+    # --- producer side (event loop) ---
+
+    def append(self, record: dict) -> bool:
+        """Queue one record; False (and counted in ``dropped``) if the buffer is full."""
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            return False
+        record.setdefault("ts", round(time.time(), 3))
+        self._buffer.append(record)
+        self.appended += 1
+        if len(self._buffer) > self.max_buffered:
+            self.max_buffered = len(self._buffer)
+        if self._wake is not None and len(self._buffer) >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def game_listener(self, room_id: str):
+        """A GameState.listener that logs the room's hand events."""
+        def listener(log: HandLog, event: tuple) -> None:
+            record = {"room": room_id, "hand": log.hand, "seq": len(log.events) - 1, "ev": event}
+            if len(log.events) == 1:
+                record["header"] = log.header()
+            self.append(record)
+        return listener
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "buffered": len(self._buffer),
+            "capacity": self.max_buffer,
+            "maxBuffered": self.max_buffered,
+            "appended": self.appended,
+            "dropped": self.dropped,
+            "written": self.written,
+            "batches": self.batches,
+            "bytesWritten": self.bytes_written,
+            "fsyncs": self.fsyncs,
+            "segments": self.segments,
+            "writeErrors": self.write_errors,
+            "lastBatchSeconds": self.last_batch_seconds,
+        }
+
+    # --- writer task ---
+
+    def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self._wake = asyncio.Event()
+        self._closing = False
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """Write out what is buffered, close the open segment and stop the task."""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wake.set()
+        await self._task
+        self._task = None
+        await asyncio.get_running_loop().run_in_executor(None, self._close_segment)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            while self._buffer:
+                n = min(len(self._buffer), self.batch_size)
+                batch = [self._buffer.popleft() for _ in range(n)]
+                start = time.perf_counter()
+                try:
+                    await loop.run_in_executor(None, self._write_batch, batch)
+                except Exception:
+                    # keep the task alive; the batch is lost but counted
+                    self.write_errors += 1
+                    traceback.print_exc()
+                self.last_batch_seconds = time.perf_counter() - start
+                self.batches += 1
+            if self._closing:
+                return
+            if self._unsynced and time.monotonic() - self._last_fsync >= self.fsync_interval:
+                await loop.run_in_executor(None, self._fsync)
+
+    # --- writer thread ---
+
+    def _open_segment(self) -> None:
+        self._seq += 1
+        stamp = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+        self._path = os.path.join(self.directory, f"events-{stamp}-{os.getpid()}-{self._seq:04d}{SUFFIX}")
+        self._raw = open(self._path + PART, "ab")
+        self._gz = gzip.GzipFile(fileobj=self._raw, mode="wb")
+        self.segments += 1
+
+    def _close_segment(self) -> None:
+        if self._gz is None:
+            return
+        self._gz.close()  # writes the gzip trailer
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+        os.replace(self._path + PART, self._path)
+        self._gz = self._raw = None
+        self._unsynced = False
+        self.fsyncs += 1
+
+    def _fsync(self) -> None:
+        if self._raw is not None:
+            self._raw.flush()
+            os.fsync(self._raw.fileno())
+            self.fsyncs += 1
+        self._unsynced = False
+        self._last_fsync = time.monotonic()
+
+    def _write_batch(self, batch: List[dict]) -> None:
+        if self._gz is None:
+            self._open_segment()
+        data = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in batch).encode("utf-8")
+        before = self._raw.tell()
+        self._gz.write(data)
+        # sync flush so everything written so far decompresses without the trailer
+        self._gz.flush(zlib.Z_SYNC_FLUSH)
+        self.bytes_written += self._raw.tell() - before
+        self.written += len(batch)
+        self._unsynced = True
+        if self._raw.tell() >= self.segment_bytes:
+            self._close_segment()
+
+
+def event_log_from_env() -> Optional[EventLog]:
+    return EventLog(EVENT_LOG_DIR) if EVENT_LOG_DIR else None
+
+
+# --- reading ---
+
+def segments(directory: str, include_open: bool = True) -> List[str]:
+    """Segment files in write order (closed and, optionally, still-open ones)."""
+    paths = glob.glob(os.path.join(directory, "events-*" + SUFFIX))
+    if include_open:
+        paths += glob.glob(os.path.join(directory, "events-*" + SUFFIX + PART))
+    return sorted(paths)
+
+
+def read_segment(path: str) -> Iterator[dict]:
+    """Stream one segment's records; a truncated tail (open segment, crash) ends it quietly."""
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    return  # partial last line
+                yield json.loads(line)
+    except (EOFError, zlib.error, gzip.BadGzipFile):
+        return
+
+
+def read_events(directory: str, include_open: bool = True) -> Iterator[dict]:
+    """Stream every record in the directory, one segment at a time."""
+    for path in segments(directory, include_open):
+        yield from read_segment(path)
+
+
+def read_hands(directory: str, include_open: bool = True) -> Iterator[Tuple[str, HandLog]]:
+    """Reassemble finished hands as (room id, HandLog), e.g. for GameState.replay()."""
+    # a room lives on one worker, so its records are in order: a header starts its next hand
+    open_hands: Dict[str, HandLog] = {}
+    for record in read_events(directory, include_open):
+        room = record["room"]
+        header = record.get("header")
+        if header is not None:
+            open_hands[room] = HandLog.from_header(header)
+        log = open_hands.get(room)
+        if log is None or log.hand != record["hand"]:
+            continue  # hand started before the first segment we have
+        log.add(*record["ev"])
+        if log.finished:
+            del open_hands[room]
+            yield room, log
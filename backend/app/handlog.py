@@ -0,0 +1,93 @@
+"""
+Per-hand action log.
+
+Every hand is dealt from its own ``random.Random(seed)`` (wall shuffle and
+dice), so the seed plus the players' inputs pin the whole hand down.  The
+log records both, append-only, with seats as indices into player_order and
+tiles as ids (see tiles.py):
+
+    r d1 d2           dice
+    w seat tile       turn draw (last_drawn after bonus replacements)
+    m seat            manual "draw" command
+    t seat / c seat   Ting declared / cancelled
+    x seat tile [1]   discard (1: made by the turn clock, see GameState.expire_turn)
+    k seat id [1]     claim (1: arrived after the window's deadline)
+    o                 reaction window timed out
+    e seat s0 s1 ..   hand won by seat; scores afterwards
+    d seat s0 s1 ..   wall ran out (流局); seat is the dealer, who deals again
+
+Draws and the end marker are not inputs; GameState.replay() regenerates them
+and checks they match, so a divergence shows up instead of a wrong table.
+A finished hand encodes to one JSON line of roughly a kilobyte.
+"""
+from __future__ import annotations
+
+import json
+import random
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+
+from .tiles import tile_name
+
+VERSION = 1
+INPUTS = {"m", "t", "c", "x", "k", "o"}
+_TILE_ARG = {"w": 1, "x": 1}  # event kind -> index of its tile argument
+
+Event = Tuple[Any, ...]
+
+
+def new_seed() -> int:
+    return random.SystemRandom().getrandbits(63)
+
+
+@dataclass
+class HandLog:
+    seed: int
+    hand: int                   # GameState.hand_count
+    seats: int
+    dealer: int                 # seat that draws first
+    multiplier: int             # score_multiplier before this hand's dice
+    scores: List[int]           # scores before the hand, by seat
+    events: List[Event] = field(default_factory=list)
+
+    def add(self, *event: Any) -> None:
+        self.events.append(event)
+
+    @property
+    def finished(self) -> bool:
+        return bool(self.events) and self.events[-1][0] in ("e", "d")
+
+    def header(self) -> Dict[str, Any]:
+        return {"v": VERSION, "seed": self.seed, "hand": self.hand, "seats": self.seats,
+                "dealer": self.dealer, "mult": self.multiplier, "scores": self.scores}
+
+    def encode(self) -> str:
+        """One compact JSON line: the header plus ``ev`` as a list of arrays."""
+        doc = self.header()
+        doc["ev"] = self.events
+        return json.dumps(doc, separators=(",", ":"))
+
+    @classmethod
+    def from_header(cls, doc: Dict[str, Any]) -> 'HandLog':
+        if doc.get("v") != VERSION:
+            raise ValueError(f"unsupported hand log version {doc.get('v')!r}")
+        return cls(seed=doc["seed"], hand=doc["hand"], seats=doc["seats"], dealer=doc["dealer"],
+                   multiplier=doc["mult"], scores=list(doc["scores"]))
+
+    @classmethod
+    def decode(cls, line: str) -> 'HandLog':
+        doc = json.loads(line)
+        log = cls.from_header(doc)
+        log.events = [tuple(e) for e in doc["ev"]]
+        return log
+
+    def describe(self) -> List[str]:
+        """Human-readable events, one per line, for reading a disputed hand."""
+        lines = []
+        for i, event in enumerate(self.events):
+            args = list(event[1:])
+            at = _TILE_ARG.get(event[0])
+            if at is not None:
+                args[at] = tile_name(args[at])
+            lines.append(f"{i:4} {event[0]} " + " ".join(str(a) for a in args))
+        return lines
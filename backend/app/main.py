@@ -1,13 +1,31 @@
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Any, Dict, List
-import json
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+import math
 import os
+import secrets
+import sys
+import time
 import traceback
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Response
+from fastapi import FastAPI, Header, HTTPException, WebSocket, WebSocketDisconnect, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from . import metrics, profiling
+from .botseats import BotSeats
+from .cluster import ROOM_COMMANDS, Cluster, RemoteSocket, bus_from_env, room_id_of
+from .eventlog import event_log_from_env
+from .matchmaking import Matchmaker, Ticket
+from .snapshot import snapshotter_from_env
 from .ws import room_manager
+from .tiles import tile_id
+from .wire import FORMATS, decode_frame, negotiate
+
+# uvicorn only configures its own loggers; this covers the app.* ones
+logging.basicConfig(level=os.environ.get("MAHJONG_LOG_LEVEL", "INFO"), format="%(levelname)s:     %(name)s: %(message)s")
+log = logging.getLogger(__name__)
 
 
 # API Models
@@ -17,144 +35,311 @@ class RoomInfo(BaseModel):
     game_in_progress: bool
 
 
+class ProfileRequest(BaseModel):
+    spans: bool = True
+    sampling: bool = True
+    interval: float = profiling.SAMPLE_INTERVAL
+    seconds: float = 30.0   # stops by itself after this long
+
+
+def apply_command(websocket: WebSocket, msg_type: str, room_id: str, payload: dict) -> bool:
+    """Apply one room command; runs on the room's actor. Returns True if the state should be broadcast."""
+    if websocket not in room_manager.clients:
+        return False  # disconnected while the command was queued
+    if msg_type == "join":
+        name = str(payload.get("name", "guest")).strip() or "guest"
+        # stable id the client keeps across reconnects and server restarts; it gets its seat back
+        player_id = str(payload.get("playerId") or room_manager.clients[websocket].player_id or "")[:64]
+        player_id = player_id or secrets.token_hex(8)
+        session = str(payload.get("session") or "")[:64] or None
+        if not room_manager.join_room(websocket, room_id=room_id, name=name, player_id=player_id, session=session):
+            room_manager.send(websocket, {"type": "error", "payload": {"message": "seat in use by another connection"}})
+            return False
+        room_manager.send(websocket, {
+            "type": "joined",
+            "payload": {"roomId": room_id, "name": name, "playerId": player_id},
+        })
+        # send current state if any
+        return True
+
+    elif msg_type == "resume":
+        # reconnect within the grace period: same seat, and a patch instead of a snapshot if possible
+        version = payload.get("version")
+        session = str(payload.get("session", ""))
+        if room_manager.resume(websocket, room_id, session, version if isinstance(version, int) else None):
+            client = room_manager.clients[websocket]
+            room_manager.send(websocket, {
+                "type": "resumed",
+                "payload": {"roomId": room_id, "name": client.name, "playerId": client.player_id},
+            })
+            return True
+        room_manager.send(websocket, {"type": "resume_failed", "payload": {"roomId": room_id}})
+
+    elif msg_type == "start":
+        sockets = room_manager.list_room_players(room_id)
+        if payload.get("fillBots"):
+            # empty seats are played by server-side bots
+            sockets = bot_seats.fill(sockets)
+        game = room_manager.get_or_create_game(room_id)
+        game.start(sockets)
+        return True
+
+    elif msg_type == "draw":
+        # optional manual draw, not needed with auto-draw; kept for debugging
+        game = room_manager.get_or_create_game(room_id)
+        game.draw_for(websocket)
+        return True
+
+    elif msg_type == "discard":
+        tile = tile_id(str(payload.get("tile", "")).strip())
+        game = room_manager.get_or_create_game(room_id)
+        ok = tile is not None and game.discard(websocket, tile)
+        if not ok:
+            room_manager.send(websocket, {
+                "type": "error",
+                "payload": {"message": "cannot discard now or tile not in hand"},
+            })
+        # broadcast state including reaction options
+        return True
+
+    elif msg_type == "ting":
+        game = room_manager.get_or_create_game(room_id)
+        if game.declare_ting(websocket):
+            return True
+        else:
+            room_manager.send(websocket, {"type": "error", "payload": {"message": "ting only on your turn before discard"}})
+
+    elif msg_type == "ting_cancel":
+        game = room_manager.get_or_create_game(room_id)
+        if game.cancel_ting(websocket):
+            return True
+        else:
+            room_manager.send(websocket, {"type": "error", "payload": {"message": "no ting pending"}})
+
+    elif msg_type == "roll_dice":
+        game = room_manager.get_or_create_game(room_id)
+        if not game.waiting_for_dice or game.dice_roller is not websocket:
+            room_manager.send(websocket, {"type": "error", "payload": {"message": "not your turn to roll dice"}})
+        else:
+            game.begin_hand()
+            return True
+
+    elif msg_type == "hint":
+        # shanten / ukeire overlay for the asking seat only; nothing changes, so no broadcast
+        game = room_manager.get_or_create_game(room_id)
+        if not game.started or websocket not in game.hands:
+            room_manager.send(websocket, {"type": "error", "payload": {"message": "no hand to hint"}})
+        else:
+            room_manager.send(websocket, {"type": "hint", "payload": game.hint_for(websocket)})
+
+    elif msg_type == "claim":
+        claim = payload.get("claim") or {}
+        game = room_manager.get_or_create_game(room_id)
+        if not game.reaction_active:
+            room_manager.send(websocket, {"type": "error", "payload": {"message": "no reaction window"}})
+        else:
+            # validated against the actions on offer for this player
+            if game.submit_claim(websocket, str(claim.get("id", ""))) is None:
+                room_manager.send(websocket, {"type": "error", "payload": {"message": "invalid claim"}})
+            else:
+                return True
+    return False
+
+
+KNOWN_TYPES = ROOM_COMMANDS | {"ping", "hello", "resync", "quick_match", "quick_match_cancel"}
+
+
+async def handle_message(websocket: WebSocket, data: Any) -> None:
+    """Handle one decoded client message (``websocket`` may be a cluster.RemoteSocket)."""
+    msg_type = data.get("type")
+    payload = data.get("payload") or {}
+    # unknown types share one label so clients cannot blow up the series count
+    metrics.MESSAGES.labels(msg_type if msg_type in KNOWN_TYPES else "other").inc()
+
+    if msg_type == "ping":
+        room_manager.send(websocket, {"type": "pong", "payload": {"ts": datetime.utcnow().isoformat()}})
+
+    elif msg_type == "hello":
+        # client picks a wire format from the list we offered
+        codec = negotiate(payload.get("formats"))
+        room_manager.set_format(websocket, codec)
+        room_manager.send(websocket, {"type": "format", "payload": {"format": codec.name}})
+
+    elif msg_type == "resync":
+        # client saw a state_patch it could not apply
+        room_manager.resync(websocket)
+
+    elif msg_type == "quick_match":
+        # queued on this worker until the matchmaker seats it (start_match)
+        name = str(payload.get("name", "guest")).strip() or "guest"
+        player_id = str(payload.get("playerId") or "")[:64] or None
+        rating = payload.get("rating")
+        if rating is not None and (isinstance(rating, bool) or not isinstance(rating, (int, float))
+                                   or not math.isfinite(rating)):
+            # json.loads accepts Infinity and NaN, and MessagePack floats carry them too
+            room_manager.send(websocket, {"type": "error", "payload": {"message": "rating must be a finite number"}})
+        else:
+            ticket = matchmaker.enqueue(websocket, name, player_id,
+                                        rating=int(rating) if rating is not None else None,
+                                        stake=str(payload.get("stake") or "")[:32])
+            room_manager.send(websocket, {"type": "queued", "payload": {"waiting": matchmaker.waiting(ticket.bucket)}})
+
+    elif msg_type == "quick_match_cancel":
+        if matchmaker.cancel(websocket):
+            room_manager.send(websocket, {"type": "match_cancelled", "payload": {}})
+
+    elif msg_type in ROOM_COMMANDS:
+        # game state is only touched from the room's actor, one command at a time
+        room_id = room_id_of(payload)
+        received = time.perf_counter()
+
+        def command() -> bool:
+            try:
+                return apply_command(websocket, msg_type, room_id, payload)
+            finally:
+                metrics.DISPATCH_SECONDS.labels(msg_type).observe(time.perf_counter() - received)
+        room_manager.submit(room_id, command)
+
+    else:
+        room_manager.send(websocket, {
+            "type": "error",
+            "payload": {"message": f"unknown type: {msg_type}"},
+        })
+
+
 async def handle_ws(websocket: WebSocket) -> None:
     await room_manager.connect(websocket)
     try:
-        await websocket.send_json({
+        room_manager.send(websocket, {
             "type": "hello",
-            "payload": {"message": "connected to Shanghai Mahjong WS"},
+            "payload": {
+                "message": "connected to Shanghai Mahjong WS",
+                "formats": FORMATS,
+                "session": room_manager.clients[websocket].session,
+            },
         })
 
         while True:
-            raw = await websocket.receive_text()
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            raw = frame.get("text") if frame.get("text") is not None else frame.get("bytes")
             try:
-                data: Any = json.loads(raw)
+                # text frames are JSON, binary frames MessagePack
+                data: Any = decode_frame(raw)
             except Exception:
-                await websocket.send_json({
+                room_manager.send(websocket, {
                     "type": "error",
-                    "payload": {"message": "invalid JSON"},
+                    "payload": {"message": "invalid message"},
                 })
                 continue
 
-            msg_type = data.get("type")
-            payload = data.get("payload") or {}
+            if data.get("type") in ("join", "resume"):
+                # picked a room themselves
+                matchmaker.cancel(websocket)
+            await cluster.route(websocket, data)
 
-            if msg_type == "ping":
-                await websocket.send_json({"type": "pong", "payload": {"ts": datetime.utcnow().isoformat()}})
-
-            elif msg_type == "join":
-                room_id = str(payload.get("roomId", "lobby")).strip() or "lobby"
-                name = str(payload.get("name", "guest")).strip() or "guest"
-                await room_manager.join_room(websocket, room_id=room_id, name=name)
-                await websocket.send_json({
-                    "type": "joined",
-                    "payload": {"roomId": room_id, "name": name},
-                })
-                # send current state if any
-                await room_manager.broadcast_state(room_id)
-
-            elif msg_type == "start":
-                room_id = str(payload.get("roomId", "lobby")).strip() or "lobby"
-                sockets = room_manager.list_room_players(room_id)
-                game = room_manager.get_or_create_game(room_id)
-                game.start(sockets)
-                await room_manager.broadcast_state(room_id)
-
-            elif msg_type == "draw":
-                # optional manual draw, not needed with auto-draw; kept for debugging
-                room_id = str(payload.get("roomId", "lobby")).strip() or "lobby"
-                game = room_manager.get_or_create_game(room_id)
-                game.draw_for(websocket)
-                await room_manager.broadcast_state(room_id)
-
-            elif msg_type == "discard":
-                room_id = str(payload.get("roomId", "lobby")).strip() or "lobby"
-                tile = str(payload.get("tile", "")).strip()
-                game = room_manager.get_or_create_game(room_id)
-                ok = game.discard(websocket, tile)
-                if not ok:
-                    await websocket.send_json({
-                        "type": "error",
-                        "payload": {"message": "cannot discard now or tile not in hand"},
-                    })
-                # broadcast state including reaction options
-                await room_manager.broadcast_state(room_id)
-
-            elif msg_type == "ting":
-                room_id = str(payload.get("roomId", "lobby")).strip() or "lobby"
-                game = room_manager.get_or_create_game(room_id)
-                # only on your own turn when expecting discard
-                if game.started and game.player_order and game.player_order[game.turn_index] is websocket and game.expects_discard:
-                    game.ting_pending[websocket] = True
-                    await room_manager.broadcast_state(room_id)
-                else:
-                    await websocket.send_json({"type": "error", "payload": {"message": "ting only on your turn before discard"}})
-
-            elif msg_type == "ting_cancel":
-                room_id = str(payload.get("roomId", "lobby")).strip() or "lobby"
-                game = room_manager.get_or_create_game(room_id)
-                if websocket in game.ting_pending:
-                    game.ting_pending[websocket] = False
-                    await room_manager.broadcast_state(room_id)
-                else:
-                    await websocket.send_json({"type": "error", "payload": {"message": "no ting pending"}})
-                    
-            elif msg_type == "roll_dice":
-                room_id = str(payload.get("roomId", "lobby")).strip() or "lobby"
-                game = room_manager.get_or_create_game(room_id)
-                if not game.waiting_for_dice or game.dice_roller is not websocket:
-                    await websocket.send_json({"type": "error", "payload": {"message": "not your turn to roll dice"}})
-                else:
-                    game.dice_values = game.roll_dice()
-                    current_mult, next_mult = game.calculate_dice_multiplier(game.dice_values)
-                    game.score_multiplier = current_mult * game.score_multiplier
-                    game.next_game_multiplier = next_mult
-                    game._start_game()
-                    await room_manager.broadcast_state(room_id)
-
-            elif msg_type == "claim":
-                room_id = str(payload.get("roomId", "lobby")).strip() or "lobby"
-                claim = payload.get("claim") or {}
-                game = room_manager.get_or_create_game(room_id)
-                if not game.reaction_active:
-                    await websocket.send_json({"type": "error", "payload": {"message": "no reaction window"}})
-                else:
-                    # validate available actions for this player
-                    avail = game.compute_actions_for(websocket)
-                    claim_id = str(claim.get("id", ""))
-                    chosen = next((a for a in avail if a.get("id") == claim_id), None)
-                    if not chosen:
-                        await websocket.send_json({"type": "error", "payload": {"message": "invalid claim"}})
-                    else:
-                        game.reaction_claims[websocket] = chosen
-                        # resolve immediately if a higher-priority claim exists
-                        game.resolve_reactions()
-                        await room_manager.broadcast_state(room_id)
-
-            else:
-                await websocket.send_json({
-                    "type": "error",
-                    "payload": {"message": f"unknown type: {msg_type}"},
-                })
-
-            # After handling, if a reaction window is active and timed out, resolve and broadcast
-            try:
-                client = room_manager.clients.get(websocket)
-                current_room = client.room_id if client else None
-                if current_room:
-                    g = room_manager.get_or_create_game(current_room)
-                    if g.reaction_active and g.reaction_deadline_ts and g.reaction_deadline_ts <= __import__('time').time():
-                        g.resolve_reactions()
-                        await room_manager.broadcast_state(current_room)
-            except Exception:
-                traceback.print_exc()
     except WebSocketDisconnect:
+        matchmaker.cancel(websocket)
         room_manager.disconnect(websocket)
+        await cluster.disconnect(websocket)
     except Exception:
         traceback.print_exc()
+        matchmaker.cancel(websocket)
         room_manager.disconnect(websocket)
+        await cluster.disconnect(websocket)
+
+
+async def start_match(tickets: List[Ticket]) -> None:
+    """Seat a matched table at a fresh room and start it, as if the players had joined and one pressed start.
+
+    If one of them disconnected after being taken off the queue the table is
+    not started; the others go back to the front of the queue.
+    """
+    present = [ticket for ticket in tickets if ticket.websocket in room_manager.clients]
+    if len(present) < len(tickets):
+        matchmaker.requeue(present)
+        return
+    room_id = f"match-{secrets.token_hex(6)}"
+    for ticket in tickets:
+        client = room_manager.clients.get(ticket.websocket)
+        room_manager.send(ticket.websocket, {"type": "matched", "payload": {"roomId": room_id}})
+        await cluster.route(ticket.websocket, {"type": "join", "payload": {
+            "roomId": room_id, "name": ticket.name, "playerId": ticket.player_id,
+            "session": client.session if client else None,
+        }})
+    await cluster.route(tickets[0].websocket, {"type": "start", "payload": {"roomId": room_id}})
+
+
+cluster = Cluster(room_manager, bus_from_env(), handle_message)
+bot_seats = BotSeats(room_manager)
+matchmaker = Matchmaker(start_match)
+snapshotter = snapshotter_from_env(room_manager, lambda: cluster.worker_id)
+
+
+# state gauges, read when /api/metrics is scraped
+def _connections() -> Dict[str, int]:
+    relayed = sum(1 for ws in room_manager.clients if isinstance(ws, RemoteSocket))
+    return {"local": len(room_manager.clients) - relayed, "relayed": relayed}
+
+
+def _send_queue_depth() -> Dict[str, int]:
+    depths = [c.outbox.pending for c in room_manager.clients.values() if c.outbox]
+    return {"total": sum(depths), "max": max(depths, default=0)}
+
+
+def _event_log_stat(key: str):
+    return lambda: (room_manager.event_log.stats()[key] if room_manager.event_log else 0)
+
+
+# every client message is one apply_command span, named after its type
+profiler = profiling.Profiler(lambda: profiling.default_hooks() + [
+    profiling.Hook(sys.modules[__name__], "apply_command", "message",
+                   name_of=lambda websocket, msg_type, *args: f"message:{msg_type}"),
+])
+_profile_timer: Optional[asyncio.TimerHandle] = None
+
+
+metrics.Gauge("mahjong_rooms", "Rooms on this worker", fn=lambda: len(room_manager.rooms))
+metrics.Gauge("mahjong_games", "Rooms with a game table on this worker", fn=lambda: len(room_manager.games))
+metrics.Gauge("mahjong_connections", "Connected clients (relayed: held by another worker)", ["kind"], fn=_connections)
+metrics.Gauge("mahjong_match_queue", "Players waiting for a quick match on this worker", fn=lambda: len(matchmaker))
+metrics.Gauge("mahjong_held_seats", "Seats held for disconnected players to resume", fn=lambda: len(room_manager.holds))
+metrics.Gauge("mahjong_send_queue_depth", "Messages waiting in per-connection send queues", ["stat"], fn=_send_queue_depth)
+metrics.Gauge("mahjong_actor_queue_depth", "Commands waiting on room actors",
+              fn=lambda: sum(a.pending for a in room_manager.actors.values()))
+metrics.Gauge("mahjong_timers", "Armed deadline timers (turn clocks, reaction windows, seat holds, bot takeovers)", fn=lambda: len(room_manager.scheduler))
+metrics.Gauge("mahjong_event_log_buffered", "Event log records waiting for the disk", fn=_event_log_stat("buffered"))
+metrics.Gauge("mahjong_event_log_dropped", "Event log records dropped on a full buffer", fn=_event_log_stat("dropped"))
+metrics.Gauge("mahjong_snapshot_seconds", "Duration of the last room snapshot",
+              fn=lambda: snapshotter.last_seconds if snapshotter else 0)
 
-app = FastAPI(title="Shanghai Mahjong Backend", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    room_manager.event_log = event_log_from_env()
+    if room_manager.event_log is not None:
+        room_manager.event_log.start()
+    room_manager.bots = bot_seats
+    bot_seats.start()
+    matchmaker.start()
+    await cluster.start()
+    if snapshotter is not None:
+        # rooms saved before the restart; their players are re-seated when they join again
+        restored = snapshotter.restore(lambda room_id: cluster.owner(room_id) == cluster.worker_id)
+        log.info("restored %d rooms from snapshots", restored)
+        snapshotter.start()
+    yield
+    if snapshotter is not None:
+        await snapshotter.stop()
+    await matchmaker.stop()
+    await cluster.stop()
+    await bot_seats.stop()
+    if room_manager.event_log is not None:
+        await room_manager.event_log.stop()
+
+
+app = FastAPI(title="Shanghai Mahjong Backend", version="1.0.0", lifespan=lifespan)
 
 # Get allowed origins from environment variable or use default development origins
 ALLOWED_ORIGINS = [
@@ -182,39 +367,69 @@ async def health() -> dict:
 @app.get("/api/rooms")
 async def list_rooms() -> List[RoomInfo]:
     """获取所有房间信息"""
-    rooms: List[RoomInfo] = []
-    for room_id in room_manager.rooms:
-        game = room_manager.games.get(room_id)
-        rooms.append(RoomInfo(
-            room_id=room_id,
-            player_count=len(room_manager.rooms[room_id]),
-            game_in_progress=bool(game and game.started)
-        ))
-    return rooms
+    # rooms are spread over the workers; ask all of them
+    return [RoomInfo(**room) for room in await cluster.list_rooms()]
 
 @app.get("/api/rooms/{room_id}")
 async def get_room_info(room_id: str) -> Dict[str, Any]:
     """获取特定房间信息"""
-    if room_id not in room_manager.rooms:
+    info = await cluster.room_detail(room_id)
+    if info is None:
         return Response(status_code=404, content="Room not found")
-        
-    game = room_manager.games.get(room_id)
-    players = [
-        {"name": room_manager.clients[ws].name if ws in room_manager.clients else "Unknown"}
-        for ws in room_manager.rooms[room_id]
-    ]
-    
-    return {
-        "room_id": room_id,
-        "player_count": len(room_manager.rooms[room_id]),
-        "players": players,
-        "game_in_progress": bool(game and game.started),
-        "game_info": {
-            "wall_count": game.wall_count if game else None,
-            "turn_index": game.turn_index if game and game.started else None,
-            "score_multiplier": game.score_multiplier if game else 1,
-        } if game else None
-    }
+    return info
+
+
+@app.get("/api/metrics")
+async def get_metrics() -> Response:
+    """Prometheus 指标（所有 worker）"""
+    return Response(content=metrics.render(await cluster.metrics()), media_type="text/plain; version=0.0.4")
+
+
+def require_admin(token: Optional[str]) -> None:
+    # without MAHJONG_ADMIN_TOKEN the admin endpoints do not exist
+    if not profiling.ADMIN_TOKEN:
+        raise HTTPException(status_code=404)
+    if not token or not secrets.compare_digest(token, profiling.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="bad admin token")
+
+
+@app.post("/api/admin/profile/start")
+async def start_profile(req: ProfileRequest, x_admin_token: Optional[str] = Header(None)) -> Dict[str, Any]:
+    """开始性能分析（本 worker）"""
+    global _profile_timer
+    require_admin(x_admin_token)
+    if _profile_timer is not None:
+        _profile_timer.cancel()
+    # runs on the event loop thread, which is the one the sampler watches
+    profiler.start(spans=req.spans, sampling=req.sampling, interval=req.interval)
+    _profile_timer = asyncio.get_running_loop().call_later(max(req.seconds, 0.1), profiler.stop)
+    return profiler.status()
+
+
+@app.post("/api/admin/profile/stop")
+async def stop_profile(x_admin_token: Optional[str] = Header(None)) -> Dict[str, Any]:
+    """停止性能分析"""
+    require_admin(x_admin_token)
+    if _profile_timer is not None:
+        _profile_timer.cancel()
+    profiler.stop()
+    return profiler.status()
+
+
+@app.get("/api/admin/profile")
+async def profile_report(x_admin_token: Optional[str] = Header(None)) -> Dict[str, Any]:
+    """分析状态与各 span 耗时"""
+    require_admin(x_admin_token)
+    return {**profiler.status(), "spans": profiler.spans.summary() if profiler.spans else []}
+
+
+@app.get("/api/admin/profile/flamegraph")
+async def profile_flamegraph(source: str = "samples", x_admin_token: Optional[str] = Header(None)) -> Response:
+    """折叠栈输出（flamegraph.pl / speedscope）"""
+    require_admin(x_admin_token)
+    if source not in ("samples", "spans"):
+        raise HTTPException(status_code=400, detail="source is samples or spans")
+    return Response(content=profiler.flamegraph(source), media_type="text/plain")
 
 
 @app.websocket("/ws")
@@ -0,0 +1,144 @@
+"""
+Quick match: a queue of players waiting for a table.
+
+A ``quick_match`` message queues the connection in a bucket, which is its
+stake and, if MAHJONG_MATCH_RATING_BAND is set, its rating band. Every
+MAHJONG_MATCH_TICK seconds the matchmaker seats the longest-waiting four
+of every bucket that has four at a fresh room and starts the game (see
+main.start_match).
+
+Each bucket is an OrderedDict of tickets, so queueing, leaving the queue
+(``quick_match_cancel``, a manual join, a disconnect) and taking the
+oldest four are O(1). A tick only visits the buckets that filled up since
+the last one, so its cost follows the tables it forms, not the number of
+players waiting.  Each worker matches the connections it holds; the rooms
+are owned wherever the hash ring puts them, like any other room.
+
+Configuration (environment):
+
+    MAHJONG_MATCH_TICK          seconds between matching rounds (default 1)
+    MAHJONG_MATCH_RATING_BAND   rating points per bucket (default 0: ratings ignored)
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+import traceback
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from fastapi import WebSocket
+
+from . import metrics
+
+MATCH_TICK = float(os.environ.get("MAHJONG_MATCH_TICK", "1"))
+MATCH_RATING_BAND = int(os.environ.get("MAHJONG_MATCH_RATING_BAND", "0"))
+TABLE_SIZE = 4
+
+MATCH_WAIT = metrics.Histogram("mahjong_match_wait_seconds", "Time from quick_match to being seated",
+                               buckets=(0.5, 1, 2, 5, 10, 30, 60, 120, 300))
+
+
+@dataclass(eq=False)
+class Ticket:
+    websocket: WebSocket
+    name: str
+    player_id: Optional[str]
+    bucket: Tuple[Hashable, ...]
+    queued_at: float
+
+
+class Matchmaker:
+    def __init__(self, seat: Callable[[List[Ticket]], Awaitable[None]], tick: float = MATCH_TICK,
+                 rating_band: int = MATCH_RATING_BAND, size: int = TABLE_SIZE) -> None:
+        self.seat = seat  # starts a table for the tickets taken off the queue
+        self.tick = tick
+        self.rating_band = rating_band
+        self.size = size
+        self._queues: Dict[Tuple[Hashable, ...], OrderedDict] = {}
+        self._tickets: Dict[WebSocket, Ticket] = {}
+        self._full: Set[Tuple[Hashable, ...]] = set()  # buckets with at least ``size`` waiting
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._tickets)
+
+    def bucket_of(self, rating: Optional[int], stake: str) -> Tuple[Hashable, ...]:
+        if self.rating_band > 0 and rating is not None:
+            return stake, rating // self.rating_band
+        return (stake,)
+
+    def enqueue(self, websocket: WebSocket, name: str, player_id: Optional[str] = None,
+                rating: Optional[int] = None, stake: str = "") -> Ticket:
+        """Queue ``websocket``; queueing again moves it to the back (of its possibly new bucket)."""
+        self.cancel(websocket)
+        ticket = Ticket(websocket, name, player_id, self.bucket_of(rating, stake), time.time())
+        queue = self._queues.setdefault(ticket.bucket, OrderedDict())
+        queue[websocket] = ticket
+        self._tickets[websocket] = ticket
+        if len(queue) >= self.size:
+            self._full.add(ticket.bucket)
+        return ticket
+
+    def cancel(self, websocket: WebSocket) -> bool:
+        ticket = self._tickets.pop(websocket, None)
+        if ticket is None:
+            return False
+        queue = self._queues[ticket.bucket]
+        del queue[websocket]
+        if len(queue) < self.size:
+            self._full.discard(ticket.bucket)
+        if not queue:
+            del self._queues[ticket.bucket]
+        return True
+
+    def waiting(self, bucket: Tuple[Hashable, ...]) -> int:
+        return len(self._queues.get(bucket, ()))
+
+    def take(self) -> List[List[Ticket]]:
+        """Tables of ``size`` out of every full bucket, longest waiting first."""
+        tables = []
+        now = time.time()
+        for bucket in self._full:
+            queue = self._queues[bucket]
+            while len(queue) >= self.size:
+                table = [queue.popitem(last=False)[1] for _ in range(self.size)]
+                for ticket in table:
+                    del self._tickets[ticket.websocket]
+                    MATCH_WAIT.observe(now - ticket.queued_at)
+                tables.append(table)
+            if not queue:
+                del self._queues[bucket]
+        self._full.clear()
+        return tables
+
+    def requeue(self, tickets: List[Ticket]) -> None:
+        """Put tickets from take() back at the front of their buckets, wait time kept (their table fell through)."""
+        for ticket in reversed(tickets):
+            if ticket.websocket in self._tickets:
+                continue  # queued again in the meantime
+            queue = self._queues.setdefault(ticket.bucket, OrderedDict())
+            queue[ticket.websocket] = ticket
+            queue.move_to_end(ticket.websocket, last=False)
+            self._tickets[ticket.websocket] = ticket
+            if len(queue) >= self.size:
+                self._full.add(ticket.bucket)
+
+    def start(self) -> None:
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.tick)
+            for table in self.take():
+                try:
+                    await self.seat(table)
+                except Exception:
+                    traceback.print_exc()
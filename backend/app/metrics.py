@@ -0,0 +1,264 @@
+"""
+Process metrics in the Prometheus text format, for /api/metrics.
+
+A small in-house registry (no client library needed): counters, gauges and
+histograms with fixed label names.  Updating one is a dict lookup and a few
+integer adds, cheap enough for the hot paths it is used on; gauges that
+describe current state (rooms, connections, queue depth) are computed by a
+callback at scrape time instead of being maintained on every change.
+
+    MESSAGES = Counter("mahjong_messages_total", "...", ["type"])
+    MESSAGES.labels("discard").inc()
+
+    with BROADCAST_SECONDS.time():
+        ...
+
+With several workers, /api/metrics collects every worker's families over the
+cluster bus and renders them with a ``worker`` label (see Cluster.metrics).
+"""
+from __future__ import annotations
+
+import bisect
+import math
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# seconds; the hot paths live well below a millisecond
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+LAG_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BYTE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144)
+
+Sample = Tuple[str, Dict[str, str], float]   # (name suffix, labels, value)
+
+
+class _Timer:
+    __slots__ = ('child', 'start')
+
+    def __init__(self, child: Any) -> None:
+        self.child = child
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.child.observe(time.perf_counter() - self.start)
+
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        yield "", {}, self.value
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds: Sequence[float]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        total = 0
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            yield "_bucket", {"le": _format(bound)}, total
+        total += self.counts[-1]
+        yield "_bucket", {"le": "+Inf"}, total
+        yield "_sum", {}, self.sum
+        yield "_count", {}, total
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), registry: Optional['Registry'] = None) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        if not self.labelnames:
+            self._only = self._children[()] = self._child()
+        (registry or REGISTRY).register(self)
+
+    def _child(self) -> Any:
+        raise NotImplementedError
+
+    def labels(self, *values: Any) -> Any:
+        child = self._children.get(values)  # str label values, the usual case
+        if child is None:
+            key = tuple(str(v) for v in values)
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            child = self._children.get(key) or self._children.setdefault(key, self._child())
+        return child
+
+    def samples(self) -> List[Sample]:
+        out = []
+        for key, child in list(self._children.items()):
+            base = dict(zip(self.labelnames, key))
+            for suffix, extra, value in child.samples():
+                out.append((suffix, {**base, **extra}, value))
+        return out
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._only.inc(amount)
+
+
+class Gauge(Metric):
+    """A settable gauge, or (with ``fn``) one read at scrape time; ``fn`` may return {label value(s): value}."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 fn: Optional[Callable[[], Any]] = None, registry: Optional['Registry'] = None) -> None:
+        self.fn = fn
+        super().__init__(name, help, labelnames, registry)
+
+    def _child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self._only.set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._only.inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._only.dec(amount)
+
+    def samples(self) -> List[Sample]:
+        if self.fn is None:
+            return super().samples()
+        value = self.fn()
+        if not isinstance(value, dict):
+            return [("", {}, float(value))]
+        return [("", dict(zip(self.labelnames, k if isinstance(k, tuple) else (k,))), float(v))
+                for k, v in value.items()]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, registry: Optional['Registry'] = None) -> None:
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def _child(self) -> _HistogramChild:
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float) -> None:
+        self._only.observe(value)
+
+    def time(self) -> _Timer:
+        return _Timer(self._only)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> None:
+        self.metrics.append(metric)
+
+    def collect(self) -> List[dict]:
+        """JSON-friendly families, so other workers can ship theirs over the bus."""
+        families = []
+        for m in self.metrics:
+            try:
+                samples = m.samples()
+            except Exception:
+                continue  # a broken gauge callback must not take the endpoint down
+            families.append({"name": m.name, "help": m.help, "type": m.kind, "samples": samples})
+        return families
+
+
+REGISTRY = Registry()
+
+
+def _format(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render(per_worker: List[Tuple[Optional[int], List[dict]]]) -> str:
+    """Text exposition of the families of one or more workers (``worker`` label when given)."""
+    merged: Dict[str, dict] = {}
+    lines: Dict[str, List[str]] = {}
+    for worker, families in per_worker:
+        for fam in families:
+            name = fam["name"]
+            if name not in merged:
+                merged[name] = fam
+                lines[name] = []
+            for suffix, labels, value in fam["samples"]:
+                if worker is not None:
+                    labels = {"worker": str(worker), **labels}
+                label_text = ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items())
+                lines[name].append(f"{name}{suffix}{{{label_text}}} {_format(value)}" if label_text
+                                   else f"{name}{suffix} {_format(value)}")
+    out = []
+    for name, fam in merged.items():
+        out.append(f"# HELP {name} {fam['help']}")
+        out.append(f"# TYPE {name} {fam['type']}")
+        out.extend(lines[name])
+    return "\n".join(out) + "\n"
+
+
+# --- metrics of the game server (gauges are wired up in main.py) ---
+
+MESSAGES = Counter("mahjong_messages_total", "Client messages received, by type", ["type"])
+DISPATCH_SECONDS = Histogram("mahjong_dispatch_seconds",
+                             "From receiving a client message to having applied it (room actor queue included)", ["type"])
+PUBLISH_SECONDS = Histogram("mahjong_publish_seconds", "Building the shared public table view (GameState.publish)")
+BROADCAST_SECONDS = Histogram("mahjong_broadcast_seconds", "RoomManager.broadcast_state, public view and per-seat queueing")
+ENCODE_SECONDS = Histogram("mahjong_state_encode_seconds", "Per-seat state snapshot/patch encoding in the send path")
+SENT_BYTES = Histogram("mahjong_sent_bytes", "Size of frames sent to clients, by wire format", ["format"], buckets=BYTE_BUCKETS)
+SENT_FRAMES = Counter("mahjong_sent_frames_total", "Frames sent to clients, by wire format", ["format"])
+WAIT_CALCS = Counter("mahjong_wait_lookups_total", "Winning-tile (wait) lookups, by cache result", ["result"])
+WAIT_HITS, WAIT_MISSES = WAIT_CALCS.labels("hit"), WAIT_CALCS.labels("miss")
+WAIT_SECONDS = Histogram("mahjong_wait_calc_seconds", "Computing a hand's winning tiles (hand_waits, the winning_tiles_for hot path)")
+REACTION_LAG = Histogram("mahjong_reaction_lag_seconds", "How late a reaction window was resolved after its deadline",
+                         buckets=LAG_BUCKETS)
+TURN_TIMEOUTS = Counter("mahjong_turn_timeouts_total", "Discards made by the turn clock for a seat that ran out of time")
+HANDS_FINISHED = Counter("mahjong_hands_finished_total", "Hands that reached an end, by outcome", ["outcome"])
+DROPPED_CLIENTS = Counter("mahjong_slow_clients_dropped_total", "Connections dropped for falling behind on sends")
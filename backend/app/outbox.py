@@ -0,0 +1,152 @@
+"""
+Per-connection outbound queue.
+
+Broadcasts only enqueue; a writer task per socket does the actual sends, so
+one slow client never holds up the rest of the table or the handler that
+triggered the broadcast.  State snapshots are coalesced (a newer one replaces
+an unsent older one) and a client that falls too far behind is dropped.
+
+Messages are encoded with the connection's codec (see wire.py): str goes
+out as a text frame, bytes as a binary frame, anything else through
+``codec.encode``.  A message may also be a callable taking the codec, rendered
+by the writer right before sending (None means skip); state patches use this
+so they are always diffed against what actually went out.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+from fastapi import WebSocket
+
+from . import metrics
+from .wire import JSON, Codec
+
+SEND_QUEUE_SIZE = int(os.environ.get("MAHJONG_SEND_QUEUE_SIZE", "64"))
+SEND_MAX_LAG = float(os.environ.get("MAHJONG_SEND_MAX_LAG", "10"))
+
+
+class _Item:
+    __slots__ = ('message', 'key', 'ts', 'live')
+
+    def __init__(self, message: Any, key: Optional[str]) -> None:
+        self.message = message
+        self.key = key
+        self.ts = time.monotonic()
+        self.live = True
+
+
+class Outbox:
+    """Bounded send queue + writer task for one WebSocket.
+
+    ``on_overflow`` is called (once) when the queue exceeds ``max_pending``
+    live messages, the oldest unsent message is older than ``max_lag``
+    seconds, or a send fails.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        on_overflow: Callable[[], None],
+        max_pending: int = SEND_QUEUE_SIZE,
+        max_lag: float = SEND_MAX_LAG,
+        codec: Codec = JSON,
+    ) -> None:
+        self.websocket = websocket
+        self.codec = codec
+        self.on_overflow = on_overflow
+        self.max_pending = max_pending
+        self.max_lag = max_lag
+        self.sent = 0
+        self.coalesced = 0
+        self._queue: Deque[_Item] = deque()
+        self._by_key: Dict[str, _Item] = {}
+        self._pending = 0
+        self._ready = asyncio.Event()
+        self._closed = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._writer())
+
+    def put(self, message: Any, coalesce: Optional[str] = None) -> bool:
+        """Queue ``message``; with ``coalesce`` set, an unsent message with the same key is dropped."""
+        if self._closed:
+            return False
+        if coalesce is not None:
+            old = self._by_key.get(coalesce)
+            if old is not None and old.live:
+                old.live = False
+                self._pending -= 1
+                self.coalesced += 1
+        item = _Item(message, coalesce)
+        self._queue.append(item)
+        self._pending += 1
+        if coalesce is not None:
+            self._by_key[coalesce] = item
+        if self._lagging():
+            self._overflow()
+            return False
+        self._ready.set()
+        return True
+
+    def _lagging(self) -> bool:
+        if self._pending > self.max_pending:
+            return True
+        while self._queue and not self._queue[0].live:
+            self._queue.popleft()
+        return bool(self._queue) and time.monotonic() - self._queue[0].ts > self.max_lag
+
+    def _overflow(self) -> None:
+        if not self._closed:
+            self.close()
+            self.on_overflow()
+
+    def close(self) -> None:
+        self._closed = True
+        self._queue.clear()
+        self._by_key.clear()
+        self._pending = 0
+        if self._task is not None and not self._task.done() and self._task is not asyncio.current_task():
+            self._task.cancel()
+
+    async def _writer(self) -> None:
+        while not self._closed:
+            if not self._queue:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            item = self._queue.popleft()
+            if not item.live:
+                continue
+            item.live = False
+            self._pending -= 1
+            if item.key is not None and self._by_key.get(item.key) is item:
+                del self._by_key[item.key]
+            try:
+                message = item.message(self.codec) if callable(item.message) else item.message
+                if message is None:
+                    continue
+                if not isinstance(message, (str, bytes, bytearray)):
+                    message = self.codec.encode(message)
+                if isinstance(message, str):
+                    await self.websocket.send_text(message)
+                else:
+                    await self.websocket.send_bytes(message)
+                self.sent += 1
+                # str frames are JSON, i.e. (close to) one byte per character
+                metrics.SENT_BYTES.labels(self.codec.name).observe(len(message))
+                metrics.SENT_FRAMES.labels(self.codec.name).inc()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._overflow()
+                return
@@ -0,0 +1,207 @@
+"""
+Opt-in profiling: timing spans and a sampling profiler, toggled at runtime.
+
+Nothing here costs anything until it is switched on.  Spans are not checks
+sprinkled through the engine: enabling them swaps the hooked functions
+(GameState methods, RoomManager broadcast paths, encoders, the per-message
+``apply_command``) for timing wrappers, and disabling puts the originals
+back.  Each span records its inclusive time by name and its self time by
+call path, so the paths dump straight into a flamegraph:
+
+    message:discard;GameState.discard;GameState.start_reactions;GameState.waits_after 1834
+
+(collapsed-stack format, values in microseconds; feed to flamegraph.pl or
+speedscope).  The sampling profiler is a thread that reads the event-loop
+thread's Python stack every ``interval`` seconds, so it also catches what
+the spans do not cover, such as socket sends and the loop itself; its
+output uses the same format with sample counts as values.
+
+Admin endpoints in main.py drive a Profiler; they exist only when
+MAHJONG_ADMIN_TOKEN is set.  Profiling covers the worker that serves the
+request.
+"""
+from __future__ import annotations
+
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+ADMIN_TOKEN = os.environ.get("MAHJONG_ADMIN_TOKEN", "")
+SAMPLE_INTERVAL = 0.005
+MAX_DEPTH = 64
+
+
+@dataclass
+class Hook:
+    """``owner.attr`` (class or module) timed as a span; ``name_of(*args)`` may name it per call."""
+    owner: Any
+    attr: str
+    name: str
+    name_of: Optional[Callable[..., str]] = None
+
+
+def default_hooks() -> List[Hook]:
+    from . import statediff, wire, ws
+
+    hooks = [Hook(ws.GameState, attr, f"GameState.{attr}") for attr in (
+        "begin_hand", "auto_draw_current", "discard", "declare_ting", "cancel_ting", "start_reactions",
+        "compute_actions_for", "offer_reactions", "legal_reactions", "resolve_reactions", "apply_claim", "submit_claim", "expire_reactions",
+        "waits_after", "ting_discards", "hint_for", "calculate_score", "public_state", "private_state", "publish",
+    )]
+    hooks += [Hook(ws.RoomManager, attr, f"RoomManager.{attr}") for attr in (
+        "broadcast_state", "_send_state", "send", "sync_timers", "_expire_reaction",
+    )]
+    # module-level helpers are looked up as globals at call time, so they can be swapped too
+    hooks += [Hook(ws, attr, attr) for attr in ("hand_can_win", "hand_waits", "can_win_hand", "winning_tiles_for")]
+    hooks += [
+        Hook(statediff.SharedView, "encoded", "SharedView.encoded"),
+        Hook(statediff.StateStream, "encode", "StateStream.encode"),
+        Hook(wire.JsonCodec, "encode", "json.encode"),
+        Hook(wire.MsgpackCodec, "encode", "msgpack.encode"),
+    ]
+    return hooks
+
+
+class Spans:
+    """Per-name and per-path timings of the hooked calls."""
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self.by_name: Dict[str, List[float]] = {}   # name -> [calls, total seconds, max seconds]
+        self.by_path: Counter = Counter()           # "a;b;c" -> self seconds
+
+    def wrap(self, fn: Callable, name: str, name_of: Optional[Callable[..., str]]) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            stack = getattr(self._local, "stack", None)
+            if stack is None:
+                stack = self._local.stack = []
+            frame = [name_of(*args, **kwargs) if name_of else name, 0.0]  # [name, time in child spans]
+            stack.append(frame)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                path = ";".join(f[0] for f in stack)
+                stack.pop()
+                if stack:
+                    stack[-1][1] += elapsed
+                self.by_path[path] += elapsed - frame[1]
+                stat = self.by_name.get(frame[0])
+                if stat is None:
+                    self.by_name[frame[0]] = [1, elapsed, elapsed]
+                else:
+                    stat[0] += 1
+                    stat[1] += elapsed
+                    if elapsed > stat[2]:
+                        stat[2] = elapsed
+        return wrapper
+
+    def summary(self) -> List[dict]:
+        rows = [{"name": name, "calls": int(calls), "totalMs": round(total * 1000, 3),
+                 "avgUs": round(total / calls * 1e6, 1), "maxUs": round(peak * 1e6, 1)}
+                for name, (calls, total, peak) in self.by_name.items()]
+        return sorted(rows, key=lambda r: r["totalMs"], reverse=True)
+
+    def collapsed(self) -> str:
+        return "".join(f"{path} {round(seconds * 1e6)}\n" for path, seconds in self.by_path.most_common())
+
+
+class Sampler:
+    """Samples one thread's stack from a background thread."""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="mahjong-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return  # thread is gone
+            names = []
+            while frame is not None and len(names) < MAX_DEPTH:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            del frame
+            self.stacks[";".join(reversed(names))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class Profiler:
+    """Runtime switch for Spans (by swapping hooks in and out) and the Sampler."""
+
+    def __init__(self, hooks: Callable[[], List[Hook]] = default_hooks) -> None:
+        self.hooks = hooks
+        self.spans: Optional[Spans] = None
+        self.sampler: Optional[Sampler] = None
+        self.started_at = 0.0
+        self.stopped_at = 0.0
+        self._originals: List[Tuple[Any, str, Any]] = []
+
+    @property
+    def active(self) -> bool:
+        return bool(self._originals) or (self.sampler is not None and self.stopped_at == 0.0)
+
+    def start(self, spans: bool = True, sampling: bool = True, interval: float = SAMPLE_INTERVAL,
+              thread_id: Optional[int] = None) -> None:
+        """Reset and start; sampling watches ``thread_id`` (default: the calling thread, i.e. the event loop)."""
+        self.stop()
+        self.spans = Spans() if spans else None
+        self.sampler = None
+        self.started_at, self.stopped_at = time.time(), 0.0
+        if self.spans is not None:
+            for hook in self.hooks():
+                original = hook.owner.__dict__[hook.attr] if isinstance(hook.owner, type) else getattr(hook.owner, hook.attr)
+                self._originals.append((hook.owner, hook.attr, original))
+                setattr(hook.owner, hook.attr, self.spans.wrap(original, hook.name, hook.name_of))
+        if sampling:
+            self.sampler = Sampler(thread_id if thread_id is not None else threading.get_ident(), max(interval, 0.001))
+            self.sampler.start()
+
+    def stop(self) -> None:
+        """Put the original functions back and stop sampling; collected data stays readable."""
+        while self._originals:
+            owner, attr, original = self._originals.pop()
+            setattr(owner, attr, original)
+        if self.sampler is not None and self.stopped_at == 0.0:
+            self.sampler.stop()
+        if self.started_at and self.stopped_at == 0.0:
+            self.stopped_at = time.time()
+
+    def status(self) -> Dict[str, Any]:
+        end = self.stopped_at or time.time()
+        return {
+            "active": self.active,
+            "seconds": round(end - self.started_at, 3) if self.started_at else 0.0,
+            "spans": self.spans is not None,
+            "samples": self.sampler.samples if self.sampler else 0,
+            "interval": self.sampler.interval if self.sampler else None,
+        }
+
+    def flamegraph(self, source: str = "samples") -> str:
+        """Collapsed stacks of the last run: ``samples`` (counts) or ``spans`` (microseconds)."""
+        if source == "spans":
+            return self.spans.collapsed() if self.spans else ""
+        return self.sampler.collapsed() if self.sampler else ""
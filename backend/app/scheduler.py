@@ -0,0 +1,121 @@
+"""
+Process-wide deadline scheduler.
+
+All game timers (reaction windows, turn clocks, ...) live in one heap driven
+by a single asyncio task, instead of one sleeping task per room.  Deadlines
+are wall-clock timestamps (``time.time()``) because that is what GameState
+stores and sends to clients.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import time
+import traceback
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+
+TimerCallback = Callable[[], Optional[Awaitable[Any]]]
+
+
+class _Entry:
+    __slots__ = ('when', 'seq', 'key', 'callback', 'active')
+
+    def __init__(self, when: float, seq: int, key: Hashable, callback: TimerCallback) -> None:
+        self.when = when
+        self.seq = seq
+        self.key = key
+        self.callback = callback
+        self.active = True
+
+    def __lt__(self, other: '_Entry') -> bool:
+        return (self.when, self.seq) < (other.when, other.seq)
+
+
+class DeadlineScheduler:
+    """Keyed one-shot timers; scheduling an existing key replaces its deadline."""
+
+    def __init__(self) -> None:
+        self._heap: List[_Entry] = []
+        self._entries: Dict[Hashable, _Entry] = {}
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Future] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def deadline(self, key: Hashable) -> Optional[float]:
+        entry = self._entries.get(key)
+        return entry.when if entry else None
+
+    def schedule(self, key: Hashable, when: float, callback: TimerCallback) -> None:
+        old = self._entries.get(key)
+        if old is not None:
+            if old.when == when:
+                old.callback = callback
+                return
+            old.active = False
+        entry = _Entry(when, next(self._seq), key, callback)
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+        self._ensure_running()
+        if self._heap[0] is entry and self._wakeup is not None:
+            self._wakeup.set()
+
+    def cancel(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry.active = False
+
+    def _ensure_running(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # no loop yet (e.g. engine used synchronously); timers start with the first scheduled call inside one
+            return
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    async def _run(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            while self._heap and not self._heap[0].active:
+                heapq.heappop(self._heap)
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            delay = self._heap[0].when - time.time()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            entry = heapq.heappop(self._heap)
+            if self._entries.get(entry.key) is entry:
+                del self._entries[entry.key]
+            self._fire(entry)
+
+    def _fire(self, entry: _Entry) -> None:
+        try:
+            result = entry.callback()
+        except Exception:
+            traceback.print_exc()
+            return
+        if asyncio.iscoroutine(result):
+            fut = asyncio.ensure_future(self._guard(result))
+            self._running.add(fut)
+            fut.add_done_callback(self._running.discard)
+
+    @staticmethod
+    async def _guard(coro: Awaitable[Any]) -> None:
+        try:
+            await coro
+        except Exception:
+            traceback.print_exc()
@@ -0,0 +1,278 @@
+"""
+Shanten (向听数) and ukeire (进张) on top of the base-5 group keys.
+
+Shanten is the number of tile swaps a hand needs to reach tenpai; -1 means
+the hand is already complete.  The standard-shape number is
+
+    8 - 2 * melds - min(partials, 4 - melds) - head
+
+and is found per group: every group key is decomposed once (memoised on the
+key, recursion on the lowest non-empty rank) into the Pareto set of
+(melds, partials, head) it can contribute, and the four groups are merged
+with a tiny DP.  Adding one tile only changes one group, so the ukeire scan
+over 31 candidate tiles mostly hits the cache.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+from .tiles import (
+    DRAGON_START, NUM_CORE, TILE_GROUP, TILE_WEIGHT, WIND_START, Hand,
+)
+from .wintable import POW5
+
+Option = Tuple[int, int, int]  # (melds, partials, head)
+
+# tiles a hand can actually wait on: suited tiles and winds (dragons are bonus tiles)
+PLAYABLE_TILES = range(DRAGON_START)
+
+
+def _prune(options: Iterable[Option]) -> Tuple[Option, ...]:
+    """Cap counts and keep only options not dominated by another with the same head."""
+    capped = {(min(m, 4), min(t, 4), p) for m, t, p in options}
+    kept = [
+        o for o in capped
+        if not any(
+            q != o and q[2] == o[2] and q[0] >= o[0] and q[1] >= o[1]
+            for q in capped
+        )
+    ]
+    return tuple(sorted(kept))
+
+
+def _decompose(key: int, suited: bool) -> Tuple[Option, ...]:
+    if key == 0:
+        return ((0, 0, 0),)
+    i = 0
+    while (key // POW5[i]) % 5 == 0:
+        i += 1
+    w = POW5[i]
+    c = (key // w) % 5
+    size = 9 if suited else NUM_CORE - WIND_START
+
+    def digit(j: int) -> int:
+        return (key // POW5[j]) % 5 if j < size else 0
+
+    sub = _suit_options if suited else _honor_options
+    out: List[Option] = []
+
+    def add(rest: int, dm: int, dt: int, dp: int) -> None:
+        for m, t, p in sub(rest):
+            if p + dp <= 1:
+                out.append((m + dm, t + dt, p + dp))
+
+    if c >= 3:
+        add(key - 3 * w, 1, 0, 0)
+    if c >= 2:
+        add(key - 2 * w, 0, 0, 1)
+        add(key - 2 * w, 0, 1, 0)
+    if suited:
+        if digit(i + 1) and digit(i + 2):
+            add(key - w - POW5[i + 1] - POW5[i + 2], 1, 0, 0)
+        if digit(i + 1):
+            add(key - w - POW5[i + 1], 0, 1, 0)
+        if digit(i + 2):
+            add(key - w - POW5[i + 2], 0, 1, 0)
+    # leave this copy isolated
+    add(key - w, 0, 0, 0)
+    return _prune(out)
+
+
+@lru_cache(maxsize=1 << 16)
+def _suit_options(key: int) -> Tuple[Option, ...]:
+    return _decompose(key, suited=True)
+
+
+@lru_cache(maxsize=1 << 12)
+def _honor_options(key: int) -> Tuple[Option, ...]:
+    return _decompose(key, suited=False)
+
+
+def _group_options(group: int, key: int) -> Tuple[Option, ...]:
+    return _honor_options(key) if group == 3 else _suit_options(key)
+
+
+def _merge(states: Iterable[Option], opts: Tuple[Option, ...]) -> FrozenSet[Option]:
+    merged = set()
+    for m, t, p in states:
+        for m2, t2, p2 in opts:
+            if p + p2 <= 1:
+                merged.add((min(m + m2, 4), min(t + t2, 4), p + p2))
+    return frozenset(merged)
+
+
+def _merge_best(states: Iterable[Option], opts: Tuple[Option, ...]) -> int:
+    """Best shanten reachable from _merge(states, opts), without building the merged set."""
+    best = 8
+    for m, t, p in states:
+        for m2, t2, p2 in opts:
+            if p + p2 <= 1:
+                mm = m + m2
+                if mm > 4:
+                    mm = 4
+                tt = t + t2
+                if tt > 4 - mm:
+                    tt = 4 - mm
+                v = 8 - 2 * mm - tt - p - p2
+                if v < best:
+                    best = v
+    return best
+
+
+def standard_shanten(keys: Sequence[int], fixed_melds: int = 0) -> int:
+    """Shanten toward 4 melds + 1 pair; ``fixed_melds`` are already exposed."""
+    states: FrozenSet[Option] = frozenset({(fixed_melds, 0, 0)})
+    for g in range(3):
+        states = _merge(states, _group_options(g, keys[g]))
+    return _merge_best(states, _group_options(3, keys[3]))
+
+
+def seven_pairs_shanten(counts: Sequence[int]) -> int:
+    """Seven Pairs allows four of a kind to count as two pairs (see is_seven_pairs)."""
+    pairs = sum(counts[t] // 2 for t in range(NUM_CORE))
+    return 6 - min(pairs, 7)
+
+
+def all_pongs_shanten(counts: Sequence[int], exposed_melds: Sequence[dict]) -> Optional[int]:
+    """Shanten toward 碰碰胡; None if a chi is already exposed."""
+    if any(m['type'] == 'chi' for m in exposed_melds):
+        return None
+    triplets = len(exposed_melds) + sum(1 for t in range(NUM_CORE) if counts[t] >= 3)
+    pairs = sum(1 for t in range(NUM_CORE) if counts[t] == 2)
+    return 8 - 2 * triplets - min(pairs, 5 - triplets)
+
+
+def _meld_groups(exposed_melds: Sequence[dict]) -> List[int]:
+    return [TILE_GROUP[m['tiles'][0] if 'tiles' in m else m['tile']] for m in exposed_melds]
+
+
+def suit_shanten(keys: Sequence[int], exposed_melds: Sequence[dict], suit: int, honors: bool) -> Optional[int]:
+    """Shanten toward 清一色 (honors=False) or 混一色 (honors=True) in ``suit``.
+
+    Off-suit concealed tiles are treated as dead weight; None if an exposed
+    meld already rules the pattern out.
+    """
+    allowed = {suit, 3} if honors else {suit}
+    if any(g not in allowed for g in _meld_groups(exposed_melds)):
+        return None
+    kept = [keys[g] if g in allowed else 0 for g in range(4)]
+    return standard_shanten(kept, len(exposed_melds))
+
+
+def breakdown(hand: Hand, exposed_melds: Sequence[dict]) -> Dict[str, Optional[int]]:
+    """Shanten toward every shape/pattern scored by calculate_score."""
+    keys = hand.keys
+    out: Dict[str, Optional[int]] = {
+        'standard': standard_shanten(keys, len(exposed_melds)),
+        'sevenPairs': None if exposed_melds else seven_pairs_shanten(hand.counts),
+        'allPongs': all_pongs_shanten(hand.counts, exposed_melds),
+    }
+    pure = [suit_shanten(keys, exposed_melds, s, honors=False) for s in range(3)]
+    half = [suit_shanten(keys, exposed_melds, s, honors=True) for s in range(3)]
+    out['pureSuit'] = min((x for x in pure if x is not None), default=None)
+    out['halfSuit'] = min((x for x in half if x is not None), default=None)
+    return out
+
+
+def shanten(hand: Hand, exposed_melds: Sequence[dict] = ()) -> int:
+    """Shanten of a winning shape: min of standard and Seven Pairs."""
+    best = standard_shanten(hand.keys, len(exposed_melds))
+    if not exposed_melds:
+        best = min(best, seven_pairs_shanten(hand.counts))
+    return best
+
+
+@dataclass
+class Ukeire:
+    shanten: int
+    tiles: Dict[int, int] = field(default_factory=dict)  # accepting tile id -> live copies
+
+    @property
+    def total(self) -> int:
+        return sum(self.tiles.values())
+
+
+def _rest_states(keys: Sequence[int], fixed: int) -> List[Tuple[Option, ...]]:
+    """For each group g, the merged options of the other three groups.
+
+    Changing one tile only touches one group, so scans over candidate tiles
+    merge the untouched groups once instead of once per candidate.
+    """
+    start = frozenset({(fixed, 0, 0)})
+    rest = []
+    for g in range(4):
+        states = start
+        for h in range(4):
+            if h != g:
+                states = _merge(states, _group_options(h, keys[h]))
+        rest.append(_prune(states))
+    return rest
+
+
+def _ukeire(keys: Sequence[int], counts: Sequence[int], fixed: int, visible: Optional[Sequence[int]]) -> Ukeire:
+    concealed = fixed == 0
+    pairs = sum(counts[t] // 2 for t in range(NUM_CORE))
+    base = standard_shanten(keys, fixed)
+    if concealed:
+        base = min(base, 6 - min(pairs, 7))
+
+    rest = _rest_states(keys, fixed)
+    result = Ukeire(shanten=base)
+    for t in PLAYABLE_TILES:
+        held = counts[t]
+        if held >= 4:
+            continue
+        g = TILE_GROUP[t]
+        new = _merge_best(rest[g], _group_options(g, keys[g] + TILE_WEIGHT[t]))
+        if concealed and held % 2 == 1:
+            new = min(new, 6 - min(pairs + 1, 7))
+        if new < base:
+            live = 4 - held - (visible[t] if visible is not None else 0)
+            result.tiles[t] = max(live, 0)
+    return result
+
+
+def ukeire(hand: Hand, exposed_melds: Sequence[dict] = (), visible: Optional[Sequence[int]] = None) -> Ukeire:
+    """Tiles that lower the shanten of a 3n+1 hand, with live counts.
+
+    ``visible`` is a per-tile count of copies the player can see outside
+    their own hand (discards and exposed melds); see GameState.visible_counts.
+    """
+    return _ukeire(list(hand.keys), hand.counts, len(exposed_melds), visible)
+
+
+def discard_options(hand: Hand, exposed_melds: Sequence[dict] = (), visible: Optional[Sequence[int]] = None) -> List[Tuple[int, Ukeire]]:
+    """For a 3n+2 hand: every distinct discard with the resulting ukeire, best first."""
+    fixed = len(exposed_melds)
+    counts = bytearray(hand.counts)
+    keys = list(hand.keys)
+    # the discarded copy becomes visible too
+    seen = bytearray(visible) if visible is not None else bytearray(len(counts))
+    options: List[Tuple[int, Ukeire]] = []
+    for t in sorted(set(hand.tiles)):
+        if t >= NUM_CORE:
+            continue
+        g = TILE_GROUP[t]
+        keys[g] -= TILE_WEIGHT[t]
+        counts[t] -= 1
+        seen[t] += 1
+        options.append((t, _ukeire(keys, counts, fixed, seen)))
+        keys[g] += TILE_WEIGHT[t]
+        counts[t] += 1
+        seen[t] -= 1
+    options.sort(key=lambda o: (o[1].shanten, -o[1].total, o[0]))
+    return options
+
+
+def discard_shanten(hand: Hand, exposed_melds: Sequence[dict] = ()) -> Dict[int, int]:
+    """Standard shanten after each distinct discard of a 3n+2 hand; no ukeire, so cheap enough for bots."""
+    keys = hand.keys
+    rest = _rest_states(keys, len(exposed_melds))
+    out: Dict[int, int] = {}
+    for t in dict.fromkeys(hand.tiles):
+        if t < NUM_CORE:
+            g = TILE_GROUP[t]
+            out[t] = _merge_best(rest[g], _group_options(g, keys[g] - TILE_WEIGHT[t]))
+    return out
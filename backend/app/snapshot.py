@@ -0,0 +1,320 @@
+"""
+Snapshot / restore of every room's GameState across restarts.
+
+Each worker writes the games it hosts to ``<dir>/rooms-<worker>.jsonl.gz``:
+a header line, then one JSON line per room with seats as indices and the
+players' stable ids (Client.player_id) in place of sockets.  Tile lists are
+hex strings of tile ids.  The file is replaced atomically, periodically and
+on SIGTERM/SIGINT (before uvicorn closes the sockets and rooms empty out).
+
+On startup every worker reads all snapshot files and adopts the rooms the
+hash ring gives it, newest copy first, with each seat held by a Vacant.  A
+player who joins the room again with the same playerId gets the seat back
+(RoomManager.reseat).  Reaction deadlines resume with the time that was left.
+
+Only rooms whose GameState.revision moved since the last snapshot are
+re-encoded, so a periodic snapshot of tens of thousands of mostly idle rooms
+costs little more than writing the file; the write itself (and gzip) runs
+in a worker thread.
+
+Configuration (environment):
+
+    MAHJONG_SNAPSHOT            directory to keep snapshots in (off if unset)
+    MAHJONG_SNAPSHOT_INTERVAL   seconds between periodic snapshots (default 30)
+"""
+from __future__ import annotations
+
+import asyncio
+import gc
+import glob
+import gzip
+import json
+import logging
+import os
+import signal
+import time
+import traceback
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from .handlog import HandLog
+from .tiles import Hand, Wall
+from .ws import GameState, RoomManager, Vacant
+
+SNAPSHOT_DIR = os.environ.get("MAHJONG_SNAPSHOT", "")
+SNAPSHOT_INTERVAL = float(os.environ.get("MAHJONG_SNAPSHOT_INTERVAL", "30"))
+VERSION = 1
+CAPTURE_BATCH = 500
+
+log = logging.getLogger(__name__)
+
+# (room id, game, revision at capture, encoded line or dump_game() copy)
+Entry = Tuple[str, GameState, int, Union[str, dict]]
+
+
+def dump_game(room_id: str, game: GameState, seats: List[Tuple[str, Optional[str]]]) -> dict:
+    """JSON-ready copy of ``game``; ``seats`` is (player id, name) per seat.
+
+    Lists the game keeps appending to are copied, so the result can be
+    encoded off the event loop while play goes on.
+    """
+    order = game.player_order
+    index = {ws: i for i, ws in enumerate(order)}
+
+    def per_seat(table: Dict[Any, Any], convert: Callable[[Any], Any] = lambda v: v) -> list:
+        return [convert(table[ws]) if ws in table else None for ws in order]
+
+    return {
+        "room": room_id,
+        "seats": seats,
+        "bots": [ws.bot if isinstance(ws, Vacant) else None for ws in order],
+        "started": game.started,
+        "wall": bytes(game.wall).hex(),
+        "turn": game.turn_index,
+        "expectsDiscard": game.expects_discard,
+        "hands": per_seat(game.hands, lambda h: bytes(h).hex()),
+        "discards": per_seat(game.discard_piles, lambda b: b.hex()),
+        "bonus": per_seat(game.bonus_piles, lambda b: b.hex()),
+        "melds": per_seat(game.exposed_melds, list),
+        "scores": per_seat(game.scores),
+        "ting": per_seat(game.ting_flags),
+        "tingPending": per_seat(game.ting_pending),
+        "lastDrawn": per_seat(game.last_drawn),
+        "lastDiscard": [index[game.last_discard[0]], game.last_discard[1]]
+                       if game.last_discard and game.last_discard[0] in index else None,
+        "reaction": game.reaction_active,
+        "deadline": game.reaction_deadline_ts,
+        "banks": per_seat(game.time_banks),
+        "turnStarted": game.turn_started_ts,
+        "turnDeadline": game.turn_deadline_ts,
+        "actions": [[index[ws], list(a)] for ws, a in game.reaction_actions.items() if ws in index],
+        "claims": [[index[ws], c] for ws, c in game.reaction_claims.items() if ws in index],
+        "eligible": [index[ws] for ws in game.reaction_eligible if ws in index],
+        "dice": list(game.dice_values),
+        "mult": game.score_multiplier,
+        "nextMult": game.next_game_multiplier,
+        "lastWinner": index.get(game.last_winner, -1),
+        "gameCount": game.game_count,
+        "waitingForDice": game.waiting_for_dice,
+        "diceRoller": index.get(game.dice_roller, -1),
+        "handCount": game.hand_count,
+        "log": dict(game.log.header(), ev=list(game.log.events)) if game.log else None,
+    }
+
+
+def load_game(doc: dict, shift: float = 0.0) -> GameState:
+    """Rebuild a dumped game with Vacant seats; ``shift`` moves the reaction and turn deadlines (downtime)."""
+    game = GameState()
+    bots = doc.get("bots") or [None] * len(doc["seats"])
+    order = [Vacant(pid, name, bot) for (pid, name), bot in zip(doc["seats"], bots)]
+
+    def per_seat(key: str, convert: Callable[[Any], Any] = lambda v: v) -> dict:
+        return {ws: convert(v) for ws, v in zip(order, doc[key]) if v is not None}
+
+    def seat(i: int) -> Any:
+        return order[i] if 0 <= i < len(order) else None
+
+    game.player_order = order
+    game.started = doc["started"]
+    game.wall = Wall(bytes.fromhex(doc["wall"]))
+    game.turn_index = doc["turn"]
+    game.expects_discard = doc["expectsDiscard"]
+    game.hands = per_seat("hands", lambda h: Hand(bytes.fromhex(h)))
+    game.discard_piles = per_seat("discards", lambda h: bytearray.fromhex(h))
+    game.bonus_piles = per_seat("bonus", lambda h: bytearray.fromhex(h))
+    game.exposed_melds = per_seat("melds")
+    game.scores = per_seat("scores")
+    game.ting_flags = per_seat("ting")
+    game.ting_pending = per_seat("tingPending")
+    game.last_drawn = {ws: v for ws, v in zip(order, doc["lastDrawn"])}
+    if doc["lastDiscard"] is not None:
+        game.last_discard = (order[doc["lastDiscard"][0]], doc["lastDiscard"][1])
+    game.reaction_active = doc["reaction"]
+    game.reaction_deadline_ts = doc["deadline"] + shift if doc["deadline"] else doc["deadline"]
+    game.time_banks = per_seat("banks") if "banks" in doc else {}
+    if doc.get("turnDeadline"):
+        game.turn_started_ts = doc["turnStarted"] + shift
+        game.turn_deadline_ts = doc["turnDeadline"] + shift
+    game.reaction_actions = {order[i]: tuple(a) for i, a in doc["actions"]}
+    game.reaction_claims = {order[i]: c for i, c in doc["claims"]}
+    game.reaction_eligible = [order[i] for i in doc.get("eligible", ())]
+    if game.reaction_active and game.last_discard and not game.reaction_actions:
+        # older snapshots only kept self-drawn win offers
+        game.offer_reactions()
+    elif game.reaction_active and "eligible" not in doc:
+        game.reaction_eligible = list(game.reaction_actions)
+    game.dice_values = list(doc["dice"])
+    game.score_multiplier = doc["mult"]
+    game.next_game_multiplier = doc["nextMult"]
+    game.last_winner = seat(doc["lastWinner"])
+    game.game_count = doc["gameCount"]
+    game.waiting_for_dice = doc["waitingForDice"]
+    game.dice_roller = seat(doc["diceRoller"])
+    game.hand_count = doc["handCount"]
+    if doc["log"] is not None:
+        game.log = HandLog.from_header(doc["log"])
+        game.log.events = [tuple(e) for e in doc["log"]["ev"]]
+    return game
+
+
+class Snapshotter:
+    def __init__(self, manager: RoomManager, directory: str, worker_id: Callable[[], int],
+                 interval: float = SNAPSHOT_INTERVAL) -> None:
+        self.manager = manager
+        self.directory = directory
+        self.worker_id = worker_id
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        # room id -> (game, revision, encoded line)
+        self._lines: Dict[str, Tuple[GameState, int, str]] = {}
+        self.rooms = 0
+        self.encoded = 0
+        self.last_seconds = 0.0
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, f"rooms-{self.worker_id()}.jsonl.gz")
+
+    def capture(self) -> List[Entry]:
+        """Copy the rooms whose revision moved (reusing the lines of the rest); call from the event loop."""
+        return list(self._capture(list(self.manager.games.items())))
+
+    def _capture(self, games: List[Tuple[str, GameState]]) -> Iterator[Entry]:
+        for room_id, game in games:
+            if not game.player_order:
+                continue
+            hit = self._lines.get(room_id)
+            if hit is not None and hit[0] is game and hit[1] == game.revision:
+                yield room_id, game, game.revision, hit[2]
+            else:
+                seats = [(self.manager.seat_id(ws) or "", game.seat_name(ws, self.manager.clients))
+                         for ws in game.player_order]
+                yield room_id, game, game.revision, dump_game(room_id, game, seats)
+
+    def write(self, entries: List[Entry], saved_at: float) -> List[str]:
+        """Encode what capture() copied and replace the file; safe to run in a worker thread."""
+        header = json.dumps({"v": VERSION, "savedAt": saved_at, "worker": self.worker_id()})
+        # the room id leads each line so restore() can skip rooms it does not own without parsing them
+        lines = [doc if isinstance(doc, str) else json.dumps(room_id) + "\t" + json.dumps(doc, separators=(",", ":"))
+                 for room_id, _, _, doc in entries]
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=1) as gz:
+                gz.write(("\n".join([header] + lines) + "\n").encode("utf-8"))
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp, self.path)
+        return lines
+
+    def _remember(self, entries: List[Entry], lines: List[str], start: float) -> None:
+        self._lines = {room_id: (game, revision, line) for (room_id, game, revision, _), line in zip(entries, lines)}
+        self.rooms = len(entries)
+        self.encoded = sum(1 for e in entries if not isinstance(e[3], str))
+        self.last_seconds = time.perf_counter() - start
+
+    async def save(self) -> None:
+        start = time.perf_counter()
+        # each room is copied whole between commands; yield to the loop every
+        # CAPTURE_BATCH rooms so a large snapshot does not stall play
+        entries: List[Entry] = []
+        for i, entry in enumerate(self._capture(list(self.manager.games.items())), 1):
+            entries.append(entry)
+            if i % CAPTURE_BATCH == 0:
+                await asyncio.sleep(0)
+        lines = await asyncio.get_running_loop().run_in_executor(None, self.write, entries, time.time())
+        self._remember(entries, lines, start)
+
+    def save_now(self) -> None:
+        """Blocking snapshot, for the signal handler."""
+        start = time.perf_counter()
+        entries = self.capture()
+        self._remember(entries, self.write(entries, time.time()), start)
+
+    def restore(self, owns: Callable[[str], bool]) -> int:
+        """Adopt the rooms this worker owns from every snapshot file; returns how many."""
+        # a bulk load of small objects; generational GC passes would only slow it down
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._restore(owns)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def _restore(self, owns: Callable[[str], bool]) -> int:
+        newest: Dict[str, Tuple[float, str]] = {}
+        for path in glob.glob(os.path.join(self.directory, "rooms-*.jsonl.gz")):
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    header = json.loads(f.readline())
+                    if header.get("v") != VERSION:
+                        log.warning("skipping %s: version %r", path, header.get('v'))
+                        continue
+                    saved_at = header["savedAt"]
+                    for line in f:
+                        key, _, body = line.partition("\t")
+                        room_id = json.loads(key)
+                        if owns(room_id) and saved_at > newest.get(room_id, (0.0, ""))[0]:
+                            newest[room_id] = (saved_at, line.rstrip("\n"))
+            except Exception:
+                traceback.print_exc()
+        now = time.time()
+        for room_id, (saved_at, line) in newest.items():
+            if room_id in self.manager.games:
+                continue
+            game = load_game(json.loads(line.partition("\t")[2]), shift=now - saved_at)
+            self.manager.adopt(room_id, game)
+            # unchanged rooms keep this line in the next snapshot
+            self._lines[room_id] = (game, game.revision, line)
+        return len(newest)
+
+    def install_signal_handlers(self) -> None:
+        """Snapshot on SIGTERM/SIGINT, then hand over to the previous handler (uvicorn's).
+
+        The save runs as a loop callback, between room commands, never in
+        the middle of one.
+        """
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            previous = signal.getsignal(sig)
+
+            def handler(signum: int, frame: Any, previous: Any = previous) -> None:
+                loop.call_soon_threadsafe(self._on_signal, previous, signum, frame)
+
+            try:
+                signal.signal(sig, handler)
+            except ValueError:
+                return  # not on the main thread; periodic snapshots only
+
+    def _on_signal(self, previous: Any, signum: int, frame: Any) -> None:
+        try:
+            self.save_now()
+        except Exception:
+            traceback.print_exc()
+        if callable(previous):
+            previous(signum, frame)
+        elif previous == signal.SIG_DFL:
+            signal.raise_signal(signum)  # restored default: terminate as before
+
+    def start(self) -> None:
+        self.install_signal_handlers()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        # no final save here: by now uvicorn has closed the sockets and emptied
+        # the rooms; the signal handler already saved them
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save()
+            except Exception:
+                traceback.print_exc()
+
+
+def snapshotter_from_env(manager: RoomManager, worker_id: Callable[[], int]) -> Optional[Snapshotter]:
+    return Snapshotter(manager, SNAPSHOT_DIR, worker_id) if SNAPSHOT_DIR else None
@@ -0,0 +1,165 @@
+"""
+Versioned state stream: one full snapshot, then compact patches.
+
+Patches are lists of ops applied in order to the previous document:
+
+    ["s", path, value]   set path (a list index equal to the length appends)
+    ["d", path]          delete a dict key
+    ["t", path, length]  truncate a list
+    ["x", path, items]   extend a tile list (discard piles only ever grow)
+
+``path`` is a list of dict keys / list indices.  Tile lists are ``bytes``
+here and are encoded by the connection's codec (see wire.py).  The frontend
+mirror of ``apply`` lives in frontend/src/ws.ts.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+from .wire import Codec
+
+Op = list
+
+
+def diff(old: Any, new: Any, path: Optional[list] = None, ops: Optional[List[Op]] = None) -> List[Op]:
+    """Ops that turn ``old`` into ``new``."""
+    if path is None:
+        path = []
+    if ops is None:
+        ops = []
+    if isinstance(old, dict) and isinstance(new, dict):
+        for k, v in new.items():
+            if k in old:
+                diff(old[k], v, path + [k], ops)
+            else:
+                ops.append(["s", path + [k], v])
+        for k in old:
+            if k not in new:
+                ops.append(["d", path + [k]])
+    elif isinstance(old, list) and isinstance(new, list):
+        common = min(len(old), len(new))
+        for i in range(common):
+            diff(old[i], new[i], path + [i], ops)
+        if len(new) < len(old):
+            ops.append(["t", path, len(new)])
+        for i in range(common, len(new)):
+            ops.append(["s", path + [i], new[i]])
+    elif isinstance(old, bytes) and isinstance(new, bytes) and old != new:
+        if len(new) > len(old) and new.startswith(old):
+            ops.append(["x", path, new[len(old):]])
+        else:
+            ops.append(["s", path, new])
+    elif type(old) is not type(new) or old != new:
+        ops.append(["s", path, new])
+    return ops
+
+
+def apply(doc: Any, ops: List[Op]) -> Any:
+    """Apply ops in place (the root itself is replaced by a set with an empty path)."""
+    for op in ops:
+        kind, path = op[0], op[1]
+        if kind == "s" and not path:
+            doc = op[2]
+            continue
+        target = doc
+        for key in path if kind == "t" else path[:-1]:
+            target = target[key]
+        if kind == "s":
+            key = path[-1]
+            if isinstance(target, list) and key == len(target):
+                target.append(op[2])
+            else:
+                target[key] = op[2]
+        elif kind == "d":
+            del target[path[-1]]
+        elif kind == "t":
+            del target[op[2]:]
+        elif kind == "x":
+            target[path[-1]] = target[path[-1]] + op[2]
+    return doc
+
+
+class SharedView:
+    """One version of a document sent to many sockets.
+
+    Encoded once per codec, and the patch from its predecessor is computed
+    once and shared by every stream that is exactly one version behind.
+    """
+
+    __slots__ = ('version', 'doc', 'prev', '_pieces', '_ops', '_patches')
+
+    def __init__(self, version: int, doc: dict, prev: Optional['SharedView'] = None) -> None:
+        self.version = version
+        self.doc = doc
+        self.prev = prev
+        self._pieces: Dict[str, Any] = {}
+        self._ops: Optional[List[Op]] = None
+        self._patches: Dict[str, Any] = {}
+        if prev is not None:
+            prev.prev = None  # keep the chain two long
+
+    def encoded(self, codec: Codec) -> Any:
+        piece = self._pieces.get(codec.name)
+        if piece is None:
+            piece = self._pieces[codec.name] = codec.piece(self.doc)
+        return piece
+
+    def patch_from(self, base: 'SharedView', codec: Codec) -> Optional[Any]:
+        """Encoded ops from ``base`` to this view, or None if there are none."""
+        if base is self:
+            return None
+        if base is not self.prev:
+            # the stream skipped versions (coalesced sends); diff just for it
+            ops = diff(base.doc, self.doc)
+            return codec.piece(ops) if ops else None
+        if self._ops is None:
+            self._ops = diff(base.doc, self.doc)
+        if not self._ops:
+            return None
+        piece = self._patches.get(codec.name)
+        if piece is None:
+            piece = self._patches[codec.name] = codec.piece(self._ops)
+        return piece
+
+
+class StateStream:
+    """Per-connection state stream: the shared public view plus a private overlay.
+
+    The first message (and the first after reset()) is a full ``state``;
+    later ones are ``state_patch`` with separate op lists for both parts.
+    Messages are assembled around the pre-encoded shared parts so those are
+    not re-encoded per socket.
+    """
+
+    def __init__(self) -> None:
+        self.version = 0
+        self.public: Optional[SharedView] = None
+        self.private: Optional[dict] = None
+
+    def reset(self) -> None:
+        """Force the next message to be a full snapshot (join, reconnect, resync)."""
+        self.public = None
+        self.private = None
+
+    def encode(self, public: SharedView, private: dict, codec: Codec) -> Optional[Any]:
+        """Encoded message for this state, or None if nothing changed."""
+        if self.public is None or self.private is None:
+            self.version += 1
+            self.public, self.private = public, private
+            return codec.message("state", [
+                ("stateVersion", codec.piece(self.version)),
+                ("public", public.encoded(codec)),
+                ("private", codec.piece(private)),
+            ])
+        public_ops = public.patch_from(self.public, codec)
+        private_ops = diff(self.private, private)
+        if public_ops is None and not private_ops:
+            return None
+        self.version += 1
+        self.public, self.private = public, private
+        return codec.message("state_patch", [
+            ("baseVersion", codec.piece(self.version - 1)),
+            ("version", codec.piece(self.version)),
+            ("public", public_ops if public_ops is not None else codec.piece([])),
+            ("private", codec.piece(private_ops)),
+        ])
@@ -9,7 +9,8 @@ from pprint import pprint
 # === 修改这里 ===
 # 根据你后端文件结构调整导入路径
 # 例如：from app.game import MahjongGame, can_win_hand, winning_tiles_for
-from ws import GameState, can_win_hand, winning_tiles_for
+from app.ws import GameState, hand_can_win, hand_waits
+from app.tiles import Hand, Wall, tile_id, tile_name, tile_names
 
 
 def test_win_hand():
@@ -23,7 +24,7 @@ def test_win_hand():
     ]
     print("\n🀄 测试胡牌：")
     print("手牌:", hand)
-    result = can_win_hand(hand)
+    result = hand_can_win(Hand.from_names(hand), [])
     print("→ 能胡吗？", result)
 
 
@@ -38,7 +39,7 @@ def test_ting_tiles():
     ]
     print("\n🎯 测试听牌：")
     print("手牌:", hand)
-    result = winning_tiles_for(hand)
+    result = tile_names(hand_waits(Hand.from_names(hand), []))
     print("→ 听哪些牌？", result)
 
 
@@ -50,20 +51,20 @@ def test_self_win():
 
     dummy_ws = "player1"
     game.player_order = [dummy_ws]
-    game.hands[dummy_ws] = [
+    game.hands[dummy_ws] = Hand.from_names([
         "B1","B2","B3",
         "B4","B5","B6",
         "B7","B8","B9",
         "C2","C2","C2",
         "D5"
-    ]
+    ])
     game.turn_index = 0
 
     # 模拟自摸：摸到 "D5"
-    game.wall = ["D5"]
+    game.wall = Wall([tile_id("D5")])
     drawn = game.auto_draw_current()
 
-    print("摸到:", drawn)
+    print("摸到:", tile_name(drawn))
     print("reaction_active:", game.reaction_active)
     print("reaction_actions:")
     pprint(game.reaction_actions)
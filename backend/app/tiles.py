@@ -0,0 +1,181 @@
+"""
+Integer tile encoding shared by the game engine.
+
+Tiles are small ints in the order used for sorting hands:
+
+    0..26   B1..B9, C1..C9, D1..D9  (suited, id = suit * 9 + rank - 1)
+    27..30  WE WS WW WN             (winds)
+    31..33  DR DG DW                (dragons, bonus tiles in this ruleset)
+    34..41  F1..F8                  (flowers / seasons, bonus tiles)
+
+Tile names ("B5", "WE", ...) only exist at the JSON boundary.
+"""
+from __future__ import annotations
+
+from typing import Iterable, List, Optional
+
+SUIT_LETTERS = ['B', 'C', 'D']
+WIND_NAMES = ['WE', 'WS', 'WW', 'WN']
+DRAGON_NAMES = ['DR', 'DG', 'DW']
+SEASON_NAMES = ['F1', 'F2', 'F3', 'F4', 'F5', 'F6', 'F7', 'F8']
+
+TILE_NAMES: List[str] = [
+    *[f"{s}{n}" for s in SUIT_LETTERS for n in range(1, 10)],
+    *WIND_NAMES,
+    *DRAGON_NAMES,
+    *SEASON_NAMES,
+]
+TILE_IDS = {name: i for i, name in enumerate(TILE_NAMES)}
+
+NUM_TILES = len(TILE_NAMES)   # 42
+WIND_START = 27
+DRAGON_START = 31
+SEASON_START = 34
+NUM_CORE = SEASON_START       # tiles that have 4 copies in the wall
+
+# the four "groups" used by the lookup tables: three suits + honors (winds and dragons)
+HONOR_GROUP = 3
+TILE_GROUP: List[int] = [i // 9 if i < WIND_START else HONOR_GROUP for i in range(NUM_CORE)]
+TILE_WEIGHT: List[int] = [5 ** (i % 9) if i < WIND_START else 5 ** (i - WIND_START) for i in range(NUM_CORE)]
+
+
+def tile_id(name: str) -> Optional[int]:
+    return TILE_IDS.get(name)
+
+
+def tile_name(tile: int) -> str:
+    return TILE_NAMES[tile]
+
+
+def tile_names(tiles: Iterable[int]) -> List[str]:
+    return [TILE_NAMES[t] for t in tiles]
+
+
+def is_suited(tile: int) -> bool:
+    return tile < WIND_START
+
+
+def is_wind(tile: int) -> bool:
+    return WIND_START <= tile < DRAGON_START
+
+
+def is_bonus(tile: int) -> bool:
+    return tile >= DRAGON_START
+
+
+def suit_of(tile: int) -> int:
+    return tile // 9
+
+
+def rank_of(tile: int) -> int:
+    """1..9 for suited tiles."""
+    return tile % 9 + 1
+
+
+class Hand:
+    """Concealed tiles kept both in display order and as count vectors.
+
+    ``tiles`` is the order shown to the player (drawn tile stays at the end
+    until the next sort), ``counts`` is a bytearray indexed by tile id and
+    ``keys`` are the base-5 group keys consumed by ``wintable``; all three are
+    updated incrementally on every add/remove.  ``extra`` counts tiles that
+    have no key (seasons waiting for the bonus chain).
+    """
+
+    __slots__ = ('tiles', 'counts', 'keys', 'extra')
+
+    def __init__(self, tiles: Iterable[int] = ()) -> None:
+        self.tiles: List[int] = []
+        self.counts = bytearray(NUM_TILES)
+        self.keys = [0, 0, 0, 0]
+        self.extra = 0
+        for t in tiles:
+            self.append(t)
+
+    @classmethod
+    def from_names(cls, names: Iterable[str]) -> 'Hand':
+        return cls(TILE_IDS[n] for n in names)
+
+    def append(self, tile: int) -> None:
+        self.tiles.append(tile)
+        self.counts[tile] += 1
+        if tile < NUM_CORE:
+            self.keys[TILE_GROUP[tile]] += TILE_WEIGHT[tile]
+        else:
+            self.extra += 1
+
+    def _take(self, tile: int) -> None:
+        self.counts[tile] -= 1
+        if tile < NUM_CORE:
+            self.keys[TILE_GROUP[tile]] -= TILE_WEIGHT[tile]
+        else:
+            self.extra -= 1
+
+    def remove(self, tile: int) -> None:
+        if not self.counts[tile]:
+            raise ValueError(f"{TILE_NAMES[tile]} not in hand")
+        self.tiles.remove(tile)
+        self._take(tile)
+
+    def pop(self) -> int:
+        tile = self.tiles.pop()
+        self._take(tile)
+        return tile
+
+    def count(self, tile: int) -> int:
+        return self.counts[tile]
+
+    def sort(self) -> None:
+        self.tiles.sort()
+
+    def names(self) -> List[str]:
+        return [TILE_NAMES[t] for t in self.tiles]
+
+    def __contains__(self, tile: int) -> bool:
+        return bool(self.counts[tile])
+
+    def __len__(self) -> int:
+        return len(self.tiles)
+
+    def __iter__(self):
+        return iter(self.tiles)
+
+    def __getitem__(self, index: int) -> int:
+        return self.tiles[index]
+
+    def __eq__(self, other: object) -> bool:
+        # same tiles in any display order; keys and extra follow from counts
+        if not isinstance(other, Hand):
+            return NotImplemented
+        return self.counts == other.counts
+
+    def __repr__(self) -> str:
+        return f"Hand({self.names()})"
+
+
+class Wall:
+    """Shuffled wall as a bytearray; draws come from the tail, bonus replacements from the head."""
+
+    __slots__ = ('tiles', 'head')
+
+    def __init__(self, tiles: Iterable[int] = ()) -> None:
+        self.tiles = bytearray(tiles)
+        self.head = 0
+
+    def pop(self) -> int:
+        if len(self.tiles) <= self.head:
+            raise IndexError("draw from empty wall")
+        return self.tiles.pop()
+
+    def popleft(self) -> int:
+        if len(self.tiles) <= self.head:
+            raise IndexError("draw from empty wall")
+        tile = self.tiles[self.head]
+        self.head += 1
+        return tile
+
+    def __len__(self) -> int:
+        return len(self.tiles) - self.head
+
+    def __iter__(self):
+        return iter(self.tiles[self.head:])
@@ -0,0 +1,185 @@
+"""
+Lookup-table win / tenpai engine.
+
+A hand is split into four groups: the three suits (B, C, D) and the honors
+(WE WS WW WN DR DG DW).  Each group is encoded as a base-5 integer whose
+digit ``i`` is the number of copies of the ``i``-th tile of that group, so a
+whole concealed hand is just four small ints ("keys").  ``tiles.Hand`` keeps
+these keys up to date incrementally.
+
+All keys that decompose into melds (with or without one pair) are enumerated
+once at import time.  Checking a hand is then four dict lookups, and the waits
+of a 3n+1 hand come from a second table that maps every "one tile short" key
+to the bitmask of ranks that complete it.
+"""
+from __future__ import annotations
+
+from itertools import product
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+from .tiles import NUM_CORE, TILE_GROUP, TILE_NAMES, TILE_WEIGHT, WIND_START
+
+HONOR_COUNT = NUM_CORE - WIND_START  # winds + dragons
+
+POW5 = [5 ** i for i in range(9)]
+
+# tile name -> (group, base-5 weight) for the tiles that take part in hands
+TILE_SLOTS: Dict[str, Tuple[int, int]] = {
+    TILE_NAMES[i]: (TILE_GROUP[i], TILE_WEIGHT[i]) for i in range(NUM_CORE)
+}
+
+
+def _digits(key: int, size: int) -> List[int]:
+    out = []
+    for _ in range(size):
+        out.append(key % 5)
+        key //= 5
+    return out
+
+
+def _build_complete(size: int, with_chows: bool) -> Dict[int, bool]:
+    """Enumerate every key made of melds plus at most one pair.
+
+    Value is True when the decomposition uses the pair.  A key can never be
+    complete both with and without a pair because the tile count mod 3 differs.
+    """
+    melds: List[List[int]] = []
+    for r in range(size):
+        melds.append([3 if i == r else 0 for i in range(size)])
+    if with_chows:
+        for r in range(size - 2):
+            melds.append([1 if r <= i <= r + 2 else 0 for i in range(size)])
+
+    table: Dict[int, bool] = {}
+    counts = [0] * size
+
+    def emit(has_pair: bool) -> None:
+        if all(c <= 4 for c in counts):
+            table[sum(c * POW5[i] for i, c in enumerate(counts))] = has_pair
+
+    def walk(start: int, depth: int) -> None:
+        emit(False)
+        for r in range(size):
+            counts[r] += 2
+            emit(True)
+            counts[r] -= 2
+        if depth == 4:
+            return
+        for m in range(start, len(melds)):
+            meld = melds[m]
+            for i in range(size):
+                counts[i] += meld[i]
+            if all(c <= 4 for c in counts):
+                walk(m, depth + 1)
+            for i in range(size):
+                counts[i] -= meld[i]
+
+    walk(0, 0)
+    return table
+
+
+def _build_waits(complete: Dict[int, bool], size: int) -> Dict[int, Tuple[int, bool]]:
+    """Map each key that is one tile short of complete to (rank mask, pair flag after the draw)."""
+    waits: Dict[int, Tuple[int, bool]] = {}
+    for key, has_pair in complete.items():
+        digits = _digits(key, size)
+        for r in range(size):
+            if digits[r]:
+                short = key - POW5[r]
+                mask, _ = waits.get(short, (0, has_pair))
+                waits[short] = (mask | (1 << r), has_pair)
+    return waits
+
+
+_SUIT_COMPLETE = _build_complete(9, with_chows=True)
+_HONOR_COMPLETE = _build_complete(HONOR_COUNT, with_chows=False)
+_SUIT_WAITS = _build_waits(_SUIT_COMPLETE, 9)
+_HONOR_WAITS = _build_waits(_HONOR_COMPLETE, HONOR_COUNT)
+
+def _build_pairs(size: int) -> FrozenSet[int]:
+    """Every key whose counts are all even (0, 2 or 4): the Seven Pairs shapes, any length."""
+    return frozenset(sum(c * POW5[i] for i, c in enumerate(counts)) for counts in product((0, 2, 4), repeat=size))
+
+
+_SUIT_PAIRS = _build_pairs(9)
+_HONOR_PAIRS = _build_pairs(HONOR_COUNT)
+
+COMPLETE_TABLES = (_SUIT_COMPLETE, _SUIT_COMPLETE, _SUIT_COMPLETE, _HONOR_COMPLETE)
+WAIT_TABLES = (_SUIT_WAITS, _SUIT_WAITS, _SUIT_WAITS, _HONOR_WAITS)
+
+
+def encode(tiles: Iterable[str]) -> Optional[List[int]]:
+    """Encode tile names into four group keys.
+
+    Returns None if a tile is not part of the standard set (e.g. a season)
+    or a tile appears more than four times.
+    """
+    keys = [0, 0, 0, 0]
+    for t in tiles:
+        slot = TILE_SLOTS.get(t)
+        if slot is None:
+            return None
+        g, w = slot
+        k = keys[g]
+        if (k // w) % 5 == 4:
+            return None
+        keys[g] = k + w
+    return keys
+
+
+def is_complete(keys: Sequence[int], pairs: int = 1) -> bool:
+    """True if every group decomposes into melds and exactly ``pairs`` pairs are used overall."""
+    p0 = _SUIT_COMPLETE.get(keys[0])
+    if p0 is None:
+        return False
+    p1 = _SUIT_COMPLETE.get(keys[1])
+    if p1 is None:
+        return False
+    p2 = _SUIT_COMPLETE.get(keys[2])
+    if p2 is None:
+        return False
+    p3 = _HONOR_COMPLETE.get(keys[3])
+    if p3 is None:
+        return False
+    return p0 + p1 + p2 + p3 == pairs
+
+
+def is_all_pairs(keys: Sequence[int]) -> bool:
+    """True if every tile appears an even number of times (a four counts as two pairs)."""
+    return (keys[0] in _SUIT_PAIRS and keys[1] in _SUIT_PAIRS
+            and keys[2] in _SUIT_PAIRS and keys[3] in _HONOR_PAIRS)
+
+
+def wait_indices(keys: Sequence[int]) -> List[int]:
+    """Tile ids that complete a 3n+1 hand as melds + one pair."""
+    status = [COMPLETE_TABLES[g].get(keys[g]) for g in range(4)]
+    broken = [g for g in range(4) if status[g] is None]
+    if len(broken) > 1:
+        return []
+    groups = broken if broken else range(4)
+    out: List[int] = []
+    for g in groups:
+        entry = WAIT_TABLES[g].get(keys[g])
+        if entry is None:
+            continue
+        mask, pair_after = entry
+        pairs = pair_after + sum(status[h] for h in range(4) if h != g)
+        if pairs != 1:
+            continue
+        base = g * 9
+        r = 0
+        while mask:
+            if mask & 1:
+                out.append(base + r)
+            mask >>= 1
+            r += 1
+    out.sort()
+    return out
+
+
+def waits(tiles: Iterable[str]) -> List[str]:
+    """Tile names that complete ``tiles`` (3n+1 concealed tiles) as a standard hand."""
+    keys = encode(tiles)
+    if keys is None:
+        return []
+    return [TILE_NAMES[i] for i in wait_indices(keys)]
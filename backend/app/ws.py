@@ -2,20 +2,62 @@ from __future__ import annotations
 from collections import Counter
 
 from dataclasses import dataclass, field
-from typing import Dict, Set, List, Optional, Tuple, Deque
-import random
-from collections import deque
+from typing import Any, Callable, Dict, Set, List, Optional, Tuple
 import asyncio
+import os
+import random
+import secrets
 import time
 
 from fastapi import WebSocket
 
+from . import metrics, shanten, wintable
+from .actor import Command, RoomActor
+from .eventlog import EventLog
+from .handlog import HandLog, new_seed
+from .outbox import Outbox
+from .scheduler import DeadlineScheduler
+from .statediff import SharedView, StateStream
+from .wire import JSON, Codec
+from .tiles import (
+    DRAGON_START, NUM_CORE, NUM_TILES, SEASON_START, TILE_GROUP, TILE_WEIGHT,
+    Hand, Wall, is_bonus, is_suited, is_wind, rank_of, tile_name, tile_names,
+)
+
 
 @dataclass
 class Client:
     websocket: WebSocket
     name: str | None = None
     room_id: str | None = None
+    outbox: Optional[Outbox] = None
+    stream: StateStream = field(default_factory=StateStream)
+    player_id: Optional[str] = None  # stable across connections; see join_room()
+    session: Optional[str] = None    # offered in hello; names the seat hold for resume()
+
+
+@dataclass(eq=False)
+class Vacant:
+    """Holds a seat in GameState while its player is away (disconnected, or restored from a snapshot)."""
+    player_id: str
+    name: Optional[str] = None
+    bot: Optional[str] = None  # policy of the server-side bot playing the seat (see botseats.py)
+
+
+# seconds a disconnected player's seat and state stream are held for resume()
+RECONNECT_GRACE = float(os.environ.get("MAHJONG_RECONNECT_GRACE", "60"))
+# turn clock: seconds to discard, plus a per-hand time bank drawn on once they run out (0: no clock)
+TURN_SECONDS = float(os.environ.get("MAHJONG_TURN_SECONDS", "15"))
+TIME_BANK = float(os.environ.get("MAHJONG_TIME_BANK", "30"))
+# seconds the other seats get to claim a discard (or the drawer a self-drawn win)
+REACTION_SECONDS = float(os.environ.get("MAHJONG_REACTION_SECONDS", "5"))
+
+
+@dataclass
+class Hold:
+    room_id: str
+    seat: Vacant
+    stream: StateStream
 
 
 class RoomManager:
@@ -23,49 +65,231 @@ class RoomManager:
         self.rooms: Dict[str, Set[WebSocket]] = {}
         self.clients: Dict[WebSocket, Client] = {}
         self.games: Dict[str, 'GameState'] = {}
+        self.actors: Dict[str, RoomActor] = {}
+        self.scheduler = DeadlineScheduler()
+        self.event_log: Optional[EventLog] = None
+        # session token -> seat held for a disconnected client
+        self.holds: Dict[str, Hold] = {}
+        self.held_rooms: Counter = Counter()
+        self.bots: Optional[Any] = None  # botseats.BotSeats, set up by main
 
     async def connect(self, websocket: WebSocket) -> None:
         await websocket.accept()
-        self.clients[websocket] = Client(websocket=websocket)
-
-    def disconnect(self, websocket: WebSocket) -> None:
+        self.attach(websocket)
+
+    def attach(self, websocket: WebSocket, codec: Codec = JSON) -> None:
+        """Register an accepted socket (or a cluster.RemoteSocket stand-in)."""
+        outbox = Outbox(websocket, on_overflow=lambda: self._drop_slow(websocket), codec=codec)
+        self.clients[websocket] = Client(websocket=websocket, outbox=outbox, session=secrets.token_urlsafe(16))
+        outbox.start()
+
+    def send(self, websocket: WebSocket, message: Any, coalesce: Optional[str] = None) -> bool:
+        """Queue a message for one socket without waiting for the network."""
+        client = self.clients.get(websocket)
+        if not client or not client.outbox:
+            return False
+        return client.outbox.put(message, coalesce=coalesce)
+
+    def _drop_slow(self, websocket: WebSocket) -> None:
+        # called by the outbox when the client lags too far behind or a send fails
+        metrics.DROPPED_CLIENTS.inc()
+        self.disconnect(websocket)
+        asyncio.ensure_future(self._close_quietly(websocket))
+
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket) -> None:
+        try:
+            await websocket.close(code=1013)  # try again later
+        except Exception:
+            pass
+
+    def disconnect(self, websocket: WebSocket, hold: bool = True) -> None:
         client = self.clients.pop(websocket, None)
+        if client and client.outbox:
+            client.outbox.close()
+        if client:
+            self._vacate(websocket, client, hold)
+
+    def _vacate(self, websocket: WebSocket, client: Client, hold: bool) -> None:
+        """Take the socket out of its room, leaving a Vacant in its seat (held for a resume if ``hold``)."""
+        room_id = client.room_id
+        game = self.games.get(room_id) if room_id else None
+        if game and websocket in game.player_order:
+            # keep the seat for the player to come back to
+            seat = Vacant(client.player_id or "", client.name)
+            game.rebind(websocket, seat)
+            if hold and client.session and RECONNECT_GRACE > 0:
+                self._hold(client.session, Hold(room_id, seat, client.stream))
+            if hold and self.bots is not None and game.started:
+                self.bots.vacated(room_id, seat)
+        if room_id and room_id in self.rooms:
+            self.rooms[room_id].discard(websocket)
+            self._close_if_idle(room_id)
+
+    def leave(self, websocket: WebSocket) -> None:
+        """The client went to another room: drop it and free its seat now.
+
+        Unlike disconnect() nothing is held for a resume and no bot takes the
+        seat over; a join with the same player id still reclaims it.
+        """
+        self.disconnect(websocket, hold=False)
+
+    def _hold(self, token: str, hold: Hold) -> None:
+        self.holds[token] = hold
+        self.held_rooms[hold.room_id] += 1
+        self.scheduler.schedule(("hold", token), time.time() + RECONNECT_GRACE,
+                                lambda: self.submit(hold.room_id, lambda: self._release(token)))
+
+    def _unhold(self, token: str) -> Optional[Hold]:
+        hold = self.holds.pop(token, None)
+        if hold is not None:
+            self.scheduler.cancel(("hold", token))
+            self.held_rooms[hold.room_id] -= 1
+            if not self.held_rooms[hold.room_id]:
+                del self.held_rooms[hold.room_id]
+        return hold
+
+    def _release(self, token: str) -> bool:
+        """Grace period over: the seat stays Vacant (a join with the player id still reclaims it)."""
+        hold = self._unhold(token)
+        if hold is not None:
+            self._close_if_idle(hold.room_id)
+        return False
+
+    def _close_if_idle(self, room_id: str) -> None:
+        """Remove an empty room and its game, unless a disconnected player's seat is still held."""
+        if self.rooms.get(room_id) or self.held_rooms.get(room_id):
+            return
+        self.rooms.pop(room_id, None)
+        self.games.pop(room_id, None)
+        self.scheduler.cancel(("reaction", room_id))
+        actor = self.actors.get(room_id)
+        if actor is not None and not actor.pending:
+            del self.actors[room_id]
+
+    def resume(self, websocket: WebSocket, room_id: str, token: str, version: Optional[int]) -> bool:
+        """Put a reconnecting client back in its held seat; False if there is no hold (expired or unknown).
+
+        If the client has applied everything up to the held stream's version it
+        continues that stream and only gets a patch; otherwise a full snapshot.
+        """
+        hold = self.holds.get(token)
+        if hold is None or hold.room_id != room_id:
+            return False
+        self._unhold(token)
+        client = self.clients[websocket]
+        self.leave_room(websocket)
+        client.room_id = room_id
+        client.name = hold.seat.name
+        client.player_id = hold.seat.player_id or client.player_id
+        client.session = token
+        if version is not None and version == hold.stream.version:
+            client.stream = hold.stream
+        else:
+            client.stream.reset()
+        self.rooms.setdefault(room_id, set()).add(websocket)
+        game = self.games.get(room_id)
+        if game and hold.seat in game.player_order:
+            game.rebind(hold.seat, websocket)
+        return True
+
+    def leave_room(self, websocket: WebSocket) -> None:
+        client = self.clients.get(websocket)
         if client and client.room_id and client.room_id in self.rooms:
             self.rooms[client.room_id].discard(websocket)
-            if not self.rooms[client.room_id]:
-                del self.rooms[client.room_id]
-                # remove game state when room empty
-                self.games.pop(client.room_id, None)
-
-    async def join_room(self, websocket: WebSocket, room_id: str, name: str) -> None:
+        if client:
+            client.room_id = None
+
+    def submit(self, room_id: str, command: Command) -> None:
+        """Queue a state-changing command on the room's actor (see actor.py)."""
+        actor = self.actors.get(room_id)
+        if actor is None:
+            actor = self.actors[room_id] = RoomActor(room_id, lambda: self.broadcast_state(room_id))
+        actor.submit(command)
+
+    def join_room(self, websocket: WebSocket, room_id: str, name: str, player_id: Optional[str] = None,
+                  session: Optional[str] = None) -> bool:
+        """Put the socket in ``room_id``; False (nothing changes) if its player id is seated there
+        on another open connection, see seat_in_use()."""
         client = self.clients[websocket]
+        if self.seat_in_use(room_id, websocket, player_id or client.player_id, session or client.session):
+            return False
+        if client.room_id not in (None, room_id):
+            # switching rooms: free the old seat the way leave() does
+            self._vacate(websocket, client, hold=False)
         # leave previous room if any
-        if client.room_id and client.room_id in self.rooms:
-            self.rooms[client.room_id].discard(websocket)
+        self.leave_room(websocket)
         client.room_id = room_id
         client.name = name
+        if player_id:
+            client.player_id = player_id
+        if session:
+            client.session = session
+        # the next state for this socket is a full snapshot
+        client.stream.reset()
         if room_id not in self.rooms:
             self.rooms[room_id] = set()
         self.rooms[room_id].add(websocket)
-        await self.broadcast(room_id, {
+        self.reseat(room_id, websocket)
+        self.broadcast(room_id, {
             "type": "system",
             "payload": {
                 "message": f"{name} joined room {room_id}",
             },
         })
+        return True
+
+    def seat_id(self, seat: Any) -> Optional[str]:
+        """Player id of a GameState seat key (a socket or a Vacant)."""
+        if isinstance(seat, Vacant):
+            return seat.player_id
+        client = self.clients.get(seat)
+        return client.player_id if client else None
 
-    async def broadcast(self, room_id: str, message: dict) -> None:
+    def seat_in_use(self, room_id: str, websocket: WebSocket, player_id: Optional[str], session: Optional[str]) -> bool:
+        """Whether ``player_id``'s seat in the room belongs to another connection that is still open.
+
+        The player id alone is not proof (another tab may share it); only the
+        same session token, i.e. the same client reconnecting before its old
+        connection was noticed gone, may take an open seat over.
+        """
+        game = self.games.get(room_id)
+        if game is None or not player_id:
+            return False
+        for seat in game.player_order:
+            if seat is websocket or isinstance(seat, Vacant) or self.seat_id(seat) != player_id:
+                continue
+            return self.clients[seat].session != session
+        return False
+
+    def reseat(self, room_id: str, websocket: WebSocket) -> bool:
+        """Give a returning player (same player id) their seat back, with everything in it."""
+        game = self.games.get(room_id)
+        player_id = self.clients[websocket].player_id
+        if game is None or not player_id or websocket in game.player_order:
+            return False
+        for seat in game.player_order:
+            if self.seat_id(seat) == player_id:
+                if not isinstance(seat, Vacant):
+                    # an older connection of the same client (see seat_in_use), not closed yet: it loses the seat
+                    self.leave_room(seat)
+                game.rebind(seat, websocket)
+                return True
+        return False
+
+    def adopt(self, room_id: str, game: 'GameState') -> None:
+        """Host a game restored from a snapshot; its seats wait for their players to rejoin."""
+        if self.event_log is not None:
+            game.listener = self.event_log.game_listener(room_id)
+        self.games[room_id] = game
+        self.rooms.setdefault(room_id, set())
+        self.sync_timers(room_id)
+
+    def broadcast(self, room_id: str, message: dict) -> None:
         if room_id not in self.rooms:
             return
-        dead: list[WebSocket] = []
         for ws in list(self.rooms[room_id]):
-            try:
-                await ws.send_json(message)
-            except Exception:
-                dead.append(ws)
-        for ws in dead:
-            self.rooms[room_id].discard(ws)
-            self.clients.pop(ws, None)
+            self.send(ws, message)
 
     # --- Mahjong core ---
 
@@ -73,22 +297,137 @@ class RoomManager:
         game = self.games.get(room_id)
         if not game:
             game = GameState()
+            if self.event_log is not None:
+                game.listener = self.event_log.game_listener(room_id)
             self.games[room_id] = game
         return game
 
     def list_room_players(self, room_id: str) -> List[WebSocket]:
         return list(self.rooms.get(room_id, set()))
 
-    async def broadcast_state(self, room_id: str) -> None:
+    def room_summaries(self) -> List[dict]:
+        """Rooms hosted by this worker, for /api/rooms."""
+        out = []
+        for room_id, sockets in self.rooms.items():
+            game = self.games.get(room_id)
+            out.append({
+                "room_id": room_id,
+                "player_count": len(sockets),
+                "game_in_progress": bool(game and game.started),
+            })
+        return out
+
+    def room_detail(self, room_id: str) -> Optional[dict]:
+        if room_id not in self.rooms:
+            return None
+        game = self.games.get(room_id)
+        players = [
+            {"name": self.clients[ws].name if ws in self.clients else "Unknown"}
+            for ws in self.rooms[room_id]
+        ]
+        return {
+            "room_id": room_id,
+            "player_count": len(self.rooms[room_id]),
+            "players": players,
+            "game_in_progress": bool(game and game.started),
+            "game_info": {
+                "wall_count": len(game.wall),
+                "turn_index": game.turn_index if game.started else None,
+                "score_multiplier": game.score_multiplier,
+            } if game else None,
+        }
+
+    def sync_timers(self, room_id: str) -> None:
+        """Arm (or disarm) the room's reaction-window and turn-clock timers to match the game state."""
+        game = self.games.get(room_id)
+        key = ("reaction", room_id)
+        if game and game.reaction_active and game.reaction_deadline_ts:
+            self.scheduler.schedule(key, game.reaction_deadline_ts, lambda: self._on_reaction_deadline(room_id))
+        else:
+            self.scheduler.cancel(key)
+        key = ("turn", room_id)
+        if game:
+            game.sync_turn_clock(time.time())
+        if game and game.turn_deadline_ts:
+            self.scheduler.schedule(key, game.turn_deadline_ts,
+                                    lambda: self.submit(room_id, lambda: self._expire_turn(room_id)))
+        else:
+            self.scheduler.cancel(key)
+
+    def _on_reaction_deadline(self, room_id: str) -> None:
+        self.submit(room_id, lambda: self._expire_reaction(room_id))
+
+    def _expire_reaction(self, room_id: str) -> bool:
+        game = self.games.get(room_id)
+        if not game or not game.reaction_active:
+            return False
+        if game.reaction_deadline_ts and game.reaction_deadline_ts > time.time():
+            # deadline was extended since the timer was armed
+            self.sync_timers(room_id)
+            return False
+        if game.reaction_deadline_ts:
+            metrics.REACTION_LAG.observe(max(0.0, time.time() - game.reaction_deadline_ts))
+        game.expire_reactions()
+        return True
+
+    def _expire_turn(self, room_id: str) -> bool:
         game = self.games.get(room_id)
+        if not game or not game.turn_deadline_ts:
+            return False
+        if game.turn_deadline_ts > time.time():
+            self.sync_timers(room_id)
+            return False
+        if game.expire_turn() is None:
+            return False
+        metrics.TURN_TIMEOUTS.inc()
+        return True
+
+    def set_format(self, websocket: WebSocket, codec: Codec) -> None:
+        """Switch the socket's outgoing wire format (negotiated in the hello handshake)."""
+        client = self.clients.get(websocket)
+        if client and client.outbox:
+            client.outbox.codec = codec
+
+    def resync(self, websocket: WebSocket) -> None:
+        """Client lost track of the state stream; send it a full snapshot."""
+        client = self.clients.get(websocket)
+        if not client or not client.room_id:
+            return
+        client.stream.reset()
+        game = self.games.get(client.room_id)
+        if game:
+            self._send_state(websocket, game, game.public_view or game.publish(self.clients))
+
+    def _send_state(self, websocket: WebSocket, game: 'GameState', public: SharedView) -> None:
+        client = self.clients.get(websocket)
+        if not client:
+            return
+        private = game.private_state(websocket)
+
+        # diffed against what this client last received when the writer gets to it,
+        # so an unsent older state superseded by this one never leaves a gap
+        def render(codec: Codec) -> Any:
+            start = time.perf_counter()
+            frame = client.stream.encode(public, private, codec)
+            metrics.ENCODE_SECONDS.observe(time.perf_counter() - start)
+            return frame
+        self.send(websocket, render, coalesce="state")
+
+    def broadcast_state(self, room_id: str) -> None:
+        game = self.games.get(room_id)
+        if game:
+            game.revision += 1
+        # every state change ends in a broadcast, so this is where timers follow the game
+        self.sync_timers(room_id)
         sockets = self.list_room_players(room_id)
         if not game or not sockets:
             return
-        for ws in sockets:
-            await ws.send_json({
-                "type": "state",
-                "payload": game.serialize_for(ws, self.clients, sockets),
-            })
+        with metrics.BROADCAST_SECONDS.time():
+            public = game.publish(self.clients)
+            for ws in sockets:
+                self._send_state(ws, game, public)
+        if self.bots is not None:
+            self.bots.drive(room_id)
 
 
 # Tile helpers
@@ -99,17 +438,15 @@ DRAGONS = ['DR', 'DG', 'DW']
 SEASONS = ['F1', 'F2', 'F3', 'F4','F5', 'F6', 'F7', 'F8']  # 春夏秋冬 菊兰梅竹(1..4)
 
 
-def build_wall() -> List[str]:
-    tiles: List[str] = []
-    for s in SUITS:
-        for n in NUMBERS:
-            tiles.extend([f"{s}{n}"] * 4)
-    for honor in WINDS + DRAGONS:
-        tiles.extend([honor] * 4)
+def build_wall(rng: Optional[random.Random] = None) -> List[int]:
+    """Shuffled wall as tile ids (see tiles.py); pass the hand's RNG to make it reproducible."""
+    tiles: List[int] = []
+    # suited tiles, winds and dragons: four each
+    for t in range(NUM_CORE):
+        tiles.extend([t] * 4)
     # Flowers/seasons: one each
-    for f in SEASONS:
-        tiles.append(f)
-    random.shuffle(tiles)
+    tiles.extend(range(SEASON_START, NUM_TILES))
+    (rng or random).shuffle(tiles)
     return tiles
 
 
@@ -151,39 +488,8 @@ def count_tiles(tiles: List[str]) -> Dict[str, int]:
     return counts
 
 def can_form_melds(counts: Dict[str, int]) -> bool:
-    # Remove zeros
-    tiles = [t for t, c in counts.items() if c > 0]
-    if not tiles:
-        return True
-    # pick smallest tile by sorting key
-    tiles.sort(key=tile_sort_key)
-    t0 = tiles[0]
-    # Try pong
-    if counts[t0] >= 3:
-        counts[t0] -= 3
-        if can_form_melds(counts):
-            counts[t0] += 3
-            return True
-        counts[t0] += 3
-    # Try chow for suited tiles
-    if not is_honor(t0):
-        suit = t0[0]
-        n = int(t0[1:])
-        t1 = f"{suit}{n+1}"
-        t2 = f"{suit}{n+2}"
-        if n <= 7 and counts.get(t1, 0) > 0 and counts.get(t2, 0) > 0:
-            counts[t0] -= 1
-            counts[t1] -= 1
-            counts[t2] -= 1
-            if can_form_melds(counts):
-                counts[t0] += 1
-                counts[t1] += 1
-                counts[t2] += 1
-                return True
-            counts[t0] += 1
-            counts[t1] += 1
-            counts[t2] += 1
-    return False
+    keys = wintable.encode(t for t, c in counts.items() for _ in range(c))
+    return keys is not None and wintable.is_complete(keys, pairs=0)
 
 def is_seven_pairs(tiles14: List[str], exposed_melds: List[dict] = None) -> bool:
     """Check if the hand is a valid Seven Pairs (七小对/七对子) hand."""
@@ -196,17 +502,10 @@ def is_seven_pairs(tiles14: List[str], exposed_melds: List[dict] = None) -> bool
     
     if len(core) != 14:
         return False
-        
-    counts = count_tiles(core)
-    pairs = 0
-    for count in counts.values():
-        if count == 2:
-            pairs += 1
-        elif count == 4:  # 两对相同的牌也可以
-            pairs += 2
-        else:
-            return False
-    return pairs == 7
+
+    # 14 张每种都是偶数张即七对（两对相同的牌也可以）
+    keys = wintable.encode(core)
+    return keys is not None and wintable.is_all_pairs(keys)
 
 def is_pure_suit(tiles: List[str], exposed_melds: List[dict] = None) -> bool:
     """Check if all tiles are of the same suit (清一色)."""
@@ -306,20 +605,16 @@ def can_win_hand(hand_tiles: List[str], exposed_melds: List[Dict] = None) -> boo
     exposed_melds: 已明牌（碰/杠/吃）
     """
     exposed = exposed_melds or []
-    if is_seven_pairs(hand_tiles, exposed):
-        raise True 
     # 已明牌固定，不拆分
-    fixed_tiles_count = sum(
-        len(meld['tiles']) if meld['type']=='chi' else 3 if meld['type']=='pong' else 4
-        for meld in exposed
-    )
-
-    total_tiles = len(hand_tiles) + fixed_tiles_count
-    if total_tiles != 14:
+    if len(hand_tiles) + sum(meld_size(m) for m in exposed) != 14:
         return False
-
-    # 仅对手牌尝试组合
-    return check_standard_hand(hand_tiles)
+    # 编码一次，七对和标准胡都查表（与 hand_can_win 相同：手里有花牌不能胡）
+    keys = wintable.encode(hand_tiles)
+    if keys is None:
+        return False
+    if not exposed and wintable.is_all_pairs(keys):
+        return True  # 七对
+    return wintable.is_complete(keys)
 
 def check_standard_hand(tiles: List[str]) -> bool:
     """
@@ -327,87 +622,34 @@ def check_standard_hand(tiles: List[str]) -> bool:
     例如：14张牌 -> 4面子+1将
            5张牌 -> 1面子+1将
            2张牌 -> 0面子+1将 (即一对将)
+    查表实现，见 wintable.py
     """
     if not tiles:
         return True
-    
+
     # 牌的数量必须是 3N + 2
     if len(tiles) % 3 != 2:
         return False
 
-    counts = Counter(tiles)
-    
-    # 遍历所有可能的“将” (Pair)
-    for tile, count in counts.items():
-        if count >= 2:
-            # 尝试将 tile 作为“将”
-            remaining_counts = counts.copy()
-            remaining_counts[tile] -= 2
-            
-            # 清理数量为0的键
-            if remaining_counts[tile] == 0:
-                del remaining_counts[tile]
-            
-            # 检查剩下的牌是否能组成 N 个面子
-            if can_form_melds_recursive(remaining_counts):
-                return True
-                
-    # 尝试了所有可能的“将”，都失败了
-    return False
+    keys = wintable.encode(tiles)
+    return keys is not None and wintable.is_complete(keys)
 
 def can_form_melds_recursive(counts: Counter) -> bool:
     """
-    【核心】递归回溯函数：
     检查一个 Counter 中的牌是否能拆解成 N 个面子 (刻子或顺子)。
-    这修复了你原先的“贪婪”Bug。
+    保留旧接口，内部改为查表。
     """
-    # Base Case: 没有任何牌了，说明成功拆分
-    if not counts:
-        return True
-
-    # 找出手上最小的一张牌开始尝试 (保证不重复、不遗漏)
-    first_tile = sorted(counts.keys())[0]
-
-    # --- 尝试 1：用这张牌组“刻子” (Pong) ---
-    if counts[first_tile] >= 3:
-        new_counts = counts.copy()
-        new_counts[first_tile] -= 3
-        if new_counts[first_tile] == 0:
-            del new_counts[first_tile]
-        
-        # 递归检查剩下的牌
-        if can_form_melds_recursive(new_counts):
-            return True
-        # 如果递归失败 (False)，没关系，我们会继续尝试下面的“顺子”
+    keys = wintable.encode(counts.elements())
+    return keys is not None and wintable.is_complete(keys, pairs=0)
 
-    # --- 尝试 2：用这张牌组“顺子” (Chow) ---
-    suit = first_tile[0]
-    num_str = first_tile[1:]
-    
-    if suit in 'BCD' and num_str.isdigit():
-        num = int(num_str)
-        if num <= 7: # 只有 1-7 可以作为顺子的开头
-            n1 = f"{suit}{num + 1}"
-            n2 = f"{suit}{num + 2}"
-            
-            # 检查是否有 n+1 和 n+2
-            if counts[n1] > 0 and counts[n2] > 0:
-                new_counts = counts.copy()
-                new_counts[first_tile] -= 1
-                new_counts[n1] -= 1
-                new_counts[n2] -= 1
-                
-                # 清理0计数的牌
-                new_counts = Counter({k: v for k, v in new_counts.items() if v > 0})
-                
-                # 递归检查剩下的牌
-                if can_form_melds_recursive(new_counts):
-                    return True
-
-    # --- 失败 ---
-    # 如果用 first_tile 组刻子和组顺子都无法让剩下的牌胡牌，
-    # 说明这个分支是死路，返回 False。
-    return False
+def seven_pairs_wait(hand13: List[str], exposed_melds: List[Dict] = None) -> Optional[str]:
+    """The single tile that would complete Seven Pairs, if any."""
+    if exposed_melds or len(hand13) != 13:
+        return None
+    odd = [t for t, c in count_tiles(hand13).items() if c % 2]
+    if len(odd) != 1 or odd[0] in SEASONS:
+        return None
+    return odd[0]
 
 # 返回可胡的牌
 def winning_tiles_for(hand13: List[str], exposed_melds: List[Dict] = None, all_tiles: List[str] = None) -> List[str]:
@@ -421,32 +663,112 @@ def winning_tiles_for(hand13: List[str], exposed_melds: List[Dict] = None, all_t
             f'{suit}{i}' for suit in 'BCD' for i in range(1, 10)
         ] + WINDS
 
-    wins = []
-    for tile in all_tiles:
-        if can_win_hand(hand13 + [tile], exposed_melds):
-            wins.append(tile)
-    return wins
+    exposed = exposed_melds or []
+    fixed_tiles_count = sum(
+        len(meld['tiles']) if meld['type']=='chi' else 3 if meld['type']=='pong' else 4
+        for meld in exposed
+    )
+    if len(hand13) + 1 + fixed_tiles_count != 14:
+        return []
+
+    wins = set(wintable.waits(hand13))
+    pair_wait = seven_pairs_wait(hand13, exposed)
+    if pair_wait:
+        wins.add(pair_wait)
+    return [tile for tile in all_tiles if tile in wins]
+
+# --- Integer-tile helpers used by GameState (hands are tiles.Hand, melds hold tile ids) ---
+_ODD = bytes(i & 1 for i in range(256))
+
+
+def meld_size(meld: dict) -> int:
+    return len(meld['tiles']) if meld['type'] == 'chi' else 3 if meld['type'] == 'pong' else 4
+
+
+def meld_json(meld: dict) -> dict:
+    """Meld with tile names, as sent to clients and used by the scoring helpers."""
+    if 'tiles' in meld:
+        return {'type': meld['type'], 'tiles': tile_names(meld['tiles'])}
+    return {'type': meld['type'], 'tile': tile_name(meld['tile'])}
+
+
+def action_json(action: dict) -> dict:
+    out = dict(action)
+    if 'tile' in out:
+        out['tile'] = tile_name(out['tile'])
+    if 'tiles' in out:
+        out['tiles'] = tile_names(out['tiles'])
+    return out
+
+
+def hand_can_win(hand: Hand, exposed_melds: List[dict]) -> bool:
+    """can_win_hand for a tiles.Hand."""
+    if hand.extra:
+        return False
+    if not exposed_melds and len(hand) == 14 and not hand.counts.translate(_ODD).count(1):
+        return True  # 七对
+    if len(hand) + sum(meld_size(m) for m in exposed_melds) != 14:
+        return False
+    return wintable.is_complete(hand.keys)
+
+
+def hand_waits(hand: Hand, exposed_melds: List[dict], discard: Optional[int] = None) -> List[int]:
+    """winning_tiles_for for a tiles.Hand, optionally after discarding ``discard`` first."""
+    keys = hand.keys
+    extra = hand.extra
+    size = len(hand)
+    if discard is not None:
+        size -= 1
+        if discard < NUM_CORE:
+            keys = list(keys)
+            keys[TILE_GROUP[discard]] -= TILE_WEIGHT[discard]
+        else:
+            extra -= 1
+    if extra or size + 1 + sum(meld_size(m) for m in exposed_melds) != 14:
+        return []
+    wins = wintable.wait_indices(keys)
+    if not exposed_melds:
+        counts = hand.counts
+        if discard is not None:
+            counts = bytearray(counts)
+            counts[discard] -= 1
+        parity = counts.translate(_ODD)
+        if parity.count(1) == 1:
+            odd = parity.index(1)
+            if odd not in wins:
+                wins.append(odd)
+                wins.sort()
+    # dragons are bonus tiles and never completed a hand
+    return [t for t in wins if t < DRAGON_START]
+
+
+# claim priority within a reaction window (ties go to the seat nearest the discarder)
+CLAIM_RANK = {"self-win": 5, "win": 4, "kong": 3, "pong": 2, "chi": 1, "pass": 0}
+
 
 @dataclass
 class GameState:
     started: bool = False
-    wall: Deque[str] = field(default_factory=deque)
+    wall: Wall = field(default_factory=Wall)
     turn_index: int = 0
     player_order: List[WebSocket] = field(default_factory=list)
-    hands: Dict[WebSocket, List[str]] = field(default_factory=dict)
+    hands: Dict[WebSocket, Hand] = field(default_factory=dict)
     expects_discard: bool = False
-    discard_piles: Dict[WebSocket, List[str]] = field(default_factory=dict)
-    bonus_piles: Dict[WebSocket, List[str]] = field(default_factory=dict)
-    exposed_melds: Dict[WebSocket, List[dict]] = field(default_factory=dict)  # stores melds like {'type': 'pong', 'tile': 'B1'} or {'type': 'chi', 'tiles': ['B1', 'B2', 'B3']}
+    discard_piles: Dict[WebSocket, bytearray] = field(default_factory=dict)
+    bonus_piles: Dict[WebSocket, bytearray] = field(default_factory=dict)
+    exposed_melds: Dict[WebSocket, List[dict]] = field(default_factory=dict)  # stores melds like {'type': 'pong', 'tile': 0} or {'type': 'chi', 'tiles': [0, 1, 2]} (tile ids)
     scores: Dict[WebSocket, int] = field(default_factory=dict)
-    last_discard: Optional[Tuple[WebSocket, str]] = None
+    last_discard: Optional[Tuple[WebSocket, int]] = None
     reaction_active: bool = False
     reaction_deadline_ts: float = 0.0
-    reaction_actions: Dict[WebSocket, List[dict]] = field(default_factory=dict)
+    reaction_seconds: float = REACTION_SECONDS
+    # what each seat may claim in the open window, worked out when it opened; see offer_reactions()
+    reaction_actions: Dict[WebSocket, Tuple[dict, ...]] = field(default_factory=dict)
     reaction_claims: Dict[WebSocket, dict] = field(default_factory=dict)
-    reaction_task: Optional[asyncio.Task] = None
+    # seats with something other than pass on offer, in claim priority order; the window waits only on them
+    reaction_eligible: List[WebSocket] = field(default_factory=list)
     ting_flags: Dict[WebSocket, bool] = field(default_factory=dict)
-    last_drawn: Dict[WebSocket, Optional[str]] = field(default_factory=dict)
+    last_drawn: Dict[WebSocket, Optional[int]] = field(default_factory=dict)
     ting_pending: Dict[WebSocket, bool] = field(default_factory=dict)
     dice_values: List[int] = field(default_factory=list)  # 存储骰子值
     score_multiplier: int = 1  # 当前局分数翻倍倍数
@@ -455,10 +777,29 @@ class GameState:
     game_count: int = 0  # 游戏局数
     waiting_for_dice: bool = False  # 是否在等待骰子
     dice_roller: Optional[WebSocket] = None  # 当前应该掷骰子的玩家
+    # per-player (hand fingerprint, {discard or None: waits}); see waits_after()
+    wait_cache: Dict[WebSocket, Tuple[tuple, Dict[Optional[int], List[int]]]] = field(default_factory=dict)
+    # latest encoded public view, shared by every seat's state stream; see publish()
+    public_view: Optional[SharedView] = None
+    public_version: int = 0
+    # every hand has its own seeded RNG and action log; see handlog.py
+    rng: random.Random = field(default_factory=random.Random)
+    hand_count: int = 0
+    log: Optional[HandLog] = None
+    # called with (log, event) after each recorded event, e.g. EventLog.game_listener()
+    listener: Optional[Callable[[HandLog, tuple], None]] = None
+    # turn clock, armed by sync_turn_clock() for the seat to discard; 0 deadline: not running
+    turn_seconds: float = TURN_SECONDS
+    time_bank_seconds: float = TIME_BANK
+    time_banks: Dict[WebSocket, float] = field(default_factory=dict)
+    turn_started_ts: float = 0.0
+    turn_deadline_ts: float = 0.0
+    # bumped on every flushed change and rebind; snapshot.py re-encodes only rooms whose revision moved
+    revision: int = 0
 
     def roll_dice(self) -> List[int]:
         """Roll two dice."""
-        return [random.randint(1, 6) for _ in range(2)]
+        return [self.rng.randint(1, 6) for _ in range(2)]
 
     def calculate_dice_multiplier(self, dice_values: List[int]) -> Tuple[int, int]:
         """Calculate score multipliers based on dice values.
@@ -475,7 +816,16 @@ class GameState:
         
         return current_multiplier, next_multiplier
 
-    def start(self, sockets: List[WebSocket]) -> None:
+    def seat_of(self, ws: WebSocket) -> int:
+        return self.player_order.index(ws)
+
+    def record(self, *event: Any) -> None:
+        if self.log is not None:
+            self.log.add(*event)
+            if self.listener is not None:
+                self.listener(self.log, event)
+
+    def start(self, sockets: List[WebSocket], seed: Optional[int] = None) -> None:
         if self.started or not sockets:  # 如果游戏已经开始或没有玩家，直接返回
             return
             
@@ -486,25 +836,39 @@ class GameState:
             # 第一局时初始化分数
             self.scores = {ws: 0 for ws in self.player_order}
             # 第一局自动掷骰子并开始
-            self.dice_values = self.roll_dice()
-            current_mult, next_mult = self.calculate_dice_multiplier(self.dice_values)
-            self.score_multiplier = current_mult
-            self.next_game_multiplier = next_mult
-            self._start_game()
+            self.begin_hand(seed)
         # 其他局不在这里处理，由玩家通过 roll_dice 命令开始新局
-            
+
+    def begin_hand(self, seed: Optional[int] = None) -> None:
+        """Seed a fresh RNG for the hand, open its log, roll the dice and deal."""
+        seed = new_seed() if seed is None else seed
+        self.rng = random.Random(seed)
+        self.hand_count += 1
+        dealer = self.player_order.index(self.last_winner) if self.last_winner in self.player_order else 0
+        self.log = HandLog(seed=seed, hand=self.hand_count, seats=len(self.player_order), dealer=dealer,
+                           multiplier=self.score_multiplier,
+                           scores=[self.scores.get(ws, 0) for ws in self.player_order])
+        self.dice_values = self.roll_dice()
+        self.record("r", *self.dice_values)
+        current_mult, next_mult = self.calculate_dice_multiplier(self.dice_values)
+        # score_multiplier still holds what the previous hand passed on (1 on the first hand)
+        self.score_multiplier = current_mult * self.score_multiplier
+        self.next_game_multiplier = next_mult
+        self._start_game()
+
     def _start_game(self) -> None:
         """真正开始游戏的内部方法"""
         # 重置所有游戏状态
         self.started = True
-        self.wall = deque(build_wall())
-        self.hands = {ws: [] for ws in self.player_order}
-        self.bonus_piles = {ws: [] for ws in self.player_order}
+        self.wall = Wall(build_wall(self.rng))
+        self.hands = {ws: Hand() for ws in self.player_order}
+        self.bonus_piles = {ws: bytearray() for ws in self.player_order}
         self.ting_flags = {ws: False for ws in self.player_order}
         self.last_drawn = {ws: None for ws in self.player_order}
         self.ting_pending = {ws: False for ws in self.player_order}
         self.exposed_melds = {ws: [] for ws in self.player_order}
-        self.discard_piles = {ws: [] for ws in self.player_order}
+        self.discard_piles = {ws: bytearray() for ws in self.player_order}
+        self.wait_cache = {}
         self.waiting_for_dice = False
         self.dice_roller = None
         self.last_discard = None
@@ -512,6 +876,9 @@ class GameState:
         self.reaction_deadline_ts = 0.0
         self.reaction_actions = {}
         self.reaction_claims = {}
+        self.reaction_eligible = []
+        self.time_banks = {ws: self.time_bank_seconds for ws in self.player_order}
+        self.turn_deadline_ts = 0.0
         
         # deal 13 tiles to each player
         for _ in range(13):
@@ -521,7 +888,7 @@ class GameState:
                     self.process_bonus_chain(ws)
         # sort hands
         for ws in self.player_order:
-            self.hands[ws].sort(key=tile_sort_key)
+            self.hands[ws].sort()
             
         # 设置第一个出牌的玩家（上一局赢家或默认第一个）
         if self.last_winner and self.last_winner in self.player_order:
@@ -533,69 +900,161 @@ class GameState:
         self.auto_draw_current()
         self.expects_discard = True
 
-    def draw_for(self, ws: WebSocket) -> Optional[str]:
+    def draw_for(self, ws: WebSocket) -> Optional[int]:
         if not self.started or ws not in self.player_order:
             return None
         if not self.wall:
             return None
+        self.record("m", self.seat_of(ws))
         tile = self.draw_from_tail()
         # append newly drawn tile to the end (do not sort)
-        self.hands.setdefault(ws, []).append(tile)
+        self.hands.setdefault(ws, Hand()).append(tile)
         self.last_drawn[ws] = tile
         # process bonus and supplements from head
         self.process_bonus_chain(ws)
+        self.invalidate_waits(ws)
+        self.record("w", self.seat_of(ws), self.last_drawn[ws])
         # advance turn to next player
         return tile
 
-    def auto_draw_current(self) -> Optional[str]:
+    def auto_draw_current(self) -> Optional[int]:
         if not self.started or not self.player_order:
             return None
         current = self.player_order[self.turn_index]
         if not self.wall:
+            self._draw_game()
             return None
         tile = self.draw_from_tail()
         # append newly drawn tile to the end (do not sort)
-        self.hands.setdefault(current, []).append(tile)
+        self.hands.setdefault(current, Hand()).append(tile)
         self.last_drawn[current] = tile
         # process bonus and supplements from head
         self.process_bonus_chain(current)
+        self.invalidate_waits(current)
+        self.record("w", self.turn_index, self.last_drawn[current])
+        if self.wall_exhausted(current):
+            # the wall ran out during the bonus replacements: the hand is a tile short
+            self._draw_game()
+            return None
         
         # Check for self-drawn win (自摸)
         if self.can_win_on_self_draw(current):
             self.reaction_active = True
             self.expects_discard = False
             self.reaction_actions = {
-                current: [{"id": f"self-win", "type": "self-win", "tile": tile}]
+                current: ({"id": "self-win", "type": "self-win", "tile": tile}, {"id": "pass", "type": "pass"})
             }
-            self.reaction_deadline_ts = time.time() + 5.0
+            self.reaction_eligible = [current]
+            self.reaction_deadline_ts = time.time() + self.reaction_seconds
         else:
             self.expects_discard = True
             
         return tile
         
+    def wall_exhausted(self, ws: WebSocket) -> bool:
+        """The wall is empty and ``ws`` is a tile short of a hand to discard from."""
+        held = len(self.hands.get(ws, ())) + 3 * len(self.exposed_melds.get(ws, []))
+        return not self.wall and held % 3 != 2
+
     def can_win_on_self_draw(self, ws: WebSocket) -> bool:
         """Check if the current player can win with their just-drawn tile."""
         # Only check if in Ting state
         if not self.ting_flags.get(ws, False):
             return False
             
-        hand = self.hands.get(ws, [])
-        exposed = list(self.exposed_melds.get(ws, []))
-        return can_win_hand(hand, exposed)
+        hand = self.hands.get(ws)
+        if hand is None:
+            return False
+        return hand_can_win(hand, self.exposed_melds.get(ws, []))
+
+    def _hand_fingerprint(self, ws: WebSocket) -> tuple:
+        hand = self.hands.get(ws) or Hand()
+        fixed = sum(meld_size(m) for m in self.exposed_melds.get(ws, []))
+        return (*hand.keys, hand.extra, len(hand), fixed)
+
+    def invalidate_waits(self, ws: WebSocket) -> None:
+        """Drop cached waits after the hand changed (draw, discard or claim)."""
+        self.wait_cache.pop(ws, None)
+
+    def waits_after(self, ws: WebSocket, discard: Optional[int] = None) -> List[int]:
+        """Winning tiles for ``ws``'s hand, optionally after discarding ``discard``.
+
+        Results are cached per player until the hand changes; the fingerprint
+        check also catches hands mutated without going through invalidate_waits.
+        """
+        fp = self._hand_fingerprint(ws)
+        entry = self.wait_cache.get(ws)
+        if entry is None or entry[0] != fp:
+            entry = (fp, {})
+            self.wait_cache[ws] = entry
+        cached = entry[1]
+        if discard not in cached:
+            hand = self.hands.get(ws) or Hand()
+            start = time.perf_counter()
+            cached[discard] = hand_waits(hand, self.exposed_melds.get(ws, []), discard=discard)
+            metrics.WAIT_SECONDS.observe(time.perf_counter() - start)
+            metrics.WAIT_MISSES.inc()
+        else:
+            metrics.WAIT_HITS.inc()
+        return cached[discard]
+
+    def ting_discards(self, ws: WebSocket) -> Dict[int, List[int]]:
+        """discard -> waits for every tile whose discard leaves ``ws`` in Ting."""
+        hand = self.hands.get(ws) or Hand()
+        out: Dict[int, List[int]] = {}
+        for t in dict.fromkeys(hand):
+            waits = self.waits_after(ws, t)
+            if waits:
+                out[t] = waits
+        return out
+
+    def visible_counts(self) -> bytearray:
+        """Copies of each tile every seat can see: all discards and exposed melds."""
+        seen = bytearray(NUM_TILES)
+        for pile in self.discard_piles.values():
+            for t in pile:
+                seen[t] += 1
+        for melds in self.exposed_melds.values():
+            for meld in melds:
+                if 'tiles' in meld:
+                    for t in meld['tiles']:
+                        seen[t] += 1
+                else:
+                    seen[meld['tile']] += meld_size(meld)
+        return seen
+
+    def hint_for(self, ws: WebSocket) -> dict:
+        """Answer to a ``hint`` message: shanten and ukeire for ``ws`` (per discard on a 3n+2 hand)
+        and the shanten toward each scored pattern. Live counts leave out what is already visible."""
+        hand = self.hands.get(ws) or Hand()
+        exposed = self.exposed_melds.get(ws, [])
+        visible = self.visible_counts()
+        out = {"patterns": shanten.breakdown(hand, exposed)}
+        if len(hand) % 3 == 2:
+            out["shanten"] = shanten.shanten(hand, exposed)
+            out["discards"] = [
+                {"tile": tile_name(t), "shanten": u.shanten,
+                 "ukeire": {tile_name(k): n for k, n in u.tiles.items()}, "total": u.total}
+                for t, u in shanten.discard_options(hand, exposed, visible)
+            ]
+        else:
+            u = shanten.ukeire(hand, exposed, visible)
+            out.update({"shanten": u.shanten, "ukeire": {tile_name(k): n for k, n in u.tiles.items()}, "total": u.total})
+        return out
 
-    def draw_from_tail(self) -> str:
+    def draw_from_tail(self) -> int:
         return self.wall.pop()
 
-    def draw_from_head(self) -> str:
+    def draw_from_head(self) -> int:
         return self.wall.popleft()
 
-    def is_bonus_tile(self, tile: str) -> bool:
+    def is_bonus_tile(self, tile: int) -> bool:
         """Check if a tile is a bonus tile.
         Bonus tiles include:
         - Seasons (F1-F4: Spring, Summer, Autumn, Winter)
         - Dragons (DR, DG, DW: Red, Green, White)
         """
-        return tile in SEASONS or tile in { 'DR', 'DG', 'DW' }
+        return is_bonus(tile)
 
     def process_bonus_chain(self, ws: WebSocket) -> None:
         """Process bonus tiles in a player's hand.
@@ -608,7 +1067,7 @@ class GameState:
         """
         while self.hands.get(ws) and self.is_bonus_tile(self.hands[ws][-1]):
             bonus = self.hands[ws].pop()
-            self.bonus_piles.setdefault(ws, []).append(bonus)
+            self.bonus_piles.setdefault(ws, bytearray()).append(bonus)
             if not self.wall:
                 break
             # Draw replacement from wall head
@@ -619,10 +1078,13 @@ class GameState:
     def can_discard(self, ws: WebSocket) -> bool:
         return self.started and self.player_order and self.player_order[self.turn_index] is ws and self.expects_discard
 
-    def discard(self, ws: WebSocket, tile: str) -> bool:
+    def discard(self, ws: WebSocket, tile: int, auto: bool = False) -> bool:
+        """``auto``: discarded by the turn clock (see expire_turn), logged as such."""
         if not self.can_discard(ws):
             return False
-        hand = self.hands.get(ws, [])
+        hand = self.hands.get(ws)
+        if hand is None:
+            return False
         # If player declared Ting, they must discard the last drawn tile
         if self.ting_flags.get(ws, False):
             must = self.last_drawn.get(ws)
@@ -632,20 +1094,20 @@ class GameState:
             self.last_drawn[ws] = None
         # If player is pending Ting declaration, validate that discarding this tile leaves tenpai
         if self.ting_pending.get(ws, False):
-            trial = list(hand)
-            if tile not in trial:
+            if tile not in hand:
                 return False
-            trial.remove(tile)
-            exposed = list(self.exposed_melds.get(ws, []))
-            if len(winning_tiles_for(trial, exposed)) == 0:
+            if not self.waits_after(ws, tile):
                 return False
         if tile not in hand:
             return False
         hand.remove(tile)
         # sort the player's hand after discarding
-        hand.sort(key=tile_sort_key)
-        self.discard_piles.setdefault(ws, []).append(tile)
+        hand.sort()
+        self.discard_piles.setdefault(ws, bytearray()).append(tile)
+        self.invalidate_waits(ws)
         self.last_discard = (ws, tile)
+        self.record("x", self.seat_of(ws), tile, *((1,) if auto else ()))
+        self.stop_turn_clock(ws)
         # Commit Ting status if pending
         if self.ting_pending.get(ws, False):
             self.ting_flags[ws] = True
@@ -654,6 +1116,80 @@ class GameState:
         self.start_reactions()
         return True
 
+    def declare_ting(self, ws: WebSocket) -> bool:
+        """Mark Ting pending; it is committed by the next discard (which must leave tenpai)."""
+        # only on your own turn when expecting discard
+        if not (self.started and self.player_order and self.player_order[self.turn_index] is ws and self.expects_discard):
+            return False
+        self.record("t", self.seat_of(ws))
+        self.ting_pending[ws] = True
+        return True
+
+    def cancel_ting(self, ws: WebSocket) -> bool:
+        if ws not in self.ting_pending:
+            return False
+        self.record("c", self.seat_of(ws))
+        self.ting_pending[ws] = False
+        return True
+
+    def sync_turn_clock(self, now: float) -> None:
+        """Start the clock for the seat that has to discard, or clear it if nobody has to."""
+        if not (self.turn_seconds > 0 and self.started and self.expects_discard and not self.reaction_active
+                and self.player_order):
+            self.turn_deadline_ts = 0.0
+            return
+        if self.turn_deadline_ts:
+            return
+        ws = self.player_order[self.turn_index]
+        self.turn_started_ts = now
+        self.turn_deadline_ts = now + self.turn_seconds + self.time_banks.get(ws, self.time_bank_seconds)
+
+    def stop_turn_clock(self, ws: WebSocket) -> None:
+        """``ws`` discarded: whatever it took beyond turn_seconds comes out of its time bank."""
+        if not self.turn_deadline_ts:
+            return
+        over = time.time() - self.turn_started_ts - self.turn_seconds
+        if over > 0:
+            self.time_banks[ws] = max(0.0, self.time_banks.get(ws, self.time_bank_seconds) - over)
+        self.turn_deadline_ts = 0.0
+
+    def auto_discard_tile(self, ws: WebSocket) -> Optional[int]:
+        """What the turn clock discards for ``ws``: the drawn tile unless another one keeps the hand closer to winning."""
+        hand = self.hands.get(ws)
+        if not hand:
+            return None
+        drawn = self.last_drawn.get(ws)
+        if self.ting_flags.get(ws, False):
+            return drawn
+        if self.ting_pending.get(ws, False):
+            # only a discard that leaves tenpai commits the pending Ting
+            options = {t: 0 for t in dict.fromkeys(hand) if self.waits_after(ws, t)}
+        else:
+            options = shanten.discard_shanten(hand, self.exposed_melds.get(ws, []))
+        if not options:
+            return None
+        best = min(options.values())
+        if drawn in options and options[drawn] == best:
+            return drawn
+        return min(t for t, v in options.items() if v == best)
+
+    def expire_turn(self) -> Optional[int]:
+        """The turn clock ran out: discard for the seat to move; the tile, or None if it had no turn."""
+        if not (self.started and self.player_order):
+            return None
+        ws = self.player_order[self.turn_index]
+        if not self.can_discard(ws):
+            return None
+        self.time_banks[ws] = 0.0
+        self.turn_deadline_ts = 0.0
+        tile = self.auto_discard_tile(ws)
+        if tile is None and self.ting_pending.get(ws, False):
+            self.cancel_ting(ws)
+            tile = self.auto_discard_tile(ws)
+        if tile is None or not self.discard(ws, tile, auto=True):
+            return None
+        return tile
+
     def start_reactions(self) -> None:
         self.reaction_active = True
         self.expects_discard = False
@@ -664,73 +1200,84 @@ class GameState:
         if not self.last_discard:
             return
         from_ws, tile = self.last_discard
-        has_possible_reactions = False
-        
-        for ws in self.player_order:
-            if ws is from_ws:
-                continue
-            actions = self.compute_actions_for(ws)
-            if actions and not all(a['type'] == 'pass' for a in actions):
-                has_possible_reactions = True
-                break
+        self.offer_reactions()
         
         # 只在有人可以吃碰时设置等待时间
-        if has_possible_reactions:
-            self.reaction_deadline_ts = time.time() + 5.0
+        if self.reaction_eligible:
+            self.reaction_deadline_ts = time.time() + self.reaction_seconds
         else:
             # 没人可以吃碰，立即进入下一回合
             self.turn_index = (self.player_order.index(from_ws) + 1) % len(self.player_order)
-            self.auto_draw_current()
-            self.expects_discard = True
+            # clear first: the draw may open a self-win window of its own
             self.clear_reactions()
-            
-        if self.reaction_task and not self.reaction_task.done():
-            self.reaction_task.cancel()
+            self.expects_discard = True
+            self.auto_draw_current()
 
-    def compute_actions_for(self, ws: WebSocket) -> List[dict]:
-        actions: List[dict] = []
+    def offer_reactions(self) -> None:
+        """Work out every seat's options on the last discard, once per window.
+
+        The window serves them from reaction_actions (state, claim
+        validation, resolution) until it closes; nothing it reads changes
+        in between.
+        """
+        from_ws, _ = self.last_discard
+        self.reaction_actions = {}
+        # nearest to the discarder first, which is also the claim priority
+        for ws in self.seating_priority(self.player_order, from_ws):
+            actions = self.legal_reactions(ws)
+            if actions:
+                self.reaction_actions[ws] = actions
+        # only these seats are waited on
+        self.reaction_eligible = [ws for ws, actions in self.reaction_actions.items()
+                                  if any(a['type'] != 'pass' for a in actions)]
+
+    def compute_actions_for(self, ws: WebSocket) -> Tuple[dict, ...]:
+        """Reactions on offer to ``ws`` in the open window (shared; do not modify)."""
         if not self.reaction_active:
-            return actions
+            return ()
+        return self.reaction_actions.get(ws, ())
 
-        # If there's no last_discard, this is a self-draw reaction window.
-        # Use precomputed reaction_actions (e.g. self-win) if present.
+    def legal_reactions(self, ws: WebSocket) -> Tuple[dict, ...]:
+        """What ``ws`` may claim on the last discard, computed afresh (see offer_reactions)."""
+        actions: List[dict] = []
         if not self.last_discard:
-            return list(self.reaction_actions.get(ws, []))
-
+            return ()
         from_ws, tile = self.last_discard
         if ws is from_ws:
-            return actions
+            return ()
             
-        hand = self.hands.get(ws, [])
+        hand = self.hands.get(ws)
+        if hand is None:
+            return ()
         # Check if player is in Ting state
         is_ting = self.ting_flags.get(ws, False)
+        name = tile_name(tile)
             
         # Only allow winning action if in Ting state
         if is_ting:
-            exposed = list(self.exposed_melds.get(ws, []))
-            if can_win_hand(hand + [tile], exposed):
-                actions.append({"id": f"win-{tile}", "type": "win", "tile": tile})
-            return actions  # No other actions allowed when in Ting
+            if tile in self.waits_after(ws):
+                actions.append({"id": f"win-{name}", "type": "win", "tile": tile})
+            return tuple(actions)  # No other actions allowed when in Ting
             
         # If not in Ting, allow normal actions
         count = hand.count(tile)
         # Pong
         if count >= 2:
-            actions.append({"id": f"pong-{tile}", "type": "pong", "tiles": [tile, tile]})
-        # Kong (melded)
-        if count >= 3:
-            actions.append({"id": f"kong-{tile}", "type": "kong", "tiles": [tile, tile, tile]})
+            actions.append({"id": f"pong-{name}", "type": "pong", "tiles": [tile, tile]})
+        # Kong (melded); not once the wall is empty, there is no replacement to draw
+        if count >= 3 and self.wall:
+            actions.append({"id": f"kong-{name}", "type": "kong", "tiles": [tile, tile, tile]})
         # Chi only for next player and suited sequences
         if self.is_suited(tile) and self.next_player_is(ws, from_ws):
             for needed in self.chi_options(tile):
                 if all(x in hand for x in needed):
-                    actions.append({"id": f"chi-{'-'.join(needed)}", "type": "chi", "tiles": needed})
+                    actions.append({"id": f"chi-{'-'.join(tile_names(needed))}", "type": "chi", "tiles": needed})
         if actions:
             actions.append({"id": "pass", "type": "pass"})
-        return actions
+        return tuple(actions)
 
-    def is_suited(self, tile: str) -> bool:
-        return len(tile) >= 2 and tile[0] in SUITS and tile[1:].isdigit()
+    def is_suited(self, tile: int) -> bool:
+        return is_suited(tile)
 
     def next_player_is(self, ws: WebSocket, from_ws: WebSocket) -> bool:
         if from_ws not in self.player_order:
@@ -739,12 +1286,11 @@ class GameState:
         nxt = self.player_order[(idx + 1) % len(self.player_order)]
         return ws is nxt
 
-    def chi_options(self, tile: str) -> List[List[str]]:
+    def chi_options(self, tile: int) -> List[List[int]]:
         # Given a suited tile, return possible pairs needed to form a sequence with tile
-        suit = tile[0]
-        n = int(tile[1:])
-        opts: List[List[str]] = []
-        def t(x: int) -> str: return f"{suit}{x}"
+        n = rank_of(tile)
+        opts: List[List[int]] = []
+        def t(x: int) -> int: return tile + x - n
         # (n-2, n-1, n)
         if n-2 >= 1:
             opts.append([t(n-2), t(n-1)])
@@ -763,22 +1309,23 @@ class GameState:
         # Start with base score 10
         score = 0
         
-        hand = self.hands.get(ws, [])
-        exposed = list(self.exposed_melds.get(ws, []))
+        hand = tile_names(self.hands.get(ws, ()))
+        melds = self.exposed_melds.get(ws, [])
+        exposed = [meld_json(m) for m in melds]
         
         # Add bonus points from flowers/seasons
         bonus_count = len(self.bonus_piles.get(ws, []))
         score += bonus_count
         
         # Add bonus points from special melds
-        for meld in exposed:
+        for meld in melds:
             if meld['type'] == 'pong':
                 # Pong of winds gives +1
-                if meld['tile'] in WINDS:
+                if is_wind(meld['tile']):
                     score += 1
             elif meld['type'] == 'kong':
                 # Kong of winds gives +2, kong of regular tiles gives +1
-                if meld['tile'] in WINDS:
+                if is_wind(meld['tile']):
                     score += 2
                 else:
                     score += 1
@@ -816,10 +1363,31 @@ class GameState:
                 order.append(ws)
         return order
 
+    def _claim_key(self, ws: WebSocket, claim_type: str) -> Tuple[int, int]:
+        """Orders claims: by type, then by seat (nearest to the discarder first)."""
+        order = self.reaction_eligible.index(ws) if ws in self.reaction_eligible else len(self.player_order)
+        return CLAIM_RANK.get(claim_type, 0), -order
+
+    def reaction_settled(self) -> bool:
+        """Whether the window can resolve: the deadline passed, or no seat yet to answer could beat the best claim."""
+        if self.reaction_deadline_ts is not None and time.time() >= self.reaction_deadline_ts:
+            return True
+        best = max((self._claim_key(ws, c["type"]) for ws, c in self.reaction_claims.items()), default=(0, 0))
+        for ws in self.reaction_eligible:
+            if ws in self.reaction_claims:
+                continue
+            top = max((CLAIM_RANK.get(a["type"], 0) for a in self.compute_actions_for(ws)), default=0)
+            if (top, self._claim_key(ws, "pass")[1]) > best:
+                return False
+        return True
+
     def resolve_reactions(self) -> Optional[str]:
         # Returns action type resolved or None
         if not self.reaction_active:
             return None
+        # still waiting on a seat whose answer could win the discard
+        if not self.reaction_settled():
+            return None
             
         # Group claims by type priority: self-win > win > kong > pong > chi > pass
         claims_by_type: Dict[str, List[WebSocket]] = {
@@ -827,6 +1395,8 @@ class GameState:
         }
         for ws, claim in self.reaction_claims.items():
             claims_by_type.get(claim["type"], claims_by_type["pass"]).append(ws)
+        for claimers in claims_by_type.values():
+            claimers.sort(key=lambda ws: self._claim_key(ws, "pass"), reverse=True)
             
         # Handle self-win (自摸)
         if claims_by_type["self-win"]:
@@ -850,6 +1420,7 @@ class GameState:
                     # Winner gets score from each player
                     self.scores[winner] = self.scores.get(winner, 0) + final_score
             
+            metrics.HANDS_FINISHED.labels("self-win").inc()
             self._end_game(winner)
             return "self-win"
             
@@ -872,9 +1443,7 @@ class GameState:
             self.scores[from_ws] = self.scores.get(from_ws, 0) - final_score
             
             # End game and prepare for next round
-            print("[END_GAME] scores:", {str(k): v for k,v in self.scores.items()})
-            for i, ws in enumerate(self.player_order):
-                print(f"player {i}: , score={self.scores.get(ws, 'N/A')}")
+            metrics.HANDS_FINISHED.labels("win").inc()
             self._end_game(winner)
             return "win"
             
@@ -889,31 +1458,28 @@ class GameState:
                     self.clear_reactions()
                     return action_type
                     
-            # No winning claims; if deadline passed or all passed, proceed
-            all_targets = [ws for ws in self.player_order if ws is not from_ws]
-            if time.time() >= self.reaction_deadline_ts or set(self.reaction_claims.keys()) == set(all_targets):
-                # normal flow: next player draws and discard expected already handled in flow
-                self.turn_index = (self.player_order.index(from_ws) + 1) % len(self.player_order)
-                self.auto_draw_current()
-                self.expects_discard = True
-                self.clear_reactions()
-                return None
-        elif time.time() >= self.reaction_deadline_ts:
-            # For self-draw reactions, just clear and continue if no action taken
-            self.expects_discard = True
+            # Only passes: every eligible seat passed, or the deadline ran out
+            # normal flow: next player draws and discard expected already handled in flow
+            self.turn_index = (self.player_order.index(from_ws) + 1) % len(self.player_order)
+            # clear first: the draw may open a self-win window of its own
             self.clear_reactions()
+            self.expects_discard = True
+            self.auto_draw_current()
             return None
-            
+        # Self-draw window passed on (or timed out): the drawer discards
+        self.expects_discard = True
+        self.clear_reactions()
         return None
 
-    def apply_claim(self, ws: WebSocket, action_type: str, tile: str, tiles: Optional[List[str]]) -> None:
+    def apply_claim(self, ws: WebSocket, action_type: str, tile: int, tiles: Optional[List[int]]) -> None:
         # Remove claimed tile from discarder discard pile (take back)
         if self.last_discard:
             discarder, t = self.last_discard
-            pile = self.discard_piles.get(discarder, [])
+            pile = self.discard_piles.get(discarder)
             if pile and pile[-1] == t:
                 pile.pop()
-        hand = self.hands.get(ws, [])
+        hand = self.hands.setdefault(ws, Hand())
+        self.invalidate_waits(ws)
         
         # Initialize exposed melds for the player if not exists
         if ws not in self.exposed_melds:
@@ -923,7 +1489,7 @@ class GameState:
             # remove two tiles
             for _ in range(2):
                 hand.remove(tile)
-            hand.sort(key=tile_sort_key)
+            hand.sort()
             self.turn_index = self.player_order.index(ws)
             self.expects_discard = True
             # Record the pong meld
@@ -932,7 +1498,7 @@ class GameState:
         elif action_type == 'kong':
             for _ in range(3):
                 hand.remove(tile)
-            hand.sort(key=tile_sort_key)
+            hand.sort()
             self.turn_index = self.player_order.index(ws)
             # supplement draw after kong from head
             if self.wall:
@@ -946,20 +1512,61 @@ class GameState:
             need = tiles or []
             for x in need:
                 hand.remove(x)
-            hand.sort(key=tile_sort_key)
+            hand.sort()
             self.turn_index = self.player_order.index(ws)
             self.expects_discard = True
             # Record the chi meld with sequence
-            self.exposed_melds[ws].append({'type': 'chi', 'tiles': sorted([tile] + need, key=tile_sort_key)})
+            self.exposed_melds[ws].append({'type': 'chi', 'tiles': sorted([tile] + list(need))})
+        self.invalidate_waits(ws)
+        if action_type == 'kong' and self.wall_exhausted(ws):
+            # the kong replacement ran into bonus tiles until the wall was empty
+            self._draw_game()
+
+    def submit_claim(self, ws: WebSocket, claim_id: str, expired: Optional[bool] = None) -> Optional[dict]:
+        """Take the offered reaction ``claim_id`` and resolve; None if it is not on offer.
+
+        ``expired`` says whether the claim came in after the window's deadline;
+        it is read from the clock unless given (replay passes the logged value).
+        """
+        if not self.reaction_active:
+            return None
+        chosen = next((a for a in self.compute_actions_for(ws) if a.get("id") == claim_id), None)
+        if chosen is None:
+            return None
+        if expired is None:
+            expired = bool(self.reaction_deadline_ts) and time.time() >= self.reaction_deadline_ts
+        self.record("k", self.seat_of(ws), claim_id, *((1,) if expired else ()))
+        self.reaction_claims[ws] = chosen
+        if expired:
+            self.reaction_deadline_ts = 0.0
+        # resolves as soon as nobody still to answer could outrank the claims so far
+        self.resolve_reactions()
+        return chosen
+
+    def expire_reactions(self) -> Optional[str]:
+        """The reaction window's deadline passed: resolve with the claims made so far."""
+        if not self.reaction_active:
+            return None
+        self.record("o")
+        self.reaction_deadline_ts = 0.0
+        return self.resolve_reactions()
 
     def clear_reactions(self) -> None:
         self.reaction_active = False
         self.reaction_actions = {}
         self.reaction_claims = {}
+        self.reaction_eligible = []
         self.last_discard = None
 
-    def _end_game(self, winner: WebSocket) -> None:
-        """游戏结束时的清理和设置"""
+    def _draw_game(self) -> None:
+        """流局：牌墙摸完无人胡牌，庄家连庄，由庄家掷下一局的骰子"""
+        dealer = self.player_order[self.log.dealer] if self.log is not None else self.player_order[0]
+        metrics.HANDS_FINISHED.labels("draw").inc()
+        self._end_game(dealer, "d")
+
+    def _end_game(self, winner: WebSocket, kind: str = "e") -> None:
+        """游戏结束时的清理和设置; ``kind`` "d" is a drawn hand, ``winner`` then the dealer who keeps the deal"""
+        self.record(kind, self.seat_of(winner), *(self.scores.get(ws, 0) for ws in self.player_order))
         # 记录赢家和设置下一局的倍数
         self.last_winner = winner
         self.score_multiplier = self.next_game_multiplier
@@ -972,13 +1579,15 @@ class GameState:
         self.ting_flags = {}            # 玩家是否已经听牌
         self.ting_pending = {}          # 玩家听牌待确认
         self.last_drawn = {}            # 玩家最后摸的牌
+        self.wait_cache = {}            # 听牌缓存
         self.last_discard = None        # 最后一次出牌
-        self.wall = self.wall or []     # 牌墙，如果有花牌要清空
+        self.wall = self.wall or Wall()  # 牌墙，如果有花牌要清空
         self.flowers = {}               # 如果有花牌，清空花牌信息
         self.expects_discard = False
         self.reaction_active = False
         self.reaction_claims = {}
         self.reaction_deadline_ts = None
+        self.turn_deadline_ts = 0.0
 
         # 设置等待下一局的掷骰子状态
         self.waiting_for_dice = True
@@ -987,57 +1596,64 @@ class GameState:
         # 清除其他游戏状态
         self.clear_reactions()
 
-    def serialize_for(self, recipient: WebSocket, clients: Dict[WebSocket, Client], sockets: List[WebSocket]) -> dict:
-        # Rotate seating so recipient is index 0 (bottom), then right, top, left
-        if recipient in self.player_order:
-            idx = self.player_order.index(recipient)
-        else:
-            idx = 0
-        rotated = self.player_order[idx:] + self.player_order[:idx]
+    @staticmethod
+    def seat_name(ws: Any, clients: Dict[WebSocket, Client]) -> Optional[str]:
+        if isinstance(ws, Vacant):
+            return ws.name
+        client = clients.get(ws)
+        return client.name if client else None
+
+    def rebind(self, old: Any, new: Any) -> None:
+        """Move seat ``old`` (a socket or Vacant) to ``new``; position, hand, score and claims all stay."""
+        self.player_order = [new if ws is old else ws for ws in self.player_order]
+        for attr in ('hands', 'discard_piles', 'bonus_piles', 'exposed_melds', 'scores', 'reaction_actions',
+                     'reaction_claims', 'ting_flags', 'last_drawn', 'ting_pending', 'wait_cache', 'time_banks'):
+            table = getattr(self, attr)
+            if old in table:
+                # rebuilt rather than popped: claim resolution depends on insertion order
+                setattr(self, attr, {(new if k is old else k): v for k, v in table.items()})
+        self.reaction_eligible = [new if ws is old else ws for ws in self.reaction_eligible]
+        if self.last_discard and self.last_discard[0] is old:
+            self.last_discard = (new, self.last_discard[1])
+        if self.last_winner is old:
+            self.last_winner = new
+        if self.dice_roller is old:
+            self.dice_roller = new
+        self.revision += 1
+
+    def public_state(self, clients: Dict[WebSocket, Client]) -> dict:
+        """Table state every seat sees, in absolute seat order (the client rotates it).
+
+        Tile lists are bytes of tile ids; the wire codec turns them into names
+        or packed bytes (see wire.py).
+        """
+        current = self.player_order[self.turn_index] if self.player_order else None
         players = []
-        for i, ws in enumerate(rotated):
+        discards_by_player: List[dict] = []
+        for i, ws in enumerate(self.player_order):
+            name = self.seat_name(ws, clients) or f"player{i+1}"
             players.append({
-                "name": clients.get(ws, Client(ws)).name or f"player{i+1}",
-                "index": i,
-                "handCount": len(self.hands.get(ws, [])) if ws != recipient else len(self.hands.get(ws, [])),
-                "you": ws == recipient,
-                "turn": self.player_order[self.turn_index] is ws,
+                "name": name,
+                "handCount": len(self.hands.get(ws, ())),
+                "turn": current is ws,
                 "score": self.scores.get(ws, 0),
-                "bonusTiles": list(self.bonus_piles.get(ws, [])),
+                "bonusTiles": bytes(self.bonus_piles.get(ws, b"")),
                 "ting": self.ting_flags.get(ws, False),
-                "exposedMelds": list(self.exposed_melds.get(ws, [])),
+                "bot": isinstance(ws, Vacant) and bool(ws.bot),
+                "timeBank": round(self.time_banks.get(ws, 0.0), 1),
+                "exposedMelds": [meld_json(m) for m in self.exposed_melds.get(ws, [])],
             })
-        you_hand = self.hands.get(recipient, [])
-        # build per-player discards in seating order (rotated)
-        discards_by_player: List[dict] = []
-        for i, ws in enumerate(rotated):
             discards_by_player.append({
-                "index": i,
-                "name": clients.get(ws, Client(ws)).name or f"player{i+1}",
-                "tiles": list(self.discard_piles.get(ws, [])),
+                "name": name,
+                "tiles": bytes(self.discard_piles.get(ws, b"")),
             })
-        your_actions = []
-        if self.reaction_active:
-            your_actions = self.compute_actions_for(recipient)
-        # canTing indicator and list of discardable tiles to enter Ting
-        can_ting = False
-        ting_discardables: List[str] = []
-        if self.started and self.player_order and self.player_order[self.turn_index] is recipient and self.expects_discard and not self.ting_flags.get(recipient, False):
-            hand = list(self.hands.get(recipient, []))
-            exposed = list(self.exposed_melds.get(recipient, []))
-            for t in list(dict.fromkeys(hand)):
-                trial = list(hand)
-                trial.remove(t)
-                if len(winning_tiles_for(trial, exposed)) > 0:
-                    can_ting = True
-                    ting_discardables.append(t)
 
         # 获取掷骰子玩家信息
         dice_roller_info = None
         if self.dice_roller:
-            client = clients.get(self.dice_roller)
-            if client:
-                dice_roller_info = {"name": client.name}
+            name = self.seat_name(self.dice_roller, clients)
+            if name is not None or self.dice_roller in clients:
+                dice_roller_info = {"name": name}
 
         return {
             "started": self.started,
@@ -1046,14 +1662,10 @@ class GameState:
             "expectsDiscard": self.expects_discard,
             "reactionActive": self.reaction_active,
             "reactionDeadlineTs": self.reaction_deadline_ts,
+            "turnDeadlineTs": self.turn_deadline_ts,
             "players": players,
-            "yourHand": you_hand,
             "discardsByPlayer": discards_by_player,
-            "yourActions": your_actions,
-            "canTing": can_ting,
-            "yourTingPending": self.ting_pending.get(recipient, False),
-            "tingDiscardables": ting_discardables if self.ting_pending.get(recipient, False) else [],
-            "diceValues": self.dice_values,  # 添加骰子值
+            "diceValues": list(self.dice_values),  # 添加骰子值
             "scoreMultiplier": self.score_multiplier,  # 当前局分数倍数
             "nextGameMultiplier": self.next_game_multiplier,  # 下一局分数倍数
             "waitingForDice": self.waiting_for_dice,  # 是否在等待掷骰子
@@ -1061,6 +1673,76 @@ class GameState:
             "gameCount": self.game_count,  # 添加游戏局数
         }
 
+    def private_state(self, recipient: WebSocket) -> dict:
+        """The per-seat overlay merged into the public view by the client."""
+        seat = self.player_order.index(recipient) if recipient in self.player_order else -1
+        your_actions = []
+        if self.reaction_active:
+            your_actions = [action_json(a) for a in self.compute_actions_for(recipient)]
+        # canTing indicator and list of discardable tiles to enter Ting
+        can_ting = False
+        ting_discardables = b""
+        if self.started and seat >= 0 and seat == self.turn_index and self.expects_discard and not self.ting_flags.get(recipient, False):
+            options = self.ting_discards(recipient)
+            can_ting = bool(options)
+            ting_discardables = bytes(options)
+        ting_pending = self.ting_pending.get(recipient, False)
+        return {
+            "seat": seat,
+            "yourHand": bytes(self.hands.get(recipient, ())),
+            "yourActions": your_actions,
+            "canTing": can_ting,
+            "yourTingPending": ting_pending,
+            "tingDiscardables": ting_discardables if ting_pending else b"",
+        }
+
+    def publish(self, clients: Dict[WebSocket, Client]) -> SharedView:
+        """Build and encode the public view once for this state change."""
+        with metrics.PUBLISH_SECONDS.time():
+            self.public_version += 1
+            self.public_view = SharedView(self.public_version, self.public_state(clients), self.public_view)
+        return self.public_view
+
+    @classmethod
+    def replay(cls, log: HandLog, upto: Optional[int] = None) -> 'GameState':
+        """Rebuild the table after the first ``upto`` events of ``log`` (the whole hand by default).
+
+        Seats are the ints 0..seats-1.  Draws and the end marker are
+        regenerated by the input before them; ValueError if they disagree
+        with the log.
+        """
+        game = cls()
+        game.started = True
+        game.player_order = list(range(log.seats))
+        game.scores = dict(enumerate(log.scores))
+        game.score_multiplier = log.multiplier
+        game.hand_count = log.hand - 1
+        game.last_winner = log.dealer
+        game.begin_hand(log.seed)
+        events = [tuple(e) for e in log.events[:upto]]
+        for event in events:
+            kind, args = event[0], event[1:]
+            if kind == "m":
+                game.draw_for(args[0])
+            elif kind == "t":
+                game.declare_ting(args[0])
+            elif kind == "c":
+                game.cancel_ting(args[0])
+            elif kind == "x":
+                if len(args) > 2 and args[2]:
+                    game.expire_turn()
+                else:
+                    game.discard(args[0], args[1])
+            elif kind == "k":
+                game.submit_claim(args[0], args[1], expired=len(args) > 2 and bool(args[2]))
+            elif kind == "o":
+                game.expire_reactions()
+        produced = game.log.events[:len(events)]
+        if produced != events:
+            at = next((i for i, (a, b) in enumerate(zip(produced, events)) if a != b), len(produced))
+            raise ValueError(f"replay diverged at event {at}: got {produced[at:at + 1]}, logged {events[at:at + 1]}")
+        return game
+
 
 room_manager = RoomManager()
 
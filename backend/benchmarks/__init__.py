@@ -0,0 +1 @@
+"""Micro and macro benchmarks; run with ``python -m benchmarks.run`` from backend/."""
@@ -0,0 +1,90 @@
+"""
+Benchmark inputs, generated by seeded self-play (app/simulate.py) so every
+run measures the same hands and tables.
+
+- hands: what a seat holds right after each draw (14 tiles counting exposed
+  melds), as the tile-name lists of the legacy helpers and as engine Hands
+- tables: copies of the GameState early, midway and late in a hand (at
+  10%, 50% and 90% of its draws, with the drawing seat to discard)
+"""
+from __future__ import annotations
+
+import copy
+import itertools
+import random
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+
+from app.bots import make_policy
+from app.handlog import HandLog
+from app.simulate import SEATS, play_hand
+from app.tiles import Hand, tile_names
+from app.ws import GameState, meld_json
+
+PHASES = {"early": 0.1, "middle": 0.5, "late": 0.9}
+
+
+@dataclass
+class HandSample:
+    names14: List[str]          # drawn hand, names (can_win_hand, is_seven_pairs)
+    names13: List[str]          # same without the drawn tile (winning_tiles_for)
+    exposed: List[dict]         # exposed melds as json, for the name helpers
+    hand: Hand                  # engine form (hand_can_win, hand_waits)
+    melds: List[dict]           # engine form of the exposed melds
+    drawn: int
+
+
+@dataclass
+class Corpus:
+    seed: int
+    hands: List[HandSample] = field(default_factory=list)
+    tables: Dict[str, List[GameState]] = field(default_factory=dict)
+
+
+def build(games: int = 40, seed: int = 1000, max_hands: int = 2000) -> Corpus:
+    """Play ``games`` hands with shanten bots; keep up to ``max_hands`` drawn hands and their tables."""
+    corpus = Corpus(seed=seed)
+    policies = [make_policy("shanten", random.Random()) for _ in SEATS]
+
+    def play(s: int, on_draw: Callable[[GameState, int, int], None]) -> GameState:
+        game = GameState()
+        draws = itertools.count()
+
+        def listener(log: HandLog, event: tuple) -> None:
+            # called right after the draw is applied (bonus tiles already replaced)
+            if event[0] == "w":
+                on_draw(game, event[1], next(draws))
+
+        game.listener = listener
+        play_hand(s, policies, game=game)
+        game.listener = None
+        return game
+
+    def keep_hand(game: GameState, seat: int, n: int) -> None:
+        hand = game.hands.get(seat)
+        drawn = game.last_drawn.get(seat)
+        if len(corpus.hands) >= max_hands or hand is None or drawn is None or drawn not in hand:
+            return
+        rest = Hand(hand)
+        rest.remove(drawn)
+        melds = [dict(m) for m in game.exposed_melds.get(seat, [])]
+        corpus.hands.append(HandSample(
+            names14=tile_names(hand), names13=tile_names(rest),
+            exposed=[meld_json(m) for m in melds], hand=Hand(hand), melds=melds, drawn=drawn,
+        ))
+
+    for s in range(seed, seed + games):
+        total = sum(1 for e in play(s, keep_hand).log.events if e[0] == "w")
+        if total < 8:
+            continue
+        # same seed and reseeded bots: the second run is the same hand, copied at the chosen draws
+        wanted = {int(at * (total - 1)): phase for phase, at in PHASES.items()}
+
+        def keep_table(game: GameState, seat: int, n: int) -> None:
+            if n in wanted:
+                table = copy.deepcopy(game)
+                table.listener = None
+                corpus.tables.setdefault(wanted[n], []).append(table)
+
+        play(s, keep_table)
+    return corpus
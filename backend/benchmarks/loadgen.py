@@ -0,0 +1,246 @@
+"""
+WebSocket load generator: N tables of four scripted clients against /ws.
+
+    cd backend
+    uvicorn app.main:app --port 8000 &
+    python -m benchmarks.loadgen --tables 250 --duration 60 --ramp 200
+
+Each client connects, negotiates a wire format, joins its table's room and
+plays whatever is legal from the state it is sent (``yourHand``,
+``yourActions``, ``canTing``, ``expectsDiscard``, the dice roller): it
+declares Ting whenever it is offered (as the simulator's bots do) and then
+discards one of ``tingDiscardables``, after that always the drawn tile;
+otherwise it discards a random tile on its turn.  It takes a win when
+offered and otherwise claims or passes at random, and rolls the dice when it
+is its turn to.
+
+Reported at the end: action-to-state latency (from sending a command to
+the next state or state_patch frame on the same connection) as
+p50/p90/p99/max, frames per second by type in both directions, hands
+played, and server errors and dropped connections.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import secrets
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+
+import websockets
+
+from app.statediff import apply
+from app.wire import CODECS, JSON
+
+RECV_POLL = 1.0  # seconds; how often an idle client checks whether its table moved on
+
+
+@dataclass
+class Stats:
+    sent: Counter = field(default_factory=Counter)
+    received: Counter = field(default_factory=Counter)
+    errors: Counter = field(default_factory=Counter)
+    latencies: List[float] = field(default_factory=list)
+    connected: int = 0
+    failed: int = 0
+    dropped: int = 0
+    hands: int = 0
+    resyncs: int = 0
+
+
+class Table:
+    """The four clients of one table and the room they play in."""
+
+    def __init__(self, prefix: str, index: int) -> None:
+        self.index = index
+        self.room_id = f"{prefix}-{index}"
+        self.joined = 0
+
+
+class Client:
+    def __init__(self, table: Table, seat: int, url: str, fmt: str, stats: Stats, rng: random.Random) -> None:
+        self.table = table
+        self.name = f"t{table.index}s{seat}"
+        self.url = url
+        self.codec = CODECS[fmt]
+        self.stats = stats
+        self.rng = rng
+        self.ws: Any = None
+        self.negotiated = False
+        self.public: Optional[dict] = None
+        self.private: Optional[dict] = None
+        self.version: Optional[int] = None
+        self.sent_at: Optional[float] = None   # command awaiting its state
+        self.answered: Optional[tuple] = None  # reaction window already answered
+
+    async def send(self, msg_type: str, payload: Optional[dict] = None, action: bool = False) -> None:
+        message = {"type": msg_type, "payload": payload or {}}
+        # text frames are always JSON; binary ones only once the server agreed on MessagePack
+        frame = self.codec.encode(message) if self.negotiated and self.codec is not JSON else JSON.encode(message)
+        await self.ws.send(frame)
+        self.stats.sent[msg_type] += 1
+        if action:
+            self.sent_at = time.perf_counter()
+
+    async def run(self, deadline: float) -> None:
+        try:
+            self.ws = await websockets.connect(self.url, max_size=None, open_timeout=30)
+        except Exception as e:
+            self.stats.failed += 1
+            self.stats.errors[f"connect: {type(e).__name__}"] += 1
+            return
+        self.stats.connected += 1
+        try:
+            await self.send("hello", {"formats": [self.codec.name]})
+            await self.send("join", {"roomId": self.table.room_id, "name": self.name})
+            while time.monotonic() < deadline:
+                try:
+                    frame = await asyncio.wait_for(self.ws.recv(), RECV_POLL)
+                except asyncio.TimeoutError:
+                    continue
+                await self.on_message(self.codec.decode(frame) if isinstance(frame, bytes) else json.loads(frame))
+        except websockets.ConnectionClosed:
+            self.stats.dropped += 1
+        finally:
+            await self.ws.close()
+
+    async def on_message(self, message: dict) -> None:
+        msg_type = message.get("type")
+        payload = message.get("payload") or {}
+        self.stats.received[msg_type] += 1
+        if msg_type == "format":
+            self.negotiated = payload.get("format") == self.codec.name
+        elif msg_type == "joined":
+            self.table.joined += 1
+            if self.table.joined == 4:
+                await self.send("start", {"roomId": self.table.room_id}, action=True)
+        elif msg_type == "error":
+            self.stats.errors[str(payload.get("message"))] += 1
+            self.sent_at = None
+            await self.act()
+        elif msg_type == "state":
+            self.version = payload["stateVersion"]
+            self.public, self.private = payload["public"], payload["private"]
+            await self.on_state()
+        elif msg_type == "state_patch":
+            if self.public is None or payload["baseVersion"] != self.version:
+                self.stats.resyncs += 1
+                self.public = None
+                await self.send("resync")
+                return
+            self.public = apply(self.public, payload["public"])
+            self.private = apply(self.private, payload["private"])
+            self.version = payload["version"]
+            await self.on_state()
+
+    async def on_state(self) -> None:
+        if self.sent_at is not None:
+            self.stats.latencies.append(time.perf_counter() - self.sent_at)
+            self.sent_at = None
+        await self.act()
+
+    async def act(self) -> None:
+        pub, priv = self.public, self.private
+        if pub is None or priv is None or self.sent_at is not None:
+            return
+        room = self.table.room_id
+        actions = priv.get("yourActions") or []
+        if not actions:
+            self.answered = None
+        seat = priv.get("seat", -1)
+        if pub.get("waitingForDice"):
+            roller = pub.get("diceRoller") or {}
+            if roller.get("name") == self.name:
+                self.stats.hands += 1
+                await self.send("roll_dice", {"roomId": room}, action=True)
+        elif actions:
+            # a window is identified by the table position; ids alone repeat (e.g. "pass")
+            discarded = sum(len(d.get("tiles") or ()) for d in pub.get("discardsByPlayer") or ())
+            key = (pub.get("wallCount"), discarded, tuple(a.get("id") for a in actions))
+            if key == self.answered:
+                return
+            self.answered = key
+            wins = [a for a in actions if a.get("type") in ("win", "self-win")]
+            choice = wins[0] if wins else self.rng.choice(actions)
+            await self.send("claim", {"roomId": room, "claim": {"id": choice["id"]}}, action=True)
+        elif pub.get("started") and pub.get("expectsDiscard") and not pub.get("reactionActive") and pub.get("turnIndex") == seat:
+            await self.take_turn(room, pub, priv, seat)
+
+    async def take_turn(self, room: str, pub: dict, priv: dict, seat: int) -> None:
+        hand = priv.get("yourHand") or []
+        players = pub.get("players") or []
+        if not hand:
+            return
+        if 0 <= seat < len(players) and players[seat].get("ting"):
+            # in Ting only the drawn tile (kept last in the hand) may go
+            await self.send("discard", {"roomId": room, "tile": hand[-1]}, action=True)
+        elif priv.get("yourTingPending") and priv.get("tingDiscardables"):
+            await self.send("discard", {"roomId": room, "tile": self.rng.choice(priv["tingDiscardables"])}, action=True)
+        elif priv.get("canTing"):
+            await self.send("ting", {"roomId": room}, action=True)
+        else:
+            await self.send("discard", {"roomId": room, "tile": self.rng.choice(hand)}, action=True)
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def report(stats: Stats, elapsed: float, clients: int) -> str:
+    ms = lambda v: f"{v * 1000:.1f}ms"
+    lat = stats.latencies
+    lines = [
+        f"clients: {clients}  connected: {stats.connected}  failed: {stats.failed}  dropped: {stats.dropped}",
+        f"elapsed: {elapsed:.1f}s  hands: {stats.hands}  resyncs: {stats.resyncs}",
+        f"action->state latency ({len(lat)} samples): p50 {ms(percentile(lat, 50))}  p90 {ms(percentile(lat, 90))}"
+        f"  p99 {ms(percentile(lat, 99))}  max {ms(max(lat, default=0.0))}",
+        f"sent {sum(stats.sent.values()) / elapsed:.0f}/s: "
+        + ", ".join(f"{k} {v / elapsed:.1f}" for k, v in stats.sent.most_common()),
+        f"received {sum(stats.received.values()) / elapsed:.0f}/s: "
+        + ", ".join(f"{k} {v / elapsed:.1f}" for k, v in stats.received.most_common()),
+    ]
+    if stats.errors:
+        lines.append("errors: " + ", ".join(f"{k} x{v}" for k, v in stats.errors.most_common(10)))
+    return "\n".join(lines)
+
+
+async def run(url: str, tables: int, duration: float, ramp: float, fmt: str, seed: int) -> str:
+    stats = Stats()
+    rng = random.Random(seed)
+    prefix = f"load-{secrets.token_hex(3)}"  # fresh rooms on every run against the same server
+    start = time.monotonic()
+    deadline = start + duration
+    tasks = []
+    for t in range(tables):
+        table = Table(prefix, t)
+        for seat in range(4):
+            client = Client(table, seat, url, fmt, stats, random.Random(rng.getrandbits(32)))
+            tasks.append(asyncio.ensure_future(client.run(deadline)))
+            if ramp > 0:
+                await asyncio.sleep(1 / ramp)  # connections per second
+    await asyncio.gather(*tasks)
+    return report(stats, time.monotonic() - start, tables * 4)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Shanghai Mahjong WebSocket load generator")
+    parser.add_argument("--url", default="ws://127.0.0.1:8000/ws")
+    parser.add_argument("--tables", type=int, default=25, help="tables of four connections")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds, ramp-up included")
+    parser.add_argument("--ramp", type=float, default=100.0, help="new connections per second (0: all at once)")
+    parser.add_argument("--format", choices=sorted(CODECS), default="json")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    print(asyncio.run(run(args.url, args.tables, args.duration, args.ramp, args.format, args.seed)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,279 @@
+"""
+Benchmark runner.
+
+    cd backend
+    python -m benchmarks.run                          # all, saved to benchmarks/results/
+    python -m benchmarks.run -k serialize --quick
+    python -m benchmarks.run --compare benchmarks/results/<older>.json
+
+Every benchmark is one pass over its corpus (see corpus.py), repeated until
+a round takes ``--min-time``; results are per item (per hand, per table,
+per broadcast) in microseconds, best and median of ``--rounds`` rounds.
+With --compare, a benchmark whose best time grew by more than
+``--threshold`` counts as a regression and the exit status is 1.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import copy
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.simulate import run_chunk
+from app.statediff import StateStream
+from app.wire import JSON, MSGPACK
+from app.ws import GameState, RoomManager, can_win_hand, hand_can_win, hand_waits, is_seven_pairs, winning_tiles_for
+from tests.support import FakeSocket, cancel_tasks
+
+from . import corpus as corpus_mod
+from .corpus import Corpus
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+FORMAT = 1
+
+# name -> (build(corpus) -> (one pass, items per pass[, cleanup]))
+Bench = Callable[[Corpus], Tuple[Callable[[], Any], int]]
+BENCHMARKS: Dict[str, Bench] = {}
+
+
+def benchmark(name: str) -> Callable[[Bench], Bench]:
+    def register(fn: Bench) -> Bench:
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+# --- rule engine ---
+
+@benchmark("rules/can_win_hand")
+def _can_win_hand(c: Corpus):
+    hands = [(h.names14, h.exposed) for h in c.hands]
+    return lambda: [can_win_hand(t, e) for t, e in hands], len(hands)
+
+
+@benchmark("rules/winning_tiles_for")
+def _winning_tiles_for(c: Corpus):
+    hands = [(h.names13, h.exposed) for h in c.hands]
+    return lambda: [winning_tiles_for(t, e) for t, e in hands], len(hands)
+
+
+@benchmark("rules/is_seven_pairs")
+def _is_seven_pairs(c: Corpus):
+    hands = [(h.names14, h.exposed) for h in c.hands]
+    return lambda: [is_seven_pairs(t, e) for t, e in hands], len(hands)
+
+
+@benchmark("rules/hand_can_win")
+def _hand_can_win(c: Corpus):
+    hands = [(h.hand, h.melds) for h in c.hands]
+    return lambda: [hand_can_win(t, m) for t, m in hands], len(hands)
+
+
+@benchmark("rules/hand_waits")
+def _hand_waits(c: Corpus):
+    hands = [(h.hand, h.melds, h.drawn) for h in c.hands]
+    return lambda: [hand_waits(t, m, discard=d) for t, m, d in hands], len(hands)
+
+
+@benchmark("rules/calculate_score")
+def _calculate_score(c: Corpus):
+    seats = [(g, ws) for phase in ("middle", "late") for g in c.tables[phase] for ws in g.player_order]
+    return lambda: [g.calculate_score(ws) for g, ws in seats], len(seats)
+
+
+@benchmark("rules/offer_reactions")
+def _offer_reactions(c: Corpus):
+    # the seat to move discards its drawn tile; copies, as this leaves a window open on each table
+    tables = []
+    for g in (copy.deepcopy(g) for phase in ("middle", "late") for g in c.tables[phase]):
+        ws = g.player_order[g.turn_index]
+        g.last_discard, g.reaction_active = (ws, g.last_drawn.get(ws)), True
+        if g.last_discard[1] is not None:
+            tables.append(g)
+    return lambda: [g.offer_reactions() for g in tables], len(tables)
+
+
+# --- serialization: the public view once, then a full state per seat ---
+
+def _serialize(phase: str, codec: Any) -> Bench:
+    def build(c: Corpus):
+        tables = c.tables[phase]
+
+        def run() -> None:
+            for game in tables:
+                # a state change: the seat to move has a new hand, so its Ting options are recomputed
+                game.invalidate_waits(game.player_order[game.turn_index])
+                public = game.publish({})
+                for ws in game.player_order:
+                    StateStream().encode(public, game.private_state(ws), codec)
+        return run, len(tables)
+    return build
+
+
+for _phase in corpus_mod.PHASES:
+    for _codec in (JSON, MSGPACK):
+        benchmark(f"serialize/{_phase}/{_codec.name}")(_serialize(_phase, _codec))
+
+
+# --- broadcast_state through the real outboxes, to sockets that discard what they get ---
+
+def _broadcast(phase: str) -> Bench:
+    def build(c: Corpus):
+        loop = asyncio.new_event_loop()
+        rooms: List[Tuple[RoomManager, GameState]] = []
+
+        async def setup() -> None:
+            for table in c.tables[phase]:
+                manager = RoomManager()
+                sockets = [FakeSocket(keep=False) for _ in table.player_order]
+                game = copy.deepcopy(table)  # rebinding seats must not touch the shared corpus
+                for seat, ws in zip(list(game.player_order), sockets):
+                    await manager.connect(ws)
+                    game.rebind(seat, ws)
+                    manager.join_room(ws, "bench", f"p{seat}")
+                manager.games["bench"] = game
+                rooms.append((manager, game))
+
+        async def one_pass() -> None:
+            for manager, game in rooms:
+                # fresh snapshots for every seat, as after a join or reconnect
+                for client in manager.clients.values():
+                    client.stream.reset()
+                manager.broadcast_state("bench")
+            while any(cl.outbox.pending for m, _ in rooms for cl in m.clients.values()):
+                await asyncio.sleep(0)
+
+        def close() -> None:
+            loop.run_until_complete(cancel_tasks())  # outbox writers and timer tasks
+            loop.close()
+
+        loop.run_until_complete(setup())
+        return (lambda: loop.run_until_complete(one_pass())), len(rooms), close
+    return build
+
+
+for _phase in corpus_mod.PHASES:
+    benchmark(f"broadcast/{_phase}")(_broadcast(_phase))
+
+
+# --- macro: whole self-play hands ---
+
+@benchmark("selfplay/hand")
+def _selfplay(c: Corpus):
+    seeds = list(range(c.seed, c.seed + 50))
+    return lambda: run_chunk(seeds, ["shanten"] * 4), len(seeds)
+
+
+# --- runner ---
+
+def measure(run: Callable[[], Any], items: int, rounds: int, min_time: float) -> Dict[str, Any]:
+    run()  # warm-up (caches, lazily built tables)
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        loops *= 2 if elapsed < min_time / 4 else 1 + int(min_time / max(elapsed, 1e-9))
+    times = [elapsed]
+    for _ in range(rounds - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        times.append(time.perf_counter() - start)
+    per_item = [t / loops / items * 1e6 for t in times]
+    return {"best_us": round(min(per_item), 3), "median_us": round(statistics.median(per_item), 3),
+            "items": items, "loops": loops, "rounds": rounds}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(__file__), timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Print old/new per benchmark; returns the names that got slower than ``threshold``."""
+    regressions = []
+    print(f"\n{'benchmark':32} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in current["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if old is None:
+            print(f"{name:32} {'-':>12} {result['best_us']:>12.2f}")
+            continue
+        change = result["best_us"] / old["best_us"] - 1 if old["best_us"] else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:32} {old['best_us']:>12.2f} {result['best_us']:>12.2f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Shanghai Mahjong benchmarks")
+    parser.add_argument("-k", dest="filter", default="", help="only benchmarks whose name contains this")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per round")
+    parser.add_argument("--quick", action="store_true", help="3 short rounds, for a smoke run")
+    parser.add_argument("--out", help="result file (default: benchmarks/results/<date>-<commit>.json)")
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--compare", help="baseline result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown counted as a regression")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.rounds, args.min_time = 3, 0.05
+
+    names = [n for n in BENCHMARKS if args.filter in n]
+    if not names:
+        parser.error(f"no benchmark matches {args.filter!r}")
+    c = corpus_mod.build()
+    print(f"corpus: {len(c.hands)} hands, {sum(len(t) for t in c.tables.values())} tables")
+
+    commit = git_commit()
+    doc = {
+        "format": FORMAT,
+        "commit": commit,
+        "date": datetime.datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}",
+        "results": {},
+    }
+    for name in names:
+        run, items, *cleanup = BENCHMARKS[name](c)
+        result = measure(run, items, args.rounds, args.min_time)
+        for close in cleanup:
+            close()
+        doc["results"][name] = result
+        print(f"{name:32} {result['best_us']:>12.2f} us  (median {result['median_us']:.2f}, {items} items)")
+
+    if not args.no_save:
+        path = args.out or os.path.join(RESULTS_DIR, f"{doc['date'][:10]}-{commit or 'unknown'}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(doc, f, indent=2)
+        print(f"saved {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(doc, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
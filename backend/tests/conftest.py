@@ -0,0 +1,16 @@
+"""Fixtures over tests/support.py: fake sockets and an event loop that cleans up after itself."""
+import pytest
+
+from tests import support
+
+
+@pytest.fixture
+def fake_socket():
+    """Factory for FakeSocket (keyword arguments as in support.FakeSocket)."""
+    return support.FakeSocket
+
+
+@pytest.fixture
+def run():
+    """run(scenario): await ``scenario()`` on a fresh loop, cancelling leftover tasks afterwards."""
+    return support.run
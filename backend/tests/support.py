@@ -0,0 +1,126 @@
+"""Helpers shared by the tests (through conftest.py fixtures) and the benchmarks."""
+import asyncio
+import random
+from typing import Any, Awaitable, Callable, List
+
+from app.tiles import Hand
+from app.ws import GameState, RoomManager
+
+SEATS = [0, 1, 2, 3]
+MAX_STEPS = 500
+
+
+class FakeSocket:
+    """Stands in for a WebSocket: keeps the frames it is sent (``keep=False``: only counts them).
+
+    With ``fail`` set every send raises, like a connection that went away.
+    """
+
+    def __init__(self, keep: bool = True, fail: bool = False) -> None:
+        self.keep = keep
+        self.fail = fail
+        self.frames: List[Any] = []
+        self.sent = 0
+        self.bytes = 0
+        self.closed = False
+
+    async def accept(self) -> None:
+        pass
+
+    async def send_text(self, data: str) -> None:
+        self._got(data)
+
+    async def send_bytes(self, data: bytes) -> None:
+        self._got(data)
+
+    async def close(self, code: int = 1000) -> None:
+        self.closed = True
+
+    def _got(self, data: Any) -> None:
+        if self.fail:
+            raise ConnectionError("gone")
+        self.sent += 1
+        self.bytes += len(data)
+        if self.keep:
+            self.frames.append(data)
+
+
+async def cancel_tasks() -> None:
+    """Cancel whatever the code under test left running (outbox writers, timers, actors)."""
+    tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def run(scenario: Callable[[], Awaitable[Any]]) -> None:
+    """Run ``scenario()`` on a fresh event loop, then cancel the tasks it left behind."""
+    async def main() -> None:
+        try:
+            await scenario()
+        finally:
+            await cancel_tasks()
+    asyncio.run(main())
+
+
+async def settle(rounds: int = 20) -> None:
+    """Let queued tasks (actors, outbox writers, the bus) run."""
+    for _ in range(rounds):
+        await asyncio.sleep(0)
+
+
+async def seated_table(manager: RoomManager, room_id: str = "r") -> List[FakeSocket]:
+    """Four connected players with ids id0..id3 seated in ``room_id``, game started."""
+    sockets = [FakeSocket() for _ in range(4)]
+    for i, ws in enumerate(sockets):
+        await manager.connect(ws)
+        assert manager.join_room(ws, room_id, f"p{i}", player_id=f"id{i}")
+    manager.get_or_create_game(room_id).start(sockets)
+    return sockets
+
+
+def table_view(game: GameState) -> dict:
+    """Everything a replay has to reproduce; hands compare by tiles (Hand.__eq__), in any display order."""
+    return {
+        "hands": {seat: Hand(hand) for seat, hand in game.hands.items()},
+        "discards": {seat: list(pile) for seat, pile in game.discard_piles.items()},
+        "melds": {seat: [dict(m) for m in melds] for seat, melds in game.exposed_melds.items()},
+        "bonus": {seat: list(pile) for seat, pile in game.bonus_piles.items()},
+        "scores": dict(game.scores),
+        "wall": list(game.wall),
+        "turn": game.turn_index,
+        "expects_discard": game.expects_discard,
+        "reaction": game.reaction_active,
+        "actions": {seat: list(actions) for seat, actions in game.reaction_actions.items()},
+        "claims": dict(game.reaction_claims),
+        "ting": dict(game.ting_flags),
+        "ting_pending": dict(game.ting_pending),
+        "waiting_for_dice": game.waiting_for_dice,
+        # until the hand ends this is the previous hand's winner, which the log keeps as the dealer
+        "winner": game.last_winner if game.waiting_for_dice else None,
+        "dealer": game.log.dealer,
+    }
+
+
+def step(game: GameState, bot: Any, rng: random.Random) -> None:
+    """One bot command, or now and then a turn or reaction window running out."""
+    if game.reaction_active:
+        seat, actions = next((s, a) for s, a in game.reaction_actions.items() if s not in game.reaction_claims)
+        if rng.random() < 0.05:
+            game.expire_reactions()
+        else:
+            game.submit_claim(seat, bot.react(game, seat, list(actions))["id"])
+    elif game.expects_discard:
+        seat = game.player_order[game.turn_index]
+        if rng.random() < 0.05:
+            game.expire_turn()
+        elif game.ting_flags.get(seat):
+            game.discard(seat, game.last_drawn.get(seat))
+        else:
+            options = game.ting_discards(seat)
+            tile = bot.declare_ting(game, seat, options) if options else None
+            if tile is not None:
+                game.declare_ting(seat)
+            else:
+                tile = bot.discard(game, seat)
+            game.discard(seat, tile)
@@ -0,0 +1,35 @@
+"""RoomActor runs queued commands one at a time and flushes once per batch."""
+import asyncio
+
+from app.actor import RoomActor
+
+
+def test_burst_is_one_batch_and_one_flush():
+    async def scenario() -> None:
+        flushes = []
+        actor = RoomActor("r", lambda: flushes.append(actor.processed))
+        order = []
+        for i in range(3):
+            actor.submit(lambda i=i: order.append(i) or True)
+        assert actor.pending == 3
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        assert order == [0, 1, 2]
+        assert flushes == [3] and actor.batches == 1 and actor.pending == 0
+
+    asyncio.run(scenario())
+
+
+def test_unchanged_state_is_not_flushed_and_errors_are():
+    flushes = []
+    actor = RoomActor("r", lambda: flushes.append(1))
+    actor._queue.extend([lambda: False, lambda: None])
+    actor.run_batch()
+    assert not flushes
+
+    def broken() -> bool:
+        raise RuntimeError("half applied")
+
+    actor._queue.append(broken)
+    actor.run_batch()  # logged, and flushed since the command may have changed the table
+    assert flushes == [1] and actor.processed == 3
@@ -0,0 +1,94 @@
+"""Bot seats fill and take over seats, play through the room actor and give seats back."""
+import asyncio
+import random
+
+from app.botseats import BotSeats, is_bot
+from app.ws import GameState, RoomManager, Vacant
+from tests.support import seated_table
+
+MAX_ROUNDS = 5000
+
+
+def bot_seats(manager: RoomManager, **kwargs) -> BotSeats:
+    bots = BotSeats(manager, budget=5.0, **kwargs)
+    bots.rng = random.Random(0)
+    manager.bots = bots
+    bots.start()
+    return bots
+
+
+async def play(manager: RoomManager, humans: list, until, room_id: str = "r") -> GameState:
+    """Let the bots run; the humans pass on every reaction and discard their drawn tile."""
+    game = manager.games[room_id]
+    for _ in range(MAX_ROUNDS):
+        if until(game):
+            return game
+        await asyncio.sleep(0.001)
+        for ws in humans:
+            if ws not in game.player_order:
+                continue
+            if game.reaction_active and ws in game.reaction_actions and ws not in game.reaction_claims:
+                claim = next(a["id"] for a in game.compute_actions_for(ws) if a["type"] == "pass")
+                manager.submit(room_id, lambda ws=ws, claim=claim: bool(game.submit_claim(ws, claim)))
+            elif game.expects_discard and not game.reaction_active and game.player_order[game.turn_index] is ws:
+                hand, drawn = game.hands[ws], game.last_drawn.get(ws)
+                tile = drawn if drawn is not None and drawn in hand else hand[-1]
+                manager.submit(room_id, lambda ws=ws, tile=tile: bool(game.discard(ws, tile)))
+    raise AssertionError("the table stopped moving")
+
+
+def seat_events(log, seat: int) -> list:
+    return [e for e in log.events if e[0] in "wmtcxked" and e[1] == seat]
+
+
+def test_fill_bots_discard_and_claim_until_the_hand_ends(run, fake_socket):
+    async def scenario() -> None:
+        manager = RoomManager()
+        bots = bot_seats(manager)
+        human = fake_socket(keep=False)
+        await manager.connect(human)
+        assert manager.join_room(human, "r", "p0", player_id="id0")
+        game = manager.games["r"] = GameState(turn_seconds=0)
+        # seed 4: seat 1 chis the dealer's first discard, before it has drawn a tile of its own
+        game.start(bots.fill([human]), seed=4)
+        assert game.player_order[0] is human and all(is_bot(seat) for seat in game.player_order[1:])
+        log = game.log
+        manager.broadcast_state("r")
+        # over once the bots have rolled the dice for the next hand, if the human has not
+        await play(manager, [human], lambda g: g.waiting_for_dice or g.log is not log)
+
+        events = seat_events(log, 1)
+        assert events[0][0] == "k" and events[0][2] != "pass" and events[1][0] == "x"
+        for seat in (1, 2, 3):
+            assert any(e[0] == "x" for e in seat_events(log, seat))
+        assert manager.actors["r"].processed > len(log.events) / 2
+        await bots.stop()
+    run(scenario)
+
+
+def test_bot_takes_over_a_vacated_seat_and_gives_it_back(run, fake_socket):
+    async def scenario() -> None:
+        manager = RoomManager()
+        bots = bot_seats(manager, takeover=0)
+        sockets = await seated_table(manager)
+        game = manager.games["r"]
+        game.turn_seconds = 0
+        manager.disconnect(sockets[1])
+        seat = game.player_order[1]
+        assert isinstance(seat, Vacant) and not seat.bot
+        manager.broadcast_state("r")
+        humans = [sockets[0], sockets[2], sockets[3]]
+        await play(manager, humans, lambda g: is_bot(g.player_order[1]))
+        log = game.log
+        discards = len([e for e in seat_events(log, 1) if e[0] == "x"])
+        await play(manager, humans, lambda g: g.waiting_for_dice or g.log is not log or
+                   len([e for e in seat_events(log, 1) if e[0] == "x"]) > discards)
+
+        hand = list(game.hands[seat])
+        back = fake_socket()
+        await manager.connect(back)
+        assert manager.join_room(back, "r", "p1", player_id="id1")
+        assert game.player_order[1] is back and not any(is_bot(s) for s in game.player_order)
+        assert list(game.hands[back]) == hand
+        await bots.stop()
+    run(scenario)
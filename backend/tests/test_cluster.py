@@ -0,0 +1,72 @@
+"""Two workers over a shared LocalBus: moving a connection between rooms owned by different workers."""
+from app.cluster import Cluster, LocalBus, RemoteSocket
+from app.ws import RoomManager, Vacant
+from tests.support import settle
+
+
+def make_worker(worker: int, hub: dict) -> Cluster:
+    manager = RoomManager()
+    vacated = []
+    manager.bots = type("Bots", (), {"vacated": lambda self, r, s: vacated.append((r, s)),
+                                     "drive": lambda self, r: None})()
+    manager.vacated = vacated
+
+    async def dispatch(websocket, data) -> None:
+        payload = data.get("payload") or {}
+        room_id = payload.get("roomId", "lobby")
+        if data["type"] == "join":
+            manager.join_room(websocket, room_id, payload["name"], payload["name"], session=payload["name"])
+        elif data["type"] == "start":
+            manager.get_or_create_game(room_id).start(manager.list_room_players(room_id))
+        manager.broadcast_state(room_id)
+
+    return Cluster(manager, LocalBus(worker, 2, hub), dispatch)
+
+
+def room_owned_by(cluster: Cluster, worker: int, prefix: str) -> str:
+    return next(f"{prefix}{i}" for i in range(1000) if cluster.owner(f"{prefix}{i}") == worker)
+
+
+def test_room_switch_frees_the_seat_and_drops_stale_frames(run, fake_socket):
+    async def scenario() -> None:
+        hub: dict = {}
+        gateway, owner = make_worker(0, hub), make_worker(1, hub)
+        await gateway.start()
+        await owner.start()
+        remote_room = room_owned_by(gateway, 1, "far")
+        local_room = room_owned_by(gateway, 0, "near")
+
+        sockets = [fake_socket() for _ in range(4)]
+        for i, ws in enumerate(sockets):
+            await gateway.manager.connect(ws)
+            await gateway.route(ws, {"type": "join", "payload": {"roomId": remote_room, "name": f"p{i}"}})
+        await gateway.route(sockets[0], {"type": "start", "payload": {"roomId": remote_room}})
+        await settle()
+        game = owner.manager.games[remote_room]
+        assert game.started and not any(isinstance(seat, Vacant) for seat in game.player_order)
+
+        mover = sockets[0]
+        await gateway.route(mover, {"type": "join", "payload": {"roomId": local_room, "name": "p0"}})
+        await settle()
+        seats = [seat for seat in game.player_order if isinstance(seat, Vacant)]
+        assert [seat.player_id for seat in seats] == ["p0"]
+        # freed, not held: no resume hold and no bot takeover
+        assert not owner.manager.holds and not owner.manager.vacated
+
+        # the old owner still had a frame in flight for the mover
+        before = len(mover.frames)
+        await RemoteSocket(owner, 0, gateway._conn_ids[mover]).send_text('{"type":"state_patch"}')
+        await settle()
+        assert '{"type":"state_patch"}' not in mover.frames[before:]
+
+        # a closed connection, by contrast, keeps its seat for a resume
+        gateway.manager.disconnect(sockets[1])
+        await gateway.disconnect(sockets[1])
+        await settle()
+        assert "p1" in {hold.seat.player_id for hold in owner.manager.holds.values()}
+        assert [seat for _, seat in owner.manager.vacated] == [hold.seat for hold in owner.manager.holds.values()]
+
+        for cluster in (gateway, owner):
+            await cluster.stop()
+
+    run(scenario)
@@ -0,0 +1,39 @@
+"""HandLog encodes to one JSON line and back."""
+import json
+
+import pytest
+
+from app.handlog import HandLog, new_seed
+
+
+def sample() -> HandLog:
+    log = HandLog(seed=new_seed(), hand=3, seats=4, dealer=1, multiplier=2, scores=[5, -5, 0, 0])
+    log.add("r", 3, 4)
+    log.add("w", 1, 13)
+    log.add("x", 1, 13, 1)
+    log.add("k", 2, 0)
+    log.add("e", 2, 1, -3, 2, 0)
+    return log
+
+
+def test_encode_decode_round_trip():
+    log = sample()
+    line = log.encode()
+    assert "\n" not in line
+    assert HandLog.decode(line) == log
+    assert log.finished
+    assert not HandLog.decode(line.replace(',["e",2,1,-3,2,0]', "")).finished
+
+
+def test_unknown_version_is_refused():
+    doc = json.loads(sample().encode())
+    doc["v"] = 99
+    with pytest.raises(ValueError, match="version"):
+        HandLog.decode(json.dumps(doc))
+
+
+def test_describe_names_tiles():
+    lines = sample().describe()
+    assert lines[1].split() == ["1", "w", "1", "C5"]
+    assert lines[2].split() == ["2", "x", "1", "C5", "1"]
+    assert lines[3].split() == ["3", "k", "2", "0"]
@@ -0,0 +1,106 @@
+"""quick_match: input handling in handle_message, cancelling, and seating a matched table (start_match)."""
+import json
+import math
+
+import pytest
+
+from app.main import handle_message, matchmaker, room_manager, start_match
+from tests.support import settle
+
+
+async def quick_match(ws, payload: dict) -> dict:
+    await room_manager.connect(ws)
+    try:
+        await handle_message(ws, {"type": "quick_match", "payload": payload})
+        await settle()
+        return json.loads(ws.frames[-1])
+    finally:
+        matchmaker.cancel(ws)
+        room_manager.disconnect(ws)
+
+
+@pytest.mark.parametrize("rating", [math.inf, -math.inf, math.nan, True, "1500"])
+def test_bad_rating_is_an_error_frame(run, fake_socket, rating):
+    async def scenario() -> None:
+        frame = await quick_match(fake_socket(), {"name": "a", "rating": rating})
+        assert frame == {"type": "error", "payload": {"message": "rating must be a finite number"}}
+    run(scenario)
+
+
+@pytest.mark.parametrize("rating", [None, 1500, 1499.7])
+def test_finite_or_missing_rating_is_queued(run, fake_socket, rating):
+    async def scenario() -> None:
+        frame = await quick_match(fake_socket(), {"name": "a", "rating": rating})
+        assert frame == {"type": "queued", "payload": {"waiting": 1}}
+    run(scenario)
+
+
+def frames(ws) -> list:
+    return [json.loads(frame) for frame in ws.frames]
+
+
+async def queued(sockets: list) -> None:
+    for i, ws in enumerate(sockets):
+        await room_manager.connect(ws)
+        await handle_message(ws, {"type": "quick_match", "payload": {"name": f"p{i}", "playerId": f"id{i}"}})
+
+
+def leave_all(sockets: list) -> None:
+    for ws in sockets:
+        matchmaker.cancel(ws)
+        room_manager.disconnect(ws)
+
+
+def test_matched_table_is_seated_and_started(run, fake_socket):
+    async def scenario() -> None:
+        sockets = [fake_socket() for _ in range(4)]
+        await queued(sockets)
+        try:
+            tables = matchmaker.take()
+            assert [[t.websocket for t in table] for table in tables] == [sockets]
+            await start_match(tables[0])
+            await settle()
+            room_id = next(f for f in frames(sockets[0]) if f["type"] == "matched")["payload"]["roomId"]
+            for ws in sockets:
+                assert {"type": "matched", "payload": {"roomId": room_id}} in frames(ws)
+            game = room_manager.games[room_id]
+            assert game.started and sorted(game.player_order, key=sockets.index) == sockets
+        finally:
+            leave_all(sockets)
+    run(scenario)
+
+
+def test_cancel_leaves_the_queue(run, fake_socket):
+    async def scenario() -> None:
+        sockets = [fake_socket() for _ in range(4)]
+        await queued(sockets)
+        try:
+            await handle_message(sockets[1], {"type": "quick_match_cancel", "payload": {}})
+            await handle_message(sockets[1], {"type": "quick_match_cancel", "payload": {}})
+            await settle()
+            assert [f["type"] for f in frames(sockets[1])].count("match_cancelled") == 1
+            assert len(matchmaker) == 3 and matchmaker.take() == []
+        finally:
+            leave_all(sockets)
+    run(scenario)
+
+
+def test_player_gone_after_take_sends_the_rest_back_to_the_queue(run, fake_socket):
+    async def scenario() -> None:
+        sockets = [fake_socket() for _ in range(4)]
+        late = fake_socket()
+        await queued(sockets)
+        try:
+            table = matchmaker.take()[0]
+            rooms = set(room_manager.games)
+            room_manager.disconnect(sockets[2])
+            await start_match(table)
+            await settle()
+            assert set(room_manager.games) == rooms
+            assert not any(f["type"] == "matched" for ws in sockets for f in frames(ws))
+            # still in front, in the order they queued: the next one to join completes the table
+            await queued([late])
+            assert [t.websocket for t in matchmaker.take()[0]] == [sockets[0], sockets[1], sockets[3], late]
+        finally:
+            leave_all(sockets + [late])
+    run(scenario)
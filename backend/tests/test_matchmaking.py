@@ -0,0 +1,87 @@
+"""Matchmaker queues by bucket, takes the longest-waiting four and seats them on its tick."""
+import asyncio
+
+from app.matchmaking import Matchmaker
+
+
+async def nothing(table) -> None:
+    pass
+
+
+def test_buckets_by_stake_and_rating_band():
+    mm = Matchmaker(nothing, rating_band=100)
+    assert mm.bucket_of(1450, "low") == ("low", 14)
+    assert mm.bucket_of(None, "low") == ("low",)
+    assert Matchmaker(nothing).bucket_of(1450, "low") == ("low",)  # no band: ratings ignored
+    for ws, rating, stake in [("a", 1410, ""), ("b", 1490, ""), ("c", 1510, ""), ("d", 1420, "high")]:
+        mm.enqueue(ws, ws, rating=rating, stake=stake)
+    assert mm.waiting(("", 14)) == 2 and mm.waiting(("", 15)) == 1 and mm.waiting(("high", 14)) == 1
+    assert mm.take() == []
+
+
+def test_take_forms_tables_oldest_first_and_tracks_full_buckets():
+    mm = Matchmaker(nothing)
+    for ws in "abc":
+        mm.enqueue(ws, ws)
+    assert not mm._full
+    mm.enqueue("a", "a")  # queueing again goes to the back
+    assert not mm._full and mm.waiting(("",)) == 3
+    for ws in "defghi":
+        mm.enqueue(ws, ws)
+    assert mm._full == {("",)}
+    tables = mm.take()
+    assert [[t.websocket for t in table] for table in tables] == [list("bcad"), list("efgh")]
+    assert not mm._full and len(mm) == 1 and mm.waiting(("",)) == 1
+    assert mm.take() == []
+
+
+def test_cancel_leaves_the_queue():
+    mm = Matchmaker(nothing)
+    for ws in "abcd":
+        mm.enqueue(ws, ws, stake="s")
+    assert mm.cancel("c") and not mm.cancel("c") and not mm.cancel("x")
+    assert not mm._full and mm.waiting(("s",)) == 3
+    for ws in "abd":
+        mm.cancel(ws)
+    assert len(mm) == 0 and not mm._queues
+
+
+def test_requeue_puts_a_fallen_through_table_back_in_front():
+    mm = Matchmaker(nothing)
+    for ws in "abcdef":
+        mm.enqueue(ws, ws)
+    table = mm.take()[0]
+    mm.enqueue("c", "c")  # came back on its own meanwhile: keeps the new ticket
+    mm.requeue([t for t in table if t.websocket != "d"])
+    assert list(mm._queues[("",)]) == ["a", "b", "e", "f", "c"]
+    assert mm._queues[("",)]["a"] is table[0] and mm._full == {("",)}
+    assert [t.websocket for t in mm.take()[0]] == ["a", "b", "e", "f"]
+
+
+def test_tick_seats_full_tables_and_survives_a_failing_seat(run):
+    seated = []
+
+    async def seat(table) -> None:
+        seated.append([t.websocket for t in table])
+        if len(seated) == 1:
+            raise RuntimeError("room went away")
+
+    async def scenario() -> None:
+        mm = Matchmaker(seat, tick=0.005)
+        mm.start()
+        for ws in "abcdefg":
+            mm.enqueue(ws, ws)
+        for _ in range(100):
+            if seated:
+                break
+            await asyncio.sleep(0.005)
+        for ws in "hijk":
+            mm.enqueue(ws, ws)
+        for _ in range(100):
+            if len(seated) == 2:
+                break
+            await asyncio.sleep(0.005)
+        await mm.stop()
+        assert seated == [list("abcd"), list("efgh")] and len(mm) == 3
+
+    run(scenario)
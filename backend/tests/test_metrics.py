@@ -0,0 +1,91 @@
+"""The in-house metrics registry and its Prometheus text exposition."""
+import math
+
+import pytest
+
+from app.metrics import Counter, Gauge, Histogram, Registry, render
+
+
+def test_counter_and_gauge_samples():
+    registry = Registry()
+    plain = Counter("c_total", "plain counter", registry=registry)
+    plain.inc()
+    plain.inc(2)
+    by_type = Counter("m_total", "by type", ["type"], registry=registry)
+    by_type.labels("discard").inc()
+    by_type.labels("discard").inc()
+    by_type.labels(7).inc()  # label values are strings
+    gauge = Gauge("g", "settable", registry=registry)
+    gauge.set(5)
+    gauge.dec(2)
+    gauge.inc(0.5)
+    assert plain.samples() == [("", {}, 3.0)]
+    assert by_type.samples() == [("", {"type": "discard"}, 2.0), ("", {"type": "7"}, 1.0)]
+    assert gauge.samples() == [("", {}, 3.5)]
+    with pytest.raises(ValueError):
+        by_type.labels("a", "b")
+
+
+def test_gauge_callback_and_broken_callback():
+    registry = Registry()
+    Gauge("rooms", "callback", fn=lambda: 4, registry=registry)
+    Gauge("queues", "labelled callback", ["kind", "room"], fn=lambda: {("a", "r1"): 1, ("b", "r2"): 2}, registry=registry)
+    Gauge("broken", "raises", fn=lambda: 1 / 0, registry=registry)
+    families = {fam["name"]: fam for fam in registry.collect()}
+    assert "broken" not in families  # skipped, the rest still render
+    assert families["rooms"]["samples"] == [("", {}, 4.0)]
+    assert families["queues"]["samples"] == [("", {"kind": "a", "room": "r1"}, 1.0),
+                                             ("", {"kind": "b", "room": "r2"}, 2.0)]
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    hist = Histogram("h_seconds", "latency", buckets=(1.0, 0.1), registry=registry)
+    for value in (0.05, 0.1, 0.5, 3.0):
+        hist.observe(value)
+    assert hist.samples() == [
+        ("_bucket", {"le": "0.1"}, 2),  # upper bounds are inclusive
+        ("_bucket", {"le": "1"}, 3),
+        ("_bucket", {"le": "+Inf"}, 4),
+        ("_sum", {}, pytest.approx(3.65)),
+        ("_count", {}, 4),
+    ]
+    with hist.time():
+        pass
+    assert hist.samples()[-1] == ("_count", {}, 5)
+
+
+def test_render_exposition_text():
+    registry = Registry()
+    Counter("msgs_total", "Messages, by type", ["type"], registry=registry).labels('say "hi"\n').inc()
+    hist = Histogram("size_bytes", "Frame size", ["format"], buckets=(64,), registry=registry)
+    hist.labels("json").observe(10)
+    hist.labels("json").observe(100)
+    Gauge("up", "Up", registry=registry).set(math.inf)
+    text = render([(None, registry.collect())])
+    assert text == "\n".join([
+        "# HELP msgs_total Messages, by type",
+        "# TYPE msgs_total counter",
+        'msgs_total{type="say \\"hi\\"\\n"} 1',
+        "# HELP size_bytes Frame size",
+        "# TYPE size_bytes histogram",
+        'size_bytes_bucket{format="json",le="64"} 1',
+        'size_bytes_bucket{format="json",le="+Inf"} 2',
+        'size_bytes_sum{format="json"} 110',
+        'size_bytes_count{format="json"} 2',
+        "# HELP up Up",
+        "# TYPE up gauge",
+        "up +Inf",
+    ]) + "\n"
+
+
+def test_render_merges_workers_under_one_family():
+    registry = Registry()
+    counter = Counter("hands_total", "Hands", ["outcome"], registry=registry)
+    counter.labels("win").inc()
+    first = registry.collect()
+    counter.labels("win").inc(2)
+    text = render([(0, first), (1, registry.collect())])
+    assert text.count("# HELP hands_total") == 1
+    assert 'hands_total{worker="0",outcome="win"} 1' in text
+    assert 'hands_total{worker="1",outcome="win"} 3' in text
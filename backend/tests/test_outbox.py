@@ -0,0 +1,63 @@
+"""Outbox sends in order, coalesces keyed messages and drops a client that falls behind."""
+from app.outbox import Outbox
+from app.wire import JSON, MSGPACK, unpackb
+from tests.support import settle
+
+
+def test_sends_in_order_and_coalesces(run, fake_socket):
+    async def scenario() -> None:
+        ws = fake_socket()
+        box = Outbox(ws, on_overflow=lambda: None)
+        assert box.put("a")
+        assert box.put("state 1", coalesce="state")
+        assert box.put({"type": "b"})
+        assert box.put("state 2", coalesce="state")
+        assert box.put(lambda codec: None)  # rendered to nothing: skipped
+        assert box.pending == 4 and box.coalesced == 1
+        box.start()
+        await settle()
+        assert ws.frames == ["a", '{"type":"b"}', "state 2"]
+        assert box.pending == 0 and box.sent == 3
+        box.close()
+
+    run(scenario)
+
+
+def test_binary_codec_renders_callables_and_dicts(run, fake_socket):
+    async def scenario() -> None:
+        ws = fake_socket()
+        box = Outbox(ws, on_overflow=lambda: None, codec=MSGPACK)
+        box.put(lambda codec: codec.encode({"type": codec.name}))
+        box.start()
+        await settle()
+        assert unpackb(ws.frames[0]) == {"type": "msgpack"}
+        box.close()
+
+    run(scenario)
+
+
+def test_too_many_pending_overflows_once(fake_socket):
+    dropped = []
+    box = Outbox(fake_socket(), on_overflow=lambda: dropped.append(1), max_pending=2, codec=JSON)
+    assert box.put("1") and box.put("2")
+    assert not box.put("3")
+    assert not box.put("4")  # closed
+    assert dropped == [1] and box.pending == 0
+
+
+def test_lagging_and_failing_sends_overflow(run, fake_socket):
+    dropped = []
+    box = Outbox(fake_socket(), on_overflow=lambda: dropped.append("lag"), max_lag=5.0)
+    box.put("1")
+    box._queue[0].ts -= 10  # unsent for ten seconds
+    assert not box.put("2")
+    assert dropped == ["lag"]
+
+    async def scenario() -> None:
+        box = Outbox(fake_socket(fail=True), on_overflow=lambda: dropped.append("send"))
+        box.put("x")
+        box.start()
+        await settle()
+
+    run(scenario)
+    assert dropped == ["lag", "send"]
@@ -0,0 +1,78 @@
+"""Profiler: spans swap hooks in and back out, sampling starts and stops."""
+import random
+import time
+
+from app.bots import make_policy
+from app.profiling import Hook, Profiler, default_hooks
+from app.ws import GameState
+from tests.support import SEATS, step
+
+
+class Engine:
+    def outer(self, n: int) -> int:
+        return self.inner(n) + self.inner(n)
+
+    def inner(self, n: int) -> int:
+        return n * 2
+
+
+def engine_hooks():
+    return [Hook(Engine, "outer", "Engine.outer"), Hook(Engine, "inner", "Engine.inner", name_of=lambda self, n: f"inner:{n}")]
+
+
+def test_spans_record_calls_and_paths_then_unhook():
+    original = Engine.__dict__["inner"]
+    profiler = Profiler(engine_hooks)
+    profiler.start(sampling=False)
+    assert profiler.active and Engine.__dict__["inner"] is not original
+    assert Engine().outer(3) == 12
+    profiler.stop()
+    assert not profiler.active and Engine.__dict__["inner"] is original
+    assert {row["name"]: row["calls"] for row in profiler.spans.summary()} == {"Engine.outer": 1, "inner:3": 2}
+    paths = dict(line.rsplit(" ", 1) for line in profiler.flamegraph("spans").splitlines())
+    assert set(paths) == {"Engine.outer", "Engine.outer;inner:3"}
+    Engine().outer(1)  # unhooked: nothing more is recorded
+    assert profiler.spans.by_name["Engine.outer"][0] == 1
+    assert profiler.status()["spans"] and profiler.status()["samples"] == 0
+
+
+def test_default_hooks_time_the_engine_and_are_restored():
+    originals = [(h.owner, h.attr, h.owner.__dict__[h.attr] if isinstance(h.owner, type) else getattr(h.owner, h.attr))
+                 for h in default_hooks()]
+    profiler = Profiler()
+    profiler.start(sampling=False)
+    game = GameState(turn_seconds=0)
+    game.start(list(SEATS), seed=1)
+    bot, rng = make_policy("shanten", random.Random(1)), random.Random(1)
+    for _ in range(40):
+        step(game, bot, rng)
+    profiler.stop()
+    names = {row["name"] for row in profiler.spans.summary()}
+    assert {"GameState.begin_hand", "GameState.discard"} <= names
+    assert any(path.startswith("GameState.discard;") for path in profiler.spans.by_path)
+    for owner, attr, original in originals:
+        current = owner.__dict__[attr] if isinstance(owner, type) else getattr(owner, attr)
+        assert current is original, attr
+
+
+def busy(seconds: float) -> None:
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_sampling_starts_and_stops():
+    profiler = Profiler(engine_hooks)
+    profiler.start(spans=False, sampling=True, interval=0.001)
+    assert profiler.active and profiler.spans is None
+    assert Engine.__dict__["inner"].__name__ == "inner" and not profiler._originals
+    busy(0.1)
+    profiler.stop()
+    assert not profiler.active
+    samples = profiler.sampler.samples
+    assert samples > 0 and "busy (test_profiling.py" in profiler.flamegraph()
+    time.sleep(0.01)
+    assert profiler.sampler.samples == samples  # the thread is gone
+    status = profiler.status()
+    assert not status["active"] and status["samples"] == samples and status["interval"] == 0.001
+    assert profiler.flamegraph("spans") == ""
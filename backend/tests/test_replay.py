@@ -0,0 +1,78 @@
+"""Hands played through GameState's command methods replay from their logs, whole and up to any event."""
+import random
+
+import pytest
+
+from app.bots import make_policy
+from app.handlog import HandLog
+from app.tiles import Hand
+from app.ws import GameState
+from tests.support import MAX_STEPS, SEATS, step, table_view
+
+def play(seed: int):
+    """Bot moves until the hand ends or nothing moves; returns the game and
+    the table after every command, keyed by log length."""
+    rng = random.Random(seed)
+    bot = make_policy("shanten", random.Random(seed))
+    game = GameState(turn_seconds=0)
+    game.start(list(SEATS), seed=seed)
+    views = [(len(game.log.events), table_view(game))]
+    for _ in range(MAX_STEPS):
+        if game.waiting_for_dice:
+            break
+        step(game, bot, rng)
+        if len(game.log.events) == views[-1][0]:
+            break  # nothing left to do
+        views.append((len(game.log.events), table_view(game)))
+    return game, views
+
+
+@pytest.mark.parametrize("seed", range(12))
+def test_replay_matches_live_table(seed):
+    game, views = play(seed)
+    log = HandLog.decode(game.log.encode())
+    assert table_view(GameState.replay(log)) == views[-1][1]
+    for upto, view in views:
+        assert table_view(GameState.replay(log, upto)) == view
+
+
+def test_replay_reports_divergence():
+    game, _ = play(3)
+    events = game.log.events
+    at = next(i for i, e in enumerate(events) if e[0] == "x" and len(e) == 3)
+    tampered = HandLog.decode(game.log.encode())
+    hand = GameState.replay(tampered, at).hands[events[at][1]]
+    other = next(t for t in hand if t != events[at][2])
+    tampered.events[at] = ("x", events[at][1], other)
+    with pytest.raises(ValueError, match="diverged"):
+        GameState.replay(tampered)
+
+
+def test_wall_running_out_ends_the_hand_drawn():
+    game = GameState(turn_seconds=0)
+    game.start(list(SEATS), seed=5)
+    game.last_winner = 2  # as if seat 2 had won the previous hand
+    game.begin_hand(seed=5)
+    assert game.log.dealer == 2
+    for _ in range(MAX_STEPS):
+        if game.waiting_for_dice:
+            break
+        if game.reaction_active:
+            game.expire_reactions()  # nobody claims, nobody wins
+        else:
+            seat = game.player_order[game.turn_index]
+            assert game.discard(seat, game.hands[seat][-1])
+    assert game.waiting_for_dice
+    assert game.log.events[-1] == ("d", 2, 0, 0, 0, 0)
+    assert game.log.finished and len(game.wall) == 0
+    # the dealer keeps the deal and rolls for the next hand
+    assert game.dice_roller == 2 and game.last_winner == 2
+    assert table_view(GameState.replay(HandLog.decode(game.log.encode()))) == table_view(game)
+    game.begin_hand(seed=6)
+    assert game.log.dealer == 2 and game.turn_index == 2
+
+
+def test_hand_equality_ignores_order():
+    assert Hand([3, 1, 2]) == Hand([1, 2, 3])
+    assert Hand([1, 1, 2]) != Hand([1, 2, 2])
+    assert Hand([1]) != [1]
@@ -0,0 +1,55 @@
+"""RoomManager seating: player ids, session tokens and open connections."""
+from app.ws import RoomManager, Vacant
+from tests.support import seated_table
+
+
+def test_player_id_does_not_take_over_an_open_seat(run, fake_socket):
+    async def scenario() -> None:
+        manager = RoomManager()
+        sockets = await seated_table(manager)
+        other_tab = fake_socket()
+        await manager.connect(other_tab)
+        assert not manager.join_room(other_tab, "r", "p0", player_id="id0")
+        assert manager.games["r"].player_order == sockets
+        assert manager.clients[other_tab].room_id is None
+    run(scenario)
+
+
+def test_same_session_reclaims_an_open_seat(run, fake_socket):
+    async def scenario() -> None:
+        manager = RoomManager()
+        sockets = await seated_table(manager)
+        session = manager.clients[sockets[0]].session
+        again = fake_socket()
+        await manager.connect(again)
+        assert manager.join_room(again, "r", "p0", player_id="id0", session=session)
+        assert manager.games["r"].player_order[0] is again
+    run(scenario)
+
+
+def test_player_id_reclaims_a_vacant_seat(run, fake_socket):
+    async def scenario() -> None:
+        manager = RoomManager()
+        sockets = await seated_table(manager)
+        manager.disconnect(sockets[0])
+        assert isinstance(manager.games["r"].player_order[0], Vacant)
+        back = fake_socket()
+        await manager.connect(back)
+        assert manager.join_room(back, "r", "p0", player_id="id0")
+        assert manager.games["r"].player_order[0] is back
+    run(scenario)
+
+
+def test_switching_rooms_frees_the_old_seat(run):
+    async def scenario() -> None:
+        manager = RoomManager()
+        sockets = await seated_table(manager)
+        assert manager.join_room(sockets[0], "other", "p0", player_id="id0")
+        seat = manager.games["r"].player_order[0]
+        assert isinstance(seat, Vacant) and seat.player_id == "id0"
+        assert sockets[0] not in manager.rooms["r"] and manager.clients[sockets[0]].room_id == "other"
+        assert not manager.holds  # freed, not held for a resume
+        # rejoining the same room keeps the seat
+        assert manager.join_room(sockets[1], "r", "p1", player_id="id1")
+        assert manager.games["r"].player_order[1] is sockets[1]
+    run(scenario)
@@ -0,0 +1,62 @@
+"""DeadlineScheduler fires keyed timers in deadline order; rescheduling replaces, cancel drops."""
+import asyncio
+import time
+
+from app.scheduler import DeadlineScheduler
+
+
+def test_fires_in_deadline_order_with_replace_and_cancel():
+    async def scenario() -> None:
+        scheduler = DeadlineScheduler()
+        fired = []
+        now = time.time()
+        scheduler.schedule("late", now + 0.06, lambda: fired.append("late"))
+        scheduler.schedule("early", now + 0.02, lambda: fired.append("early"))
+        scheduler.schedule("moved", now + 0.01, lambda: fired.append("moved"))
+        scheduler.schedule("moved", now + 0.04, lambda: fired.append("moved"))
+        scheduler.schedule("dropped", now + 0.03, lambda: fired.append("dropped"))
+        scheduler.cancel("dropped")
+        assert len(scheduler) == 3
+        assert scheduler.deadline("moved") == now + 0.04
+        assert scheduler.deadline("dropped") is None
+        await asyncio.sleep(0.1)
+        assert fired == ["early", "moved", "late"]
+        assert len(scheduler) == 0
+
+    asyncio.run(scenario())
+
+
+def test_an_earlier_deadline_wakes_the_sleeping_task():
+    async def scenario() -> None:
+        scheduler = DeadlineScheduler()
+        fired = []
+        scheduler.schedule("far", time.time() + 60, lambda: fired.append("far"))
+        await asyncio.sleep(0)
+        scheduler.schedule("near", time.time() + 0.01, lambda: fired.append("near"))
+        await asyncio.sleep(0.05)
+        assert fired == ["near"]
+        scheduler.cancel("far")
+
+    asyncio.run(scenario())
+
+
+def test_failing_and_async_callbacks_do_not_stop_the_loop(capsys):
+    async def scenario() -> None:
+        scheduler = DeadlineScheduler()
+        fired = []
+
+        def boom() -> None:
+            raise RuntimeError("boom")
+
+        async def later() -> None:
+            fired.append("async")
+
+        now = time.time()
+        scheduler.schedule("boom", now, boom)
+        scheduler.schedule("async", now + 0.01, later)
+        scheduler.schedule("after", now + 0.02, lambda: fired.append("after"))
+        await asyncio.sleep(0.05)
+        assert fired == ["async", "after"]
+
+    asyncio.run(scenario())
+    assert "RuntimeError: boom" in capsys.readouterr().err
@@ -0,0 +1,88 @@
+"""Shanten and ukeire against brute force: draw every tile, and swap every tile for tenpai."""
+import random
+
+import pytest
+
+from app import shanten
+from app.tiles import Hand
+from app.ws import hand_can_win
+
+PLAYABLE = list(shanten.PLAYABLE_TILES)
+
+
+def deal(rng: random.Random, n: int) -> Hand:
+    """``n`` tiles from one or two suits plus winds, at most three copies of each."""
+    suits = rng.sample(range(3), rng.choice([1, 2]))
+    pool = [t for t in PLAYABLE if t >= 27 or t // 9 in suits] * 3
+    return Hand(rng.sample(pool, n))
+
+
+def plus(hand: Hand, tile: int) -> Hand:
+    out = Hand(hand)
+    out.append(tile)
+    return out
+
+
+def minus(hand: Hand, tile: int) -> Hand:
+    out = Hand(hand)
+    out.remove(tile)
+    return out
+
+
+def is_tenpai(hand: Hand) -> bool:
+    return any(hand_can_win(plus(hand, t), []) for t in PLAYABLE if hand.count(t) < 4)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_tenpai_and_one_away_match_brute_force(seed):
+    rng = random.Random(seed)
+    checked = {0: 0, 1: 0}
+    for _ in range(400):
+        hand = deal(rng, 13)
+        n = shanten.shanten(hand)
+        assert (n == 0) == is_tenpai(hand), hand
+        if n == 1 and checked[1] < 5:
+            checked[1] += 1
+            swaps = (minus(plus(hand, t), d) for t in PLAYABLE if hand.count(t) < 4 for d in set(hand.tiles))
+            assert any(is_tenpai(h) for h in swaps), hand
+        checked[0] += n == 0
+    assert checked[0] and checked[1]
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_ukeire_is_every_tile_that_lowers_shanten(seed):
+    rng = random.Random(seed)
+    for _ in range(100):
+        hand = deal(rng, 13)
+        base = shanten.shanten(hand)
+        result = shanten.ukeire(hand)
+        assert result.shanten == base
+        expected = {t for t in PLAYABLE if hand.count(t) < 4 and shanten.shanten(plus(hand, t)) < base}
+        assert set(result.tiles) == expected
+        assert all(result.tiles[t] == 4 - hand.count(t) for t in expected)
+
+
+def test_discard_helpers_match_removing_the_tile():
+    rng = random.Random(11)
+    for _ in range(100):
+        hand = deal(rng, 14)
+        by_tile = shanten.discard_shanten(hand)
+        assert set(by_tile) == set(hand.tiles)
+        for t, n in by_tile.items():
+            assert n == shanten.standard_shanten(minus(hand, t).keys)
+        options = shanten.discard_options(hand)
+        assert options[0][1].shanten == min(shanten.shanten(minus(hand, t)) for t in set(hand.tiles))
+        for t, u in options:
+            assert u == shanten.ukeire(minus(hand, t), visible=[int(x == t) for x in range(len(hand.counts))])
+
+
+def test_known_shapes():
+    complete = Hand.from_names(["B1", "B2", "B3", "B4", "B5", "B6", "B7", "B8", "B9", "C1", "C1", "C1", "WE", "WE"])
+    assert shanten.shanten(complete) == -1
+    assert shanten.breakdown(complete, []) == {
+        "standard": -1, "sevenPairs": 4, "allPongs": 5, "pureSuit": 2, "halfSuit": 1,
+    }
+    # a pong exposed: three fixed tiles fewer, one meld fewer to find
+    exposed = [{"type": "pong", "tile": 27}]
+    assert shanten.shanten(Hand.from_names(["B1", "B2", "B3", "C4", "C5", "C6", "D7", "D8", "D9", "B5", "B5"]), exposed) == -1
+    assert shanten.breakdown(Hand.from_names(["B1"] * 2 + ["B2"] * 2), [])["sevenPairs"] == 4
@@ -0,0 +1,88 @@
+"""diff/apply round trips, and the shared patches StateStream builds from them."""
+import copy
+import random
+
+import pytest
+
+from app.statediff import SharedView, StateStream, apply, diff
+from app.wire import JSON, decode_frame
+
+
+def random_doc(rng: random.Random, depth: int = 0):
+    kind = rng.choice(["dict", "list", "bytes", "scalar"] if depth < 3 else ["bytes", "scalar"])
+    if kind == "dict":
+        return {k: random_doc(rng, depth + 1) for k in rng.sample("abcdef", rng.randint(0, 4))}
+    if kind == "list":
+        return [random_doc(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    if kind == "bytes":
+        return bytes(rng.randrange(34) for _ in range(rng.randint(0, 6)))
+    return rng.choice([None, True, False, 0, 7, -3, 1.5, "", "x"])
+
+
+def mutate(rng: random.Random, doc):
+    """A nearby document: most of ``doc`` kept, some keys, items and tiles changed."""
+    if isinstance(doc, dict):
+        out = {k: mutate(rng, v) for k, v in doc.items() if rng.random() > 0.15}
+        if rng.random() < 0.3:
+            out[rng.choice("abcdefg")] = random_doc(rng, 2)
+        return out
+    if isinstance(doc, list):
+        out = [mutate(rng, v) for v in doc[:rng.randint(0, len(doc))]]
+        return out + [random_doc(rng, 2) for _ in range(rng.randint(0, 2))]
+    if isinstance(doc, bytes):
+        if rng.random() < 0.5:
+            return doc + bytes([rng.randrange(34)])  # discard piles only grow
+        return doc[:rng.randint(0, len(doc))]
+    return doc if rng.random() < 0.7 else random_doc(rng, 3)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_apply_diff_round_trip(seed):
+    rng = random.Random(seed)
+    for _ in range(50):
+        old = {"root": random_doc(rng)}
+        new = mutate(rng, old)
+        ops = diff(old, new)
+        assert apply(copy.deepcopy(old), ops) == new
+        assert diff(new, new) == []
+
+
+def test_growing_tile_list_is_an_extend():
+    assert diff({"d": b"\x01"}, {"d": b"\x01\x02\x03"}) == [["x", ["d"], b"\x02\x03"]]
+    assert diff({"d": b"\x01\x02"}, {"d": b"\x02"}) == [["s", ["d"], b"\x02"]]
+
+
+def test_root_replacement():
+    assert apply({"a": 1}, diff({"a": 1}, [1, 2])) == [1, 2]
+
+
+def test_shared_view_patch_is_built_once():
+    first = SharedView(1, {"wall": 80, "discards": b""})
+    second = SharedView(2, {"wall": 79, "discards": b"\x05"}, first)
+    patch = second.patch_from(first, JSON)
+    assert second.patch_from(first, JSON) is patch
+    assert second.patch_from(second, JSON) is None
+    # a stream further behind gets its own diff
+    third = SharedView(3, {"wall": 78, "discards": b"\x05"}, second)
+    assert JSON.decode(third.patch_from(first, JSON)) == [["s", ["wall"], 78], ["x", ["discards"], ["B6"]]]
+    assert second.prev is None
+
+
+def test_state_stream_snapshot_then_patches():
+    stream = StateStream()
+    view = SharedView(1, {"wall": 80})
+    state = decode_frame(stream.encode(view, {"hand": b"\x01"}, JSON))
+    assert state["type"] == "state" and state["payload"]["stateVersion"] == 1
+    assert stream.encode(view, {"hand": b"\x01"}, JSON) is None
+
+    public = {"wall": 80}
+    private = {"hand": ["B2"]}
+    view = SharedView(2, {"wall": 79}, view)
+    patch = decode_frame(stream.encode(view, {"hand": b"\x01\x02"}, JSON))
+    assert patch["type"] == "state_patch"
+    assert (patch["payload"]["baseVersion"], patch["payload"]["version"]) == (1, 2)
+    assert apply(public, patch["payload"]["public"]) == {"wall": 79}
+    assert apply(private, patch["payload"]["private"]) == {"hand": ["B2", "B3"]}
+
+    stream.reset()
+    assert decode_frame(stream.encode(view, {"hand": b""}, JSON))["type"] == "state"
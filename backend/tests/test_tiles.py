@@ -0,0 +1,59 @@
+"""Hand keeps its counts and group keys in step with its tiles; Wall draws from both ends."""
+import random
+
+import pytest
+
+from app import wintable
+from app.tiles import NUM_CORE, NUM_TILES, TILE_NAMES, Hand, Wall, is_bonus, rank_of, suit_of, tile_id, tile_name, tile_names
+
+
+def test_names_and_ids():
+    assert len(TILE_NAMES) == NUM_TILES == 42
+    assert [tile_name(i) for i in (0, 8, 9, 26, 27, 31, 34)] == ["B1", "B9", "C1", "D9", "WE", "DR", "F1"]
+    assert all(tile_id(tile_name(i)) == i for i in range(NUM_TILES))
+    assert tile_id("XX") is None
+    assert (suit_of(13), rank_of(13)) == (1, 5)
+    assert is_bonus(tile_id("DW")) and not is_bonus(tile_id("WN"))
+
+
+def test_incremental_keys_match_a_fresh_encode():
+    rng = random.Random(1)
+    hand = Hand()
+    for _ in range(500):
+        if len(hand) < 14 and (not len(hand) or rng.random() < 0.6):
+            tile = rng.randrange(NUM_TILES)
+            if hand.count(tile) < 4:
+                hand.append(tile)
+        elif rng.random() < 0.5:
+            hand.remove(rng.choice(hand.tiles))
+        else:
+            hand.pop()
+        core = [t for t in hand if t < NUM_CORE]
+        assert hand.keys == wintable.encode(tile_names(core))
+        assert hand.extra == len(hand) - len(core)
+        assert list(hand.counts) == [hand.tiles.count(t) for t in range(NUM_TILES)]
+
+
+def test_hand_basics():
+    hand = Hand.from_names(["B3", "WE", "B1", "F2"])
+    assert hand.names() == ["B3", "WE", "B1", "F2"]
+    assert tile_id("WE") in hand and tile_id("B2") not in hand
+    hand.sort()
+    assert hand.names() == ["B1", "B3", "WE", "F2"]
+    assert hand.pop() == tile_id("F2") and hand.extra == 0
+    with pytest.raises(ValueError, match="B2 not in hand"):
+        hand.remove(tile_id("B2"))
+    assert Hand(hand) == hand and Hand(hand) is not hand
+
+
+def test_wall_draws_from_both_ends():
+    wall = Wall([1, 2, 3, 4])
+    assert wall.pop() == 4
+    assert wall.popleft() == 1
+    assert len(wall) == 2 and list(wall) == [2, 3]
+    assert wall.popleft() == 2 and wall.pop() == 3
+    assert len(wall) == 0
+    with pytest.raises(IndexError):
+        wall.pop()
+    with pytest.raises(IndexError):
+        wall.popleft()
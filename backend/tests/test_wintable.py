@@ -0,0 +1,108 @@
+"""The lookup tables against a plain recursive meld search over tile counts."""
+import random
+from collections import Counter
+
+import pytest
+
+from app import wintable
+from app.tiles import TILE_NAMES, WIND_START, Hand
+from app.ws import can_win_hand, hand_can_win, hand_waits, winning_tiles_for
+
+# suited tiles and winds; dragons and seasons are bonus tiles in this ruleset
+PLAYABLE = TILE_NAMES[:WIND_START + 4]
+HONORS = set(TILE_NAMES[WIND_START:WIND_START + 7])
+
+
+def melds_only(counts: Counter) -> bool:
+    """The old recursive search: take the lowest tile as a pong or as the start of a chow."""
+    tile = min((t for t, c in counts.items() if c), default=None, key=TILE_NAMES.index)
+    if tile is None:
+        return True
+    if counts[tile] >= 3:
+        counts[tile] -= 3
+        ok = melds_only(counts)
+        counts[tile] += 3
+        if ok:
+            return True
+    if tile in HONORS or int(tile[1]) > 7:
+        return False
+    run = [tile, f"{tile[0]}{int(tile[1]) + 1}", f"{tile[0]}{int(tile[1]) + 2}"]
+    if all(counts[t] for t in run):
+        for t in run:
+            counts[t] -= 1
+        ok = melds_only(counts)
+        for t in run:
+            counts[t] += 1
+        return ok
+    return False
+
+
+def standard_win(tiles) -> bool:
+    counts = Counter(tiles)
+    for pair in list(counts):
+        if counts[pair] >= 2:
+            counts[pair] -= 2
+            ok = melds_only(counts)
+            counts[pair] += 2
+            if ok:
+                return True
+    return False
+
+
+def deal(rng: random.Random, n: int):
+    """``n`` tiles from a wall of at most two suits plus winds, so complete hands are common."""
+    suits = rng.sample("BCD", 2)
+    pool = [t for t in PLAYABLE if t[0] in suits or t.startswith("W")] * 4
+    return rng.sample(pool, n)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_complete_matches_recursive_search(seed):
+    rng = random.Random(seed)
+    wins = 0
+    for _ in range(2000):
+        tiles = deal(rng, rng.choice([2, 5, 8, 11, 14]))
+        expected = standard_win(tiles)
+        wins += expected
+        assert wintable.is_complete(wintable.encode(tiles)) == expected, tiles
+    assert wins  # the deal is loose enough that some hands are complete
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_waits_match_recursive_search(seed):
+    rng = random.Random(seed)
+    for _ in range(300):
+        tiles = deal(rng, 13)
+        held = Counter(tiles)
+        expected = [t for t in PLAYABLE if held[t] < 4 and standard_win(tiles + [t])]
+        assert wintable.waits(tiles) == expected, tiles
+
+
+def test_seven_pairs():
+    pairs = ["B1", "B1", "B5", "B5", "C2", "C2", "C9", "C9", "D4", "D4", "WE", "WE", "WN", "WN"]
+    assert wintable.is_all_pairs(wintable.encode(pairs))
+    assert can_win_hand(pairs)
+    assert hand_can_win(Hand.from_names(pairs), [])
+    # a four counts as two pairs
+    four = ["B1"] * 4 + pairs[4:]
+    assert can_win_hand(four)
+    assert not wintable.is_all_pairs(wintable.encode(pairs[:-1] + ["WS"]))
+    # not once a meld is exposed
+    assert not can_win_hand(pairs[:11], [{"type": "pong", "tile": "D7"}])
+    assert winning_tiles_for(pairs[:-1]) == ["WN"]
+
+
+def test_table_and_hand_helpers_agree():
+    rng = random.Random(7)
+    for _ in range(300):
+        tiles = deal(rng, 14)
+        hand = Hand.from_names(tiles)
+        assert hand_can_win(hand, []) == can_win_hand(tiles)
+        hand.pop()
+        assert [TILE_NAMES[t] for t in hand_waits(hand, [])] == winning_tiles_for(hand.names())
+
+
+def test_encode_rejects_seasons_and_fifth_copies():
+    assert wintable.encode(["F1"]) is None
+    assert wintable.encode(["B1"] * 5) is None
+    assert wintable.encode(["B1"] * 4) == [4, 0, 0, 0]
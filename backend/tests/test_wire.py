@@ -0,0 +1,118 @@
+"""Round trips through both wire codecs, at every MessagePack width boundary."""
+import math
+
+import pytest
+
+from app.statediff import SharedView, StateStream
+from app.tiles import NUM_TILES, tile_names
+from app.wire import JSON, MSGPACK, MsgpackError, decode_frame, negotiate, packb, unpackb
+
+INTS = [
+    0, 1, 0x7f, 0x80, 0xff, 0x100, 0xffff, 0x10000, 0xffffffff, 0x100000000, 2 ** 64 - 1,
+    -1, -32, -33, -0x80, -0x81, -0x8000, -0x8001, -0x80000000, -0x80000001, -2 ** 63,
+]
+# first byte of the encoding, i.e. the width it was packed with
+INT_TAGS = {
+    0x7f: 0x7f, 0x80: 0xcc, 0xff: 0xcc, 0x100: 0xcd, 0xffff: 0xcd, 0x10000: 0xce, 0xffffffff: 0xce,
+    0x100000000: 0xcf, -1: 0xff, -32: 0xe0, -33: 0xd0, -0x80: 0xd0, -0x81: 0xd1, -0x8000: 0xd1,
+    -0x8001: 0xd2, -0x80000000: 0xd2, -0x80000001: 0xd3,
+}
+
+
+@pytest.mark.parametrize("n", INTS)
+def test_int_round_trip(n):
+    data = packb(n)
+    assert unpackb(data) == n
+    if n in INT_TAGS:
+        assert data[0] == INT_TAGS[n]
+
+
+@pytest.mark.parametrize("x", [0.0, -0.0, 1.5, -2.25, 1e-310, 1.7976931348623157e308, math.inf, -math.inf])
+def test_float_round_trip(x):
+    assert unpackb(packb(x)) == x
+
+
+def test_nan_round_trip():
+    assert math.isnan(unpackb(packb(math.nan)))
+
+
+@pytest.mark.parametrize("n,tag", [(0, 0xa0), (31, 0xbf), (32, 0xd9), (255, 0xd9), (256, 0xda), (65535, 0xda), (65536, 0xdb)])
+def test_str_round_trip(n, tag):
+    s = "x" * n
+    data = packb(s)
+    assert data[0] == tag
+    assert unpackb(data) == s
+
+
+def test_str_length_counts_utf8_bytes():
+    s = "胡" * 11  # 33 bytes
+    assert packb(s)[0] == 0xd9
+    assert unpackb(packb(s)) == s
+
+
+@pytest.mark.parametrize("n", [0, 1, 31, 255, 256, 65535])
+def test_tile_list_round_trip(n):
+    tiles = bytes(i % NUM_TILES for i in range(n))
+    data = packb(tiles)
+    assert data[0] == (0xc7 if n < 0x100 else 0xc8)
+    assert unpackb(data) == tile_names(tiles)
+    assert JSON.decode(JSON.encode(tiles)) == tile_names(tiles)
+
+
+@pytest.mark.parametrize("n", [31, 255, 65535])
+def test_bin_decodes_to_bytes(n):
+    body = bytes(range(256)) * (n // 256) + bytes(range(n % 256))
+    if n < 0x100:
+        data = b'\xc4' + n.to_bytes(1, 'big') + body
+    else:
+        data = b'\xc5' + n.to_bytes(2, 'big') + body
+    assert unpackb(data) == body
+
+
+@pytest.mark.parametrize("n", [15, 16, 65535, 65536])
+def test_array_and_map_widths(n):
+    items = list(range(n))
+    assert unpackb(packb(items)) == items
+    mapping = {str(i): i for i in range(n)}
+    assert unpackb(packb(mapping)) == mapping
+
+
+def test_nested_maps():
+    doc = {
+        "players": [{"name": "甲", "score": -12, "hand": bytes([0, 1, 2, 33]), "ting": False}],
+        "deep": {"a": {"b": {"c": [None, True, 0.5, {"d": []}]}}},
+        "empty": {},
+    }
+    expected = {**doc, "players": [{**doc["players"][0], "hand": ["B1", "B2", "B3", "DW"]}]}
+    assert unpackb(packb(doc)) == expected
+    assert JSON.decode(JSON.encode(doc)) == expected
+
+
+def test_bad_input_is_rejected():
+    with pytest.raises(MsgpackError):
+        unpackb(packb("abc")[:-1])
+    with pytest.raises(MsgpackError):
+        unpackb(packb(1) + b'\x00')
+    with pytest.raises(MsgpackError):
+        unpackb(b'\xc7\x01\x01' + bytes([NUM_TILES]))  # tile id out of range
+    with pytest.raises(TypeError):
+        packb(object())
+
+
+def test_codecs_build_the_same_message():
+    public = SharedView(1, {"wall": 80, "discards": bytes([3, 4])})
+    for codec in (JSON, MSGPACK):
+        frame = StateStream().encode(public, {"hand": bytes([5])}, codec)
+        assert isinstance(frame, bytes) == codec.binary
+        message = decode_frame(frame)
+        assert message["type"] == "state"
+        assert message["payload"]["public"] == {"wall": 80, "discards": ["B4", "B5"]}
+        assert message["payload"]["private"] == {"hand": ["B6"]}
+
+
+def test_negotiate_prefers_server_order():
+    assert negotiate(["msgpack", "json"]).name == "json"
+    assert negotiate(["msgpack"]).name == "msgpack"
+    assert negotiate("msgpack").name == "msgpack"
+    assert negotiate(["xml", 3]).name == "json"
+    assert negotiate(None).name == "json"
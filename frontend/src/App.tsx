@@ -12,7 +12,10 @@ export default function App() {
   const [roomId, setRoomId] = useState('lobby')
   const [name, setName] = useState('guest')
   const [joined, setJoined] = useState(false)
+  const [queued, setQueued] = useState<number | null>(null)
   const [game, setGame] = useState<any | null>(null)
+  // 牌效提示（shanten / ukeire），只在请求后显示，状态变化后作废
+  const [hint, setHint] = useState<any | null>(null)
   const [nowTs, setNowTs] = useState(Date.now())
   const [windowSize, setWindowSize] = useState({ width: window.innerWidth, height: window.innerHeight })
 
@@ -27,8 +30,17 @@ export default function App() {
 
   useEffect(() => {
     client.onStateChange = setState
-    client.onJoined = () => setJoined(true)
-    client.onState = (p) => setGame(p)
+    client.onJoined = (p) => {
+      // quick matches land in a room the server picked
+      if (p?.roomId) setRoomId(p.roomId)
+      setJoined(true)
+    }
+    client.onQueued = (p) => setQueued(p ? p.waiting : null)
+    client.onState = (p) => {
+      setGame(p)
+      setHint(null)
+    }
+    client.onHint = setHint
     const interval = window.setInterval(() => setNowTs(Date.now()), 500)
     client.connect()
     return () => {
@@ -57,6 +69,9 @@ export default function App() {
           name={name}
           setName={setName}
           joinRoom={joinRoom}
+          quickMatch={() => client.quickMatch(name.trim() || 'guest')}
+          cancelQuickMatch={() => client.cancelQuickMatch()}
+          queued={queued}
           connected={state === 'connected'}
         />
       </div>
@@ -137,6 +152,7 @@ export default function App() {
             tingDiscardables={tingDiscardables}
             state={state}
             nowTs={nowTs}
+            hint={hint}
           />
         </div>
       </div>
@@ -1,7 +1,7 @@
 import React from 'react'
 import {formatTileZh} from '../i18n'
 
-export default function ActionPanel({ game, client, joined, isYourTurn, you, tingPending, tingDiscardables, state, nowTs }: any) {
+export default function ActionPanel({ game, client, joined, isYourTurn, you, tingPending, tingDiscardables, state, nowTs, hint }: any) {
   const actionTypeMap: Record<string, string> = {
         'pass': '过',
         'chi': '吃',
@@ -27,7 +27,13 @@ export default function ActionPanel({ game, client, joined, isYourTurn, you, tin
 
       <div className="space-y-2">
         {(!game || game.gameCount === 0) && (
-          <button onClick={() => client.start(joined.roomId)} className="w-full px-5 py-3 rounded bg-emerald-600 hover:bg-emerald-500 disabled:opacity-50" disabled={state !== 'connected'}>开始游戏</button>
+          <>
+            <button onClick={() => client.start(joined.roomId)} className="w-full px-5 py-3 rounded bg-emerald-600 hover:bg-emerald-500 disabled:opacity-50" disabled={state !== 'connected'}>开始游戏</button>
+            <button onClick={() => client.start(joined.roomId, true)} className="w-full px-5 py-3 rounded bg-emerald-800 hover:bg-emerald-700 disabled:opacity-50" disabled={state !== 'connected'}>机器人补位开始</button>
+          </>
+        )}
+        {isYourTurn && game?.turnDeadlineTs > 0 && (
+          <div className="text-xs text-slate-400">出牌倒计时 {Math.max(0, Math.ceil((game.turnDeadlineTs * 1000 - nowTs) / 1000))}s（含时间池 {you?.timeBank ?? 0}s）</div>
         )}
         {isYourTurn && !you?.ting && game?.canTing && !tingPending && (
           <button onClick={() => client.ting(joined.roomId)} className="w-full px-5 py-3 rounded bg-pink-700 hover:bg-pink-600 disabled:opacity-50" disabled={state !== 'connected'}>听牌</button>
@@ -35,6 +41,18 @@ export default function ActionPanel({ game, client, joined, isYourTurn, you, tin
         {isYourTurn && tingPending && (
           <button onClick={() => client.tingCancel(joined.roomId)} className="w-full px-5 py-3 rounded bg-slate-700 hover:bg-slate-600 disabled:opacity-50" disabled={state !== 'connected'}>取消听牌</button>
         )}
+        {game?.gameCount > 0 && !game?.waitingForDice && (
+          <button onClick={() => client.hint(joined.roomId)} className="w-full px-3 py-1 rounded bg-slate-700 hover:bg-slate-600 text-sm disabled:opacity-50" disabled={state !== 'connected'}>提示</button>
+        )}
+        {hint && (
+          <div className="text-xs text-slate-300 space-y-1">
+            <div>向听数 {hint.shanten}</div>
+            {hint.discards?.slice(0, 3).map((d: any) => (
+              <div key={d.tile}>打 {formatTileZh(d.tile)}：向听 {d.shanten}，进张 {d.total}</div>
+            ))}
+            {hint.ukeire && <div>进张 {Object.keys(hint.ukeire).map(formatTileZh).join(' ')}（{hint.total}）</div>}
+          </div>
+        )}
       </div>
       
       {/* reaction actions (胡/自摸/吃碰 etc.) rendered where appropriate */}
@@ -1,6 +1,6 @@
 import React from 'react'
 
-export default function JoinRoomForm({ roomId, setRoomId, name, setName, joinRoom, connected }: { roomId: string; setRoomId: (s: string) => void; name: string; setName: (s: string) => void; joinRoom: () => void; connected: boolean }) {
+export default function JoinRoomForm({ roomId, setRoomId, name, setName, joinRoom, quickMatch, cancelQuickMatch, queued, connected }: { roomId: string; setRoomId: (s: string) => void; name: string; setName: (s: string) => void; joinRoom: () => void; quickMatch: () => void; cancelQuickMatch: () => void; queued: number | null; connected: boolean }) {
   return (
     <div className="flex flex-col gap-3 max-w-md">
       <label className="flex items-center gap-3">
@@ -19,6 +19,19 @@ export default function JoinRoomForm({ roomId, setRoomId, name, setName, joinRoo
         >
           Join room
         </button>
+        {queued === null ? (
+          <button
+            onClick={quickMatch}
+            className="ml-2 px-3 py-1 rounded bg-emerald-700 hover:bg-emerald-600 disabled:opacity-50"
+            disabled={!connected}
+          >
+            快速匹配
+          </button>
+        ) : (
+          <button onClick={cancelQuickMatch} className="ml-2 px-3 py-1 rounded bg-slate-700 hover:bg-slate-600">
+            匹配中（{queued} 人等待）… 取消
+          </button>
+        )}
       </div>
     </div>
   )
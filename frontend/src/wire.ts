@@ -0,0 +1,208 @@
+// Binary wire format, mirror of backend/app/wire.py: the MessagePack subset the
+// protocol uses (nil, bool, int, float, str, array, map) plus ext type 1, a
+// tile list with one byte per tile id, decoded straight into tile names.
+
+export const TILE_NAMES: string[] = [
+  ...['B', 'C', 'D'].flatMap((s) => [1, 2, 3, 4, 5, 6, 7, 8, 9].map((n) => `${s}${n}`)),
+  'WE', 'WS', 'WW', 'WN',
+  'DR', 'DG', 'DW',
+  'F1', 'F2', 'F3', 'F4', 'F5', 'F6', 'F7', 'F8',
+]
+
+const TILES_EXT = 1
+const textEncoder = new TextEncoder()
+const textDecoder = new TextDecoder()
+
+class Writer {
+  private buf = new Uint8Array(256)
+  private view = new DataView(this.buf.buffer)
+  pos = 0
+
+  private ensure(n: number) {
+    if (this.pos + n <= this.buf.length) return
+    let size = this.buf.length * 2
+    while (size < this.pos + n) size *= 2
+    const next = new Uint8Array(size)
+    next.set(this.buf)
+    this.buf = next
+    this.view = new DataView(next.buffer)
+  }
+
+  byte(b: number) {
+    this.ensure(1)
+    this.buf[this.pos++] = b
+  }
+
+  u16(n: number) {
+    this.ensure(2)
+    this.view.setUint16(this.pos, n)
+    this.pos += 2
+  }
+
+  u32(n: number) {
+    this.ensure(4)
+    this.view.setUint32(this.pos, n)
+    this.pos += 4
+  }
+
+  f64(n: number) {
+    this.ensure(8)
+    this.view.setFloat64(this.pos, n)
+    this.pos += 8
+  }
+
+  bytes(data: Uint8Array) {
+    this.ensure(data.length)
+    this.buf.set(data, this.pos)
+    this.pos += data.length
+  }
+
+  result(): Uint8Array {
+    return this.buf.slice(0, this.pos)
+  }
+}
+
+function writeLength(w: Writer, n: number, fix: number, fixMax: number, c16: number, c32: number) {
+  if (n <= fixMax) w.byte(fix | n)
+  else if (n < 0x10000) { w.byte(c16); w.u16(n) }
+  else { w.byte(c32); w.u32(n) }
+}
+
+function pack(w: Writer, value: any) {
+  if (value === null || value === undefined) w.byte(0xc0)
+  else if (value === true) w.byte(0xc3)
+  else if (value === false) w.byte(0xc2)
+  else if (typeof value === 'number') {
+    if (Number.isInteger(value) && value >= 0 && value < 0x80) w.byte(value)
+    else if (Number.isInteger(value) && value < 0 && value >= -32) w.byte(value & 0xff)
+    else if (Number.isInteger(value) && value >= 0 && value < 0x100000000) { w.byte(0xce); w.u32(value) }
+    else if (Number.isInteger(value) && value < 0 && value >= -0x80000000) { w.byte(0xd2); w.u32(value >>> 0) }
+    else { w.byte(0xcb); w.f64(value) }
+  } else if (typeof value === 'string') {
+    const data = textEncoder.encode(value)
+    if (data.length < 32) w.byte(0xa0 | data.length)
+    else if (data.length < 0x100) { w.byte(0xd9); w.byte(data.length) }
+    else writeLength(w, data.length, 0, -1, 0xda, 0xdb)
+    w.bytes(data)
+  } else if (Array.isArray(value)) {
+    writeLength(w, value.length, 0x90, 15, 0xdc, 0xdd)
+    for (const item of value) pack(w, item)
+  } else if (typeof value === 'object') {
+    const keys = Object.keys(value).filter((k) => value[k] !== undefined)
+    writeLength(w, keys.length, 0x80, 15, 0xde, 0xdf)
+    for (const k of keys) {
+      pack(w, k)
+      pack(w, value[k])
+    }
+  } else {
+    throw new Error(`cannot pack ${typeof value}`)
+  }
+}
+
+export function encode(value: any): Uint8Array {
+  const w = new Writer()
+  pack(w, value)
+  return w.result()
+}
+
+class Reader {
+  private view: DataView
+  pos = 0
+
+  constructor(private data: Uint8Array) {
+    this.view = new DataView(data.buffer, data.byteOffset, data.byteLength)
+  }
+
+  private take(n: number): Uint8Array {
+    if (this.pos + n > this.data.length) throw new Error('truncated message')
+    const out = this.data.subarray(this.pos, this.pos + n)
+    this.pos += n
+    return out
+  }
+
+  private uint(n: number): number {
+    if (this.pos + n > this.data.length) throw new Error('truncated message')
+    let v: number
+    if (n === 1) v = this.view.getUint8(this.pos)
+    else if (n === 2) v = this.view.getUint16(this.pos)
+    else if (n === 4) v = this.view.getUint32(this.pos)
+    else v = Number(this.view.getBigUint64(this.pos))
+    this.pos += n
+    return v
+  }
+
+  private int(n: number): number {
+    if (this.pos + n > this.data.length) throw new Error('truncated message')
+    let v: number
+    if (n === 1) v = this.view.getInt8(this.pos)
+    else if (n === 2) v = this.view.getInt16(this.pos)
+    else if (n === 4) v = this.view.getInt32(this.pos)
+    else v = Number(this.view.getBigInt64(this.pos))
+    this.pos += n
+    return v
+  }
+
+  private str(n: number): string {
+    return textDecoder.decode(this.take(n))
+  }
+
+  private array(n: number): any[] {
+    const out = new Array(n)
+    for (let i = 0; i < n; i++) out[i] = this.read()
+    return out
+  }
+
+  private map(n: number): Record<string, any> {
+    const out: Record<string, any> = {}
+    for (let i = 0; i < n; i++) {
+      const k = this.read()
+      out[k] = this.read()
+    }
+    return out
+  }
+
+  private ext(code: number, body: Uint8Array): any {
+    if (code !== TILES_EXT) throw new Error(`unknown ext type ${code}`)
+    return Array.from(body, (t) => TILE_NAMES[t])
+  }
+
+  read(): any {
+    const b = this.uint(1)
+    if (b < 0x80) return b
+    if (b >= 0xe0) return b - 0x100
+    if (b <= 0x8f) return this.map(b & 0x0f)
+    if (b <= 0x9f) return this.array(b & 0x0f)
+    if (b <= 0xbf) return this.str(b & 0x1f)
+    switch (b) {
+      case 0xc0: return null
+      case 0xc2: return false
+      case 0xc3: return true
+      case 0xc4: case 0xc5: case 0xc6: return this.take(this.uint(1 << (b - 0xc4))).slice()
+      case 0xc7: case 0xc8: case 0xc9: {
+        const n = this.uint(1 << (b - 0xc7))
+        return this.ext(this.uint(1), this.take(n))
+      }
+      case 0xca: { const v = this.view.getFloat32(this.pos); this.take(4); return v }
+      case 0xcb: { const v = this.view.getFloat64(this.pos); this.take(8); return v }
+      case 0xcc: case 0xcd: case 0xce: case 0xcf: return this.uint(1 << (b - 0xcc))
+      case 0xd0: case 0xd1: case 0xd2: case 0xd3: return this.int(1 << (b - 0xd0))
+      case 0xd4: case 0xd5: case 0xd6: case 0xd7: case 0xd8: {
+        const code = this.uint(1)
+        return this.ext(code, this.take(1 << (b - 0xd4)))
+      }
+      case 0xd9: case 0xda: case 0xdb: return this.str(this.uint(1 << (b - 0xd9)))
+      case 0xdc: return this.array(this.uint(2))
+      case 0xdd: return this.array(this.uint(4))
+      case 0xde: return this.map(this.uint(2))
+      case 0xdf: return this.map(this.uint(4))
+    }
+    throw new Error(`unsupported type byte 0x${b.toString(16)}`)
+  }
+}
+
+export function decode(data: Uint8Array): any {
+  const reader = new Reader(data)
+  const value = reader.read()
+  if (reader.pos !== data.length) throw new Error('trailing data')
+  return value
+}
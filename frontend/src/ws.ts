@@ -1,11 +1,102 @@
+import { decode, encode } from './wire'
+
+export type WireFormat = 'msgpack' | 'json'
+
 export type WSClientOptions = {
   url: string
   heartbeatIntervalMs?: number
   reconnectDelayMs?: number
+  // wire formats we accept, preferred first; the server picks one in the hello handshake
+  formats?: WireFormat[]
 }
 
 export type WSState = 'disconnected' | 'connecting' | 'connected'
 
+const PLAYER_ID_KEY = 'mahjong.playerId'
+
+// Stable id the server seats us by; kept across reloads so a reconnect (or a
+// server restart) gives us our seat back instead of a new one. Per tab
+// (sessionStorage): a new tab is a new player, not a takeover of this tab's
+// seat. A duplicated tab copies it, so the server also refuses a join over a
+// seat whose connection is still open unless it carries that connection's
+// session token.
+function loadPlayerId(): string | null {
+  try {
+    return window.sessionStorage.getItem(PLAYER_ID_KEY)
+  } catch {
+    return null
+  }
+}
+
+function savePlayerId(id: string) {
+  try {
+    window.sessionStorage.setItem(PLAYER_ID_KEY, id)
+  } catch {
+    // storage unavailable (private mode); the id lives for this page only
+  }
+}
+
+// State patch ops, mirror of backend/app/statediff.py:
+//   ['s', path, value]  set (a list index equal to the length appends)
+//   ['d', path]         delete a key
+//   ['t', path, length] truncate a list
+//   ['x', path, items]  extend a list
+type Path = (string | number)[]
+export type PatchOp = ['s', Path, any] | ['d', Path] | ['t', Path, number] | ['x', Path, any[]]
+
+function copyOf(node: any): any {
+  return Array.isArray(node) ? node.slice() : { ...node }
+}
+
+// Applies ops without mutating `doc`; every container on a touched path is copied,
+// so untouched subtrees keep their identity (cheap re-renders).
+export function applyPatch(doc: any, ops: PatchOp[]): any {
+  let root = doc
+  const copied = new Set<any>()
+  for (const op of ops) {
+    const [kind, path] = op
+    if (kind === 's' && path.length === 0) {
+      root = op[2]
+      continue
+    }
+    const walk = kind === 't' || kind === 'x' ? path : path.slice(0, -1)
+    if (!copied.has(root)) {
+      root = copyOf(root)
+      copied.add(root)
+    }
+    let target = root
+    for (const key of walk) {
+      let child = target[key as any]
+      if (!copied.has(child)) {
+        child = copyOf(child)
+        copied.add(child)
+        target[key as any] = child
+      }
+      target = child
+    }
+    if (kind === 's') target[path[path.length - 1] as any] = op[2]
+    else if (kind === 'd') delete target[path[path.length - 1] as any]
+    else if (kind === 't') target.length = op[2]
+    else target.push(...op[2])
+  }
+  return root
+}
+
+// Merge the shared table view with this seat's overlay, rotating seats so that
+// you are index 0 (bottom), then right, top, left.
+export function composeState(pub: any, priv: any): any {
+  const { seat, ...overlay } = priv
+  const n = pub.players.length
+  const start = seat >= 0 ? seat : 0
+  const rotate = (list: any[]) => list.map((_, i) => list[(start + i) % n])
+  return {
+    ...pub,
+    ...overlay,
+    players: rotate(pub.players).map((p: any, i: number) => ({ ...p, index: i, you: seat >= 0 && i === 0 })),
+    discardsByPlayer: rotate(pub.discardsByPlayer).map((d: any, i: number) => ({ ...d, index: i })),
+  }
+}
+
 export class WSClient {
   private options: Required<WSClientOptions>
   private socket: WebSocket | null = null
@@ -14,18 +105,34 @@ export class WSClient {
   public state: WSState = 'disconnected'
   public lastPongAt: number | null = null
   public lastClose?: { code: number; reason: string }
+  private publicState: any = null
+  private privateState: any = null
+  private stateVersion: number | null = null
+  private resyncPending = false
+  public format: WireFormat = 'json'
+  public playerId: string | null = loadPlayerId()
+  // last room joined; resumed (or re-joined) after a reconnect
+  private lastJoin: { roomId: string; name: string } | null = null
+  // session token the server holds our seat under for a while after a disconnect
+  public session: string | null = null
+  private offeredSession: string | null = null
+  // name we queued for a quick match with; the server joins us to the matched room under it
+  private matchName: string | null = null
 
   onStateChange?: (state: WSState) => void
   onHello?: (payload: any) => void
-  onJoined?: (payload: { roomId: string; name: string }) => void
+  onJoined?: (payload: { roomId: string; name: string; playerId?: string }) => void
   onErrorMsg?: (payload: { message: string }) => void
   onState?: (payload: any) => void
+  onQueued?: (payload: { waiting: number } | null) => void
+  onHint?: (payload: any) => void
 
   constructor(options: WSClientOptions) {
     this.options = {
       url: options.url,
       heartbeatIntervalMs: options.heartbeatIntervalMs ?? 10_000,
       reconnectDelayMs: options.reconnectDelayMs ?? 2_000,
+      formats: options.formats ?? ['msgpack', 'json'],
     }
   }
 
@@ -35,30 +142,71 @@ export class WSClient {
     }
     this.setState('connecting')
     const ws = new WebSocket(this.options.url)
+    ws.binaryType = 'arraybuffer'
     this.socket = ws
 
     ws.onopen = () => {
+      // table state is kept: a resume continues it with a patch, a join replaces it with a snapshot
+      this.resyncPending = false
+      this.format = 'json'
       this.setState('connected')
       this.startHeartbeat()
     }
 
     ws.onmessage = (event) => {
       try {
-        const data = JSON.parse(String(event.data))
+        // text frames are JSON, binary frames MessagePack
+        const data = typeof event.data === 'string' ? JSON.parse(event.data) : decode(new Uint8Array(event.data))
         const type = data?.type
         const payload = data?.payload
-        if (type === 'hello') this.onHello?.(payload)
-        else if (type === 'joined') this.onJoined?.(payload)
-        else if (type === 'state') this.onState?.(payload)
+        if (type === 'hello') {
+          if (Array.isArray(payload?.formats)) this.send({ type: 'hello', payload: { formats: this.options.formats } })
+          this.offeredSession = payload?.session ?? null
+          if (this.lastJoin && this.session) {
+            // reconnect: ask for our seat back, with a patch from the version we have
+            this.send({
+              type: 'resume',
+              payload: { roomId: this.lastJoin.roomId, session: this.session, version: this.stateVersion ?? undefined },
+            })
+          } else if (this.lastJoin) this.join(this.lastJoin.roomId, this.lastJoin.name)
+          this.onHello?.(payload)
+        }
+        else if (type === 'format') this.format = payload?.format === 'msgpack' ? 'msgpack' : 'json'
+        else if (type === 'joined') {
+          if (payload?.playerId) {
+            this.playerId = payload.playerId
+            savePlayerId(payload.playerId)
+          }
+          this.onJoined?.(payload)
+        }
+        else if (type === 'resumed') this.onJoined?.(payload)
+        else if (type === 'queued') this.onQueued?.(payload)
+        else if (type === 'match_cancelled') this.onQueued?.(null)
+        else if (type === 'matched') {
+          // the join that follows is sent by the server; remember it for reconnects
+          this.lastJoin = { roomId: payload.roomId, name: this.matchName ?? 'guest' }
+          if (!this.session) this.session = this.offeredSession
+          this.onQueued?.(null)
+        }
+        else if (type === 'resume_failed') {
+          // hold expired (or the server restarted): join again, the player id still finds our seat
+          this.session = null
+          if (this.lastJoin) this.join(this.lastJoin.roomId, this.lastJoin.name)
+        }
+        else if (type === 'state') this.handleSnapshot(payload)
+        else if (type === 'state_patch') this.handlePatch(payload)
+        else if (type === 'hint') this.onHint?.(payload)
         else if (type === 'pong') this.lastPongAt = Date.now()
         else if (type === 'error') this.onErrorMsg?.(payload)
       } catch {
-        // ignore non-JSON
+        // ignore undecodable frames
       }
     }
 
     ws.onclose = (ev) => {
       this.lastClose = { code: ev.code, reason: ev.reason }
+      // the server drops a closed connection from the match queue
+      this.onQueued?.(null)
       this.cleanup()
       this.scheduleReconnect()
     }
@@ -68,7 +216,32 @@ export class WSClient {
     }
   }
 
+  private handleSnapshot(payload: { stateVersion: number; public: any; private: any }) {
+    this.stateVersion = payload.stateVersion
+    this.resyncPending = false
+    this.publicState = payload.public
+    this.privateState = payload.private
+    this.onState?.(composeState(this.publicState, this.privateState))
+  }
+
+  private handlePatch(payload: { baseVersion: number; version: number; public: PatchOp[]; private: PatchOp[] }) {
+    if (this.publicState === null || payload.baseVersion !== this.stateVersion) {
+      // missed a step; ask for a fresh snapshot and drop patches until it arrives
+      if (!this.resyncPending) {
+        this.resyncPending = true
+        this.send({ type: 'resync', payload: {} })
+      }
+      return
+    }
+    this.publicState = applyPatch(this.publicState, payload.public)
+    this.privateState = applyPatch(this.privateState, payload.private)
+    this.stateVersion = payload.version
+    this.onState?.(composeState(this.publicState, this.privateState))
+  }
+
   disconnect() {
+    this.lastJoin = null
+    this.session = null
     this.cleanup()
     this.socket?.close()
     this.socket = null
@@ -108,16 +281,30 @@ export class WSClient {
 
   send(obj: any) {
     if (this.socket && this.socket.readyState === WebSocket.OPEN) {
-      this.socket.send(JSON.stringify(obj))
+      this.socket.send(this.format === 'msgpack' ? encode(obj) : JSON.stringify(obj))
     }
   }
 
   join(roomId: string, name: string) {
-    this.send({ type: 'join', payload: { roomId, name } })
+    this.lastJoin = { roomId, name }
+    if (!this.session) this.session = this.offeredSession
+    this.send({
+      type: 'join',
+      payload: { roomId, name, playerId: this.playerId ?? undefined, session: this.session ?? undefined },
+    })
+  }
+
+  quickMatch(name: string, options: { rating?: number; stake?: string } = {}) {
+    this.matchName = name
+    this.send({ type: 'quick_match', payload: { name, playerId: this.playerId ?? undefined, ...options } })
   }
 
-  start(roomId: string) {
-    this.send({ type: 'start', payload: { roomId } })
+  cancelQuickMatch() {
+    this.send({ type: 'quick_match_cancel', payload: {} })
+  }
+
+  start(roomId: string, fillBots = false) {
+    this.send({ type: 'start', payload: { roomId, fillBots } })
   }
 
   draw(roomId: string) {
@@ -140,6 +327,10 @@ export class WSClient {
     this.send({ type: 'ting_cancel', payload: { roomId } })
   }
 
+  hint(roomId: string) {
+    this.send({ type: 'hint', payload: { roomId } })
+  }
+
   rollDice(roomId: string) {
     this.send({ type: 'roll_dice', payload: { roomId } })
   }